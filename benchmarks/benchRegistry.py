@@ -0,0 +1,189 @@
+#!/usr/bin/python
+"""
+Cold start and time to first drop of the node type registry.
+
+Generates a package of node modules (TestNode like classes with 3 inputs
+and 3 outputs) and runs every case in its own python process, after Qt is
+imported, so only the node modules count:
+
+    eager     every module imported and its classes registered up front
+    cold      NodeTypeRegistry.discoverModules() without a schema cache
+    cached    discoverModules() reading the schema cache of a previous run
+
+Each case reports the startup time, the time of the first drop (a
+NodeScene.createNode() of a type of the last module, which imports it
+unless eager) and the number of node modules imported by then.
+--import-cost adds a busy wait to every module body, standing for the
+libraries real node modules import.
+
+    python benchmarks/benchRegistry.py --types 100 1000
+    python benchmarks/benchRegistry.py --types 1000 --import-cost 5
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CASES = ('eager', 'cold', 'cached')
+PACKAGE = 'benchnodes'
+
+timer = getattr(time, 'perf_counter', time.time)
+
+MODULE_HEAD = '''import time
+
+from pySideNodeGraph import NodeItem
+
+_end = time.time() + {cost}
+while time.time() < _end:
+    pass
+'''
+
+NODE_CLASS = '''
+
+class Node{idx}(NodeItem):
+    category = 'group{module}'
+
+    def __init__(self, name='Node{idx}', parent=None):
+        super(Node{idx}, self).__init__(name, parent)
+        with self.deferLayout():
+            self.addInputPort('in_a{idx}', 1)
+            self.addInputPort('in_b', 2, 'float')
+            self.addInputPort('in_c')
+            self.addOutputPort('out_a{idx}')
+            self.addOutputPort('out_b', dataType='float')
+            self.addOutputPort('out_c')
+'''
+
+
+def writePackage(folder, typeCount, perModule, importCost):
+    """
+    Write the node modules, returns the last type name.
+    """
+    package = os.path.join(folder, PACKAGE)
+    os.makedirs(package)
+    open(os.path.join(package, '__init__.py'), 'w').close()
+    for module in range((typeCount + perModule - 1) // perModule):
+        parts = [MODULE_HEAD.format(cost=importCost / 1000.0)]
+        for idx in range(module * perModule,
+                         min(typeCount, (module + 1) * perModule)):
+            parts.append(NODE_CLASS.format(idx=idx, module=module))
+        path = os.path.join(package, 'nodes{}.py'.format(module))
+        with open(path, 'w') as f:
+            f.write(''.join(parts))
+    return 'Node{}'.format(typeCount - 1)
+
+
+def importedModules():
+    return len([name for name in sys.modules
+                if name.startswith(PACKAGE + '.')])
+
+
+def runCase(case, folder, cachePath, typeName):
+    """
+    Run one case in this process.
+
+    Returns:
+        dict: the measures of the case.
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide import QtCore, QtGui
+    app = QtGui.QApplication.instance() or QtGui.QApplication([])
+    from pySideNodeGraph import NodeItem, NodeScene
+    from graphRegistry import NodeTypeRegistry
+    sys.path.insert(0, folder)
+
+    start = timer()
+    if case == 'eager':
+        import importlib
+        registry = NodeTypeRegistry()
+        names = sorted(os.listdir(os.path.join(folder, PACKAGE)))
+        for name in names:
+            if not name.startswith('nodes'):
+                continue
+            module = importlib.import_module(
+                '{}.{}'.format(PACKAGE, name[:-3]))
+            for value in vars(module).values():
+                if isinstance(value, type) and issubclass(value, NodeItem) \
+                        and value is not NodeItem:
+                    registry.registerClass(value)
+    else:
+        registry = NodeTypeRegistry(cachePath)
+        registry.discoverModules(os.path.join(folder, PACKAGE), PACKAGE)
+        registry.save()
+    startup = timer() - start
+    typeCount = len(registry)
+
+    scene = NodeScene()
+    scene.nodeRegistry = registry
+    start = timer()
+    scene.createNode(typeName, QtCore.QPointF(0, 0))
+    firstDrop = timer() - start
+    return {
+        'case': case,
+        'types': typeCount,
+        'startup': startup,
+        'firstDrop': firstDrop,
+        'imported': importedModules(),
+    }
+
+
+def run(typeCounts, perModule, importCost):
+    env = dict(os.environ)
+    env['QT_QPA_PLATFORM'] = 'offscreen'
+    results = []
+    for typeCount in typeCounts:
+        folder = tempfile.mkdtemp()
+        try:
+            typeName = writePackage(folder, typeCount, perModule, importCost)
+            cachePath = os.path.join(folder, 'nodeTypes.json')
+            for case in CASES:
+                output = subprocess.check_output(
+                    [sys.executable, os.path.abspath(__file__), '--case',
+                     case, folder, cachePath, typeName], env=env)
+                lines = output.decode('utf-8').strip().splitlines()
+                results.append(json.loads(lines[-1]))
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def printResults(results):
+    print('{:>8} {:>7} {:>12} {:>14} {:>10} {:>9}'.format(
+        'case', 'types', 'startup(ms)', 'firstDrop(ms)', 'total(ms)',
+        'imported'))
+    for r in results:
+        print('{:>8} {:>7} {:>12.2f} {:>14.2f} {:>10.2f} {:>9}'.format(
+            r['case'], r['types'], r['startup'] * 1000,
+            r['firstDrop'] * 1000, (r['startup'] + r['firstDrop']) * 1000,
+            r['imported']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--types', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--per-module', type=int, default=10,
+                        help='node classes per module')
+    parser.add_argument('--import-cost', type=float, default=0.0,
+                        help='busy wait of every module body in ms')
+    parser.add_argument('--case', nargs=4,
+                        metavar=('CASE', 'FOLDER', 'CACHE', 'TYPE'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(runCase(*args.case)))
+        return 0
+
+    printResults(run(args.types, args.per_module, args.import_cost))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,325 @@
+#!/usr/bin/python
+"""
+Benchmarks of the NodeScene operations under the offscreen Qt platform.
+
+Every operation runs at every size in its own python process so the peak
+RSS reported belongs to that case.  Each case reports the wall time of the
+timed calls, the peak RSS and the per call latency percentiles:
+
+    create    NodeItem with 3 inputs and 3 outputs added to the scene
+    connect   PipeConnection.setToPort between two nodes
+    drag      move of a node connected to "size" pipes, paths flushed
+    hittest   NodeViewer.sceneMouseReleaseEvent over a target port
+    delete    NodeScene.removeNodes of a connected chain, 5 rounds
+    render    NodeViewer rendered to a 1280x720 QImage
+
+Results can be saved as a JSON baseline and compared against later, a
+comparison run exits with status 1 when a case regressed by more than the
+tolerance.
+
+    python benchmarks/benchScene.py --sizes 100 1000 --save baseline.json
+    python benchmarks/benchScene.py --sizes 100 1000 --compare baseline.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+OPERATIONS = ('create', 'connect', 'drag', 'hittest', 'delete', 'render')
+# metrics compared against a baseline, rss uses its own tolerance.
+TIME_METRICS = ('wall', 'p50', 'p90')
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def peakRss():
+    """
+    Returns the peak resident set size of the process in MB or None.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss / (1024.0 * 1024.0)
+    return rss / 1024.0
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    idx = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[idx]
+
+
+# cases, run in the child process -------------------------------------------
+
+def _makeNode(name, x=0.0, y=0.0):
+    from pySideNodeGraph import NodeItem
+    node = NodeItem(name)
+    with node.deferLayout():
+        for idx in range(3):
+            node.addInputPort('in_{}'.format(idx))
+            node.addOutputPort('out_{}'.format(idx))
+    node.setPos(x, y)
+    return node
+
+
+def _grid(scene, count, columns=50):
+    nodes = [_makeNode('node_{}'.format(idx), (idx % columns) * 250.0,
+                       (idx // columns) * 200.0) for idx in range(count)]
+    scene.bulkLoad(nodes)
+    return nodes
+
+
+def _timeCalls(func, args):
+    latencies = []
+    for arg in args:
+        start = timer()
+        func(arg)
+        latencies.append(timer() - start)
+    return latencies
+
+
+def caseCreate(app, size):
+    from pySideNodeGraph import NodeScene
+    scene = NodeScene()
+
+    def create(idx):
+        scene.addItem(_makeNode('node_{}'.format(idx), (idx % 50) * 250.0,
+                                (idx // 50) * 200.0))
+
+    return _timeCalls(create, range(size))
+
+
+def caseConnect(app, size):
+    from pySideNodeGraph import NodeScene, PipeConnection
+    scene = NodeScene()
+    nodes = _grid(scene, size + 1)
+
+    def connect(idx):
+        toPort = nodes[idx + 1]._inputs[0]
+        connection = PipeConnection(nodes[idx]._outputs[0], None, scene)
+        connection.setToPort(toPort)
+        connection.setEndPos(toPort.scenePos())
+
+    latencies = _timeCalls(connect, range(size))
+    scene.flushPipeUpdates()
+    return latencies
+
+
+def caseDrag(app, size):
+    from pySideNodeGraph import NodeScene
+    scene = NodeScene()
+    hub = _makeNode('hub', -400.0, 0.0)
+    scene.addItem(hub)
+    nodes = _grid(scene, size)
+    for idx, node in enumerate(nodes):
+        scene.connectPorts(hub._outputs[idx % 3], node._inputs[0])
+    scene.flushPipeUpdates()
+
+    def move(step):
+        hub.setPos(-400.0 + (step % 20) * 5.0, step * 2.0)
+        scene.flushPipeUpdates()
+
+    return _timeCalls(move, range(100))
+
+
+def caseHitTest(app, size):
+    from PySide import QtCore, QtGui
+    from pySideNodeGraph import NodeScene, NodeViewer
+    scene = NodeScene()
+    viewer = NodeViewer(scene)
+    nodes = _grid(scene, size)
+    pairs = [(nodes[idx], nodes[idx + 1]) for idx in range(min(size - 1, 500))]
+
+    def release(pair):
+        fromNode, toNode = pair
+        viewer.startConnection(fromNode._outputs[1])
+        event = QtGui.QGraphicsSceneMouseEvent(
+            QtCore.QEvent.GraphicsSceneMouseRelease)
+        event.setScenePos(toNode._inputs[1].scenePos())
+        viewer.sceneMouseReleaseEvent(event)
+
+    latencies = _timeCalls(release, pairs)
+    scene.flushPipeUpdates()
+    return latencies
+
+
+def caseDelete(app, size):
+    from pySideNodeGraph import NodeScene
+    latencies = []
+    for _ in range(5):
+        scene = NodeScene()
+        nodes = _grid(scene, size)
+        for idx in range(size - 1):
+            scene.connectPorts(nodes[idx]._outputs[0], nodes[idx + 1]._inputs[0])
+        scene.flushPipeUpdates()
+        nodeIds = [node.nodeId for node in nodes]
+        latencies.extend(_timeCalls(scene.removeNodes, [nodeIds]))
+    return latencies
+
+
+def caseRender(app, size):
+    from PySide import QtCore, QtGui
+    from pySideNodeGraph import NodeScene, NodeViewer
+    scene = NodeScene()
+    nodes = _grid(scene, size)
+    for idx in range(size - 1):
+        scene.connectPorts(nodes[idx]._outputs[0], nodes[idx + 1]._inputs[0])
+    viewer = NodeViewer(scene)
+    viewer.resize(1280, 720)
+    viewer.show()
+    viewer.fitInView(scene.itemsBoundingRect(), QtCore.Qt.KeepAspectRatio)
+    app.processEvents()
+    image = QtGui.QImage(1280, 720, QtGui.QImage.Format_ARGB32_Premultiplied)
+
+    def render(_):
+        painter = QtGui.QPainter(image)
+        viewer.render(painter)
+        painter.end()
+
+    return _timeCalls(render, range(10))
+
+
+CASES = {
+    'create': caseCreate,
+    'connect': caseConnect,
+    'drag': caseDrag,
+    'hittest': caseHitTest,
+    'delete': caseDelete,
+    'render': caseRender,
+}
+
+
+def runCase(operation, size):
+    """
+    Run one case in this process, Qt is imported here.
+
+    Returns:
+        dict: the measures of the case.
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide import QtGui
+    app = QtGui.QApplication.instance() or QtGui.QApplication([])
+    latencies = CASES[operation](app, size)
+    return {
+        'operation': operation,
+        'size': size,
+        'calls': len(latencies),
+        'wall': sum(latencies),
+        'p50': percentile(latencies, 0.5),
+        'p90': percentile(latencies, 0.9),
+        'p99': percentile(latencies, 0.99),
+        'max': max(latencies) if latencies else 0.0,
+        'rss': peakRss(),
+    }
+
+
+# driver -------------------------------------------------------------------
+
+def run(operations, sizes):
+    """
+    Run every case in a child process.
+
+    Returns:
+        list[dict]: the measures of each case.
+    """
+    env = dict(os.environ)
+    env['QT_QPA_PLATFORM'] = 'offscreen'
+    results = []
+    for operation in operations:
+        for size in sizes:
+            output = subprocess.check_output(
+                [sys.executable, os.path.abspath(__file__),
+                 '--case', operation, str(size)], env=env)
+            lines = output.decode('utf-8').strip().splitlines()
+            results.append(json.loads(lines[-1]))
+    return results
+
+
+def compare(results, baseline, tolerance, rssTolerance):
+    """
+    Returns the (operation, size, metric, baseline, current) regressions.
+    """
+    base = dict(((r['operation'], r['size']), r) for r in baseline)
+    regressions = []
+    for result in results:
+        reference = base.get((result['operation'], result['size']))
+        if reference is None:
+            continue
+        limits = [(metric, tolerance) for metric in TIME_METRICS]
+        limits.append(('rss', rssTolerance))
+        for metric, limit in limits:
+            old, new = reference.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1.0 + limit):
+                regressions.append((result['operation'], result['size'],
+                                    metric, old, new))
+    return regressions
+
+
+def printResults(results):
+    print('{:>8} {:>7} {:>6} {:>9} {:>9} {:>9} {:>9} {:>9} {:>8}'.format(
+        'op', 'size', 'calls', 'wall(s)', 'p50(ms)', 'p90(ms)', 'p99(ms)',
+        'max(ms)', 'rss(MB)'))
+    for r in results:
+        rss = '{:8.1f}'.format(r['rss']) if r['rss'] is not None else '       -'
+        print('{:>8} {:>7} {:>6} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} '
+              '{:>9.3f} {}'.format(
+                  r['operation'], r['size'], r['calls'], r['wall'],
+                  r['p50'] * 1000, r['p90'] * 1000, r['p99'] * 1000,
+                  r['max'] * 1000, rss))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100, 1000, 5000])
+    parser.add_argument('--ops', nargs='+', choices=OPERATIONS,
+                        default=list(OPERATIONS))
+    parser.add_argument('--save', help='write the results to a JSON file')
+    parser.add_argument('--compare', help='JSON baseline to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown fraction of the time metrics')
+    parser.add_argument('--rss-tolerance', type=float, default=0.15,
+                        help='allowed growth fraction of the peak RSS')
+    parser.add_argument('--case', nargs=2, metavar=('OP', 'SIZE'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(runCase(args.case[0], int(args.case[1]))))
+        return 0
+
+    results = run(args.ops, args.sizes)
+    printResults(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'results': results}, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance,
+                              args.rss_tolerance)
+        for operation, size, metric, old, new in regressions:
+            print('REGRESSION {} {} {}: {:.4f} -> {:.4f}'.format(
+                operation, size, metric, old, new))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
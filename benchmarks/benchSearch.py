@@ -0,0 +1,94 @@
+#!/usr/bin/python
+"""
+Query latency of the graphSearch node search index.
+
+Builds GraphModels of each size, nodes named "<word>_<word>_<n>" from a
+small vocabulary with 2 inputs and 2 outputs labelled with other words,
+times SearchIndex construction and reports the latency percentiles of
+every query over several repetitions.  Qt is not required.
+
+    python benchmarks/benchSearch.py --sizes 10000 100000
+    python benchmarks/benchSearch.py --queries blur 'grade merge' blr
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graphModel import GraphModel
+from graphSearch import SearchIndex
+
+WORDS = ('blur', 'grade', 'merge', 'read', 'write', 'transform', 'crop',
+         'shuffle', 'copy', 'premult', 'keyer', 'roto', 'paint', 'denoise',
+         'sharpen', 'glow', 'defocus', 'tracker', 'stabilize', 'reformat',
+         'switch', 'dissolve', 'constant', 'ramp', 'noise', 'colorspace',
+         'lut', 'expression', 'retime', 'framehold')
+# single letters, short prefixes, words, word pairs, substrings and typos.
+QUERIES = ('b', 'gr', 'blur', 'blur_grade', 'grade merge', 'ade_mer',
+           'in_roto', 'blr', 'trnsform', 'denoise 4999', 'zzz')
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def buildModel(nodeCount, seed=0):
+    rng = random.Random(seed)
+    model = GraphModel()
+    for idx in range(nodeCount):
+        node = model.addNode('{}_{}_{}'.format(
+            rng.choice(WORDS), rng.choice(WORDS), idx), 'TestNode')
+        for portType in ('in', 'out'):
+            for _ in range(2):
+                model.addPort(node.id, '{}_{}'.format(
+                    portType, rng.choice(WORDS)), portType)
+    return model
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    idx = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[idx]
+
+
+def run(sizes, queries, repeat, limit):
+    rows = []
+    for size in sizes:
+        model = buildModel(size)
+        start = timer()
+        index = SearchIndex(model)
+        rows.append((size, '<build>', 0, timer() - start, timer() - start))
+        for query in queries:
+            times = []
+            for _ in range(repeat):
+                start = timer()
+                found = index.search(query, limit)
+                times.append(timer() - start)
+            rows.append((size, query, len(found), percentile(times, 0.5),
+                         max(times)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000])
+    parser.add_argument('--queries', nargs='+', default=list(QUERIES))
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+    print('{:>8} {:>14} {:>7} {:>9} {:>9}'.format(
+        'nodes', 'query', 'found', 'p50(ms)', 'max(ms)'))
+    for size, query, found, median, worst in run(
+            args.sizes, args.queries, args.repeat, args.limit):
+        if query == '<build>':
+            print('{:>8} {:>14} {:>7} {:>9} {:>9.3f}'.format(
+                size, 'build (s)', '', '', worst))
+            continue
+        print('{:>8} {:>14} {:>7} {:>9.3f} {:>9.3f}'.format(
+            size, query, found, median * 1000, worst * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+"""
+Round trip benchmark of the graph serialization formats.
+
+Builds GraphModels of each size (3 inputs and 3 outputs per node, every node
+connected to the next two) and times save, load and streamed load of the
+JSON lines and binary formats.  Qt is not required.
+
+    python benchmarks/benchSerialization.py --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import graphSerializer
+from graphModel import GraphModel
+
+
+def buildModel(nodeCount):
+    model = GraphModel()
+    outputs, inputs = [], []
+    for idx in range(nodeCount):
+        node = model.addNode('node_{}'.format(idx), 'TestNode',
+                             (idx % 100) * 200.0, (idx // 100) * 150.0,
+                             120.0, 100.0)
+        node.color = '#0B0E13'
+        inputs.append([model.addPort(node.id, 'in_{}'.format(i), 'in').id
+                       for i in range(3)])
+        outputs.append([model.addPort(node.id, 'out_{}'.format(i), 'out').id
+                        for i in range(3)])
+    for idx in range(nodeCount):
+        for step in (1, 2):
+            if idx + step < nodeCount:
+                model.connect(outputs[idx][step], inputs[idx + step][step])
+    return model
+
+
+def timeCall(func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+
+def streamLoad(path, useMmap=False):
+    model = GraphModel()
+    for _ in graphSerializer.iterLoad(path, model, 2000, useMmap):
+        pass
+    return model
+
+
+def run(sizes):
+    tempDir = tempfile.mkdtemp()
+    rows = []
+    try:
+        for size in sizes:
+            model = buildModel(size)
+            for ext, useMmap in (('.json', False), ('.bin', False),
+                                 ('.bin', True)):
+                path = os.path.join(tempDir, 'graph_{}{}'.format(size, ext))
+                saveTime, _ = timeCall(graphSerializer.save, model, path)
+                loadTime, loaded = timeCall(
+                    graphSerializer.load, path, useMmap=useMmap)
+                streamTime, _ = timeCall(streamLoad, path, useMmap)
+                assert len(loaded) == len(model)
+                assert len(loaded.edges()) == len(model.edges())
+                name = 'json' if ext == '.json' else 'binary'
+                if useMmap:
+                    name += '+mmap'
+                rows.append((size, name, os.path.getsize(path),
+                             saveTime, loadTime, streamTime))
+    finally:
+        shutil.rmtree(tempDir)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    print('{:>8} {:>12} {:>12} {:>9} {:>9} {:>9}'.format(
+        'nodes', 'format', 'bytes', 'save(s)', 'load(s)', 'stream(s)'))
+    for row in run(args.sizes):
+        print('{:>8} {:>12} {:>12} {:>9.3f} {:>9.3f} {:>9.3f}'.format(*row))
+
+
+if __name__ == '__main__':
+    main()
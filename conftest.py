@@ -0,0 +1,2 @@
+# test_example.py is a demo window, not a test module, and needs PySide.
+collect_ignore = ['test_example.py']
@@ -0,0 +1,268 @@
+#!/usr/bin/python
+"""
+Persistent, content addressed cache of node evaluation results.
+
+A result is stored under a key hashing what produced it: the node type,
+its parameters and the keys of the results feeding its inputs, see
+resultKey().  The same computation gets the same key in another session
+or after undoing an edit, so its result is read back instead of being
+computed again.
+
+Every entry is a directory of the cache root:
+
+    <root>/<key[:2]>/<key>/result.pkl    pickled {output name: value}
+    <root>/<key[:2]>/<key>/<n>.npy       large numpy arrays, read back
+                                         memory mapped (read only)
+
+Entries are written in a temporary directory and renamed into place, a
+rename being atomic several processes can share a cache directory: a
+reader sees a whole entry or none, and the writers of the same key
+produce the same content.  The modification time of an entry is its last
+use, the least recently used entries are deleted when the cache grows
+past maxBytes.  Qt is not required, numpy is optional.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+RESULT_FILE = 'result.pkl'
+# bump to invalidate every cache written by an older layout.
+CACHE_VERSION = 1
+
+
+class _ArrayRef(object):
+    # placeholder of an array stored in its own .npy file.
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+
+def resultKey(nodeType, attrs, inputs, salt='', outputs=()):
+    """
+    Hash what a node result depends on.
+
+    Args:
+        nodeType (str): type of the node.
+        attrs (dict): parameters of the node, keys and values must be JSON
+            serializable or have a stable repr().
+        inputs (list[tuple]): (input port name, [upstream key, ...]) in
+            port order, the upstream keys in connection order.
+        salt (str): extra text, such as a compute function version.
+        outputs (list[str]): output port names, the keys of the result.
+
+    Returns:
+        str: hexadecimal key.
+    """
+    payload = json.dumps([CACHE_VERSION, nodeType, attrs or {}, inputs, salt,
+                          list(outputs)],
+                         sort_keys=True, default=repr, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache(object):
+    """
+    On disk cache of node results, safe to share between processes.
+
+    Args:
+        root (str): cache directory, created if needed.
+        maxBytes (int): size above which the least recently used entries
+            are evicted.
+        mmapBytes (int): numpy arrays from this size are stored in their
+            own file and memory mapped when read.
+    """
+
+    def __init__(self, root, maxBytes=2 << 30, mmapBytes=1 << 20):
+        self.root = root
+        self.maxBytes = maxBytes
+        self.mmapBytes = mmapBytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._tmpRoot = os.path.join(root, 'tmp')
+        if not os.path.isdir(self._tmpRoot):
+            try:
+                os.makedirs(self._tmpRoot)
+            except OSError:
+                # created by another process meanwhile.
+                if not os.path.isdir(self._tmpRoot):
+                    raise
+        # estimate of the cache size, rescanned when evicting.
+        self._size = self.totalBytes()
+
+    def _entryPath(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def __contains__(self, key):
+        return os.path.isfile(os.path.join(self._entryPath(key), RESULT_FILE))
+
+    def get(self, key):
+        """
+        Returns the cached result of a key or None.
+        """
+        path = self._entryPath(key)
+        try:
+            with open(os.path.join(path, RESULT_FILE), 'rb') as f:
+                result = pickle.load(f)
+            for name, value in list(result.items()):
+                if isinstance(value, _ArrayRef):
+                    result[name] = numpy.load(
+                        os.path.join(path, value.name), mmap_mode='r')
+            # the modification time orders the eviction.
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, ValueError, AttributeError,
+                pickle.UnpicklingError):
+            # missing, evicted meanwhile or written by an older version.
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """
+        Store the result of a key, returns False when the result cannot be
+        pickled.  An existing entry is only marked as used.
+        """
+        path = self._entryPath(key)
+        if os.path.isdir(path):
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+            else:
+                return True
+        tmp = tempfile.mkdtemp(dir=self._tmpRoot)
+        try:
+            stored = {}
+            for idx, (name, value) in enumerate(result.items()):
+                if numpy is not None and isinstance(value, numpy.ndarray) \
+                        and value.nbytes >= self.mmapBytes \
+                        and value.dtype != object:
+                    fileName = '{}.npy'.format(idx)
+                    numpy.save(os.path.join(tmp, fileName), value)
+                    value = _ArrayRef(fileName)
+                stored[name] = value
+            with open(os.path.join(tmp, RESULT_FILE), 'wb') as f:
+                pickle.dump(stored, f, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+        size = self._dirBytes(tmp)
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                pass
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # another process stored the same key first.
+            shutil.rmtree(tmp, ignore_errors=True)
+            return True
+        self.stores += 1
+        self._size += size
+        if self._size > self.maxBytes:
+            self.evict()
+        return True
+
+    def discard(self, key):
+        shutil.rmtree(self._entryPath(key), ignore_errors=True)
+
+    def _dirBytes(self, path):
+        total = 0
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return 0
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(path, name))
+            except OSError:
+                pass
+        return total
+
+    def _entries(self):
+        # (modification time, size, path) of every entry.
+        entries = []
+        for prefix in os.listdir(self.root):
+            if len(prefix) != 2:
+                continue
+            folder = os.path.join(self.root, prefix)
+            try:
+                keys = os.listdir(folder)
+            except OSError:
+                continue
+            for key in keys:
+                path = os.path.join(folder, key)
+                try:
+                    used = os.path.getmtime(path)
+                except OSError:
+                    continue
+                entries.append((used, self._dirBytes(path), path))
+        return entries
+
+    def totalBytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, targetBytes=None):
+        """
+        Delete the least recently used entries until the cache is under
+        targetBytes, 90% of maxBytes by default.
+
+        Returns:
+            int: the number of entries deleted.
+        """
+        if targetBytes is None:
+            targetBytes = int(self.maxBytes * 0.9)
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        count = 0
+        for _, size, path in entries:
+            if total <= targetBytes:
+                break
+            # renamed first so readers never see a half deleted entry.
+            doomed = '{}.{}.del'.format(path, os.getpid())
+            try:
+                os.rename(path, doomed)
+            except OSError:
+                continue
+            shutil.rmtree(doomed, ignore_errors=True)
+            total -= size
+            count += 1
+        self._size = total
+        self.evictions += count
+        self._cleanTmp()
+        return count
+
+    def _cleanTmp(self, age=3600.0):
+        # leftovers of writers that died before renaming their entry.
+        now = time.time()
+        for name in os.listdir(self._tmpRoot):
+            path = os.path.join(self._tmpRoot, name)
+            try:
+                if now - os.path.getmtime(path) > age:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+    def clear(self):
+        """
+        Delete every entry.
+        """
+        self.evict(0)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'stores': self.stores, 'evictions': self.evictions,
+                'bytes': self._size}
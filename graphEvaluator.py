@@ -0,0 +1,439 @@
+#!/usr/bin/python
+"""
+Lazy evaluation of a GraphModel.
+
+Nodes get compute functions by node type or per node.  Results are cached
+per node and invalidated downstream when a node attribute or a connection
+changes, so requesting an output only runs the dirty nodes it depends on.
+
+A compute function is called as func(node, inputs) where node is the
+GraphNode (its "attrs" hold the parameters) and inputs maps every input
+port name to a value.  Ports with a connectionLimit of 1 receive the
+upstream value or None, other ports receive the list of upstream values.
+It returns a dict mapping output port names to values, a node with a single
+output may return the value directly.
+
+With a graphCache.ResultCache set, results are also looked up on disk by a
+key hashing the node type, parameters and upstream keys before computing.
+"""
+from graphCache import resultKey
+
+# node attributes that do not change a result, left out of the cache keys.
+UNKEYED_ATTRS = frozenset(['affinity'])
+
+
+class GraphCycleError(ValueError):
+    """
+    Raised when the graph, or the part of it being evaluated, has a cycle.
+
+    Attributes:
+        nodeIds (list[int]): ids of the nodes on the cycle.
+    """
+
+    def __init__(self, nodeIds):
+        super(GraphCycleError, self).__init__(
+            'graph has a cycle through nodes {}'.format(nodeIds))
+        self.nodeIds = nodeIds
+
+
+def topologicalSort(model, nodeIds=None):
+    """
+    Order nodes so that every node comes after the nodes feeding it.
+
+    Args:
+        model (GraphModel): the graph.
+        nodeIds (iterable[int]): nodes to order, edges to nodes outside of
+            this set are ignored. All nodes when None.
+
+    Returns:
+        list[int]: the ordered node ids.
+
+    Raises:
+        GraphCycleError: when the nodes contain a cycle.
+    """
+    if nodeIds is None:
+        nodeIds = [node.id for node in model.nodes()]
+    nodeSet = set(nodeIds)
+    inDegree = dict.fromkeys(nodeSet, 0)
+    downstream = {}
+    for nodeId in nodeSet:
+        children = [n for n in model.downstreamNodes(nodeId) if n in nodeSet]
+        downstream[nodeId] = children
+        for child in children:
+            inDegree[child] += 1
+    ready = sorted(n for n, degree in inDegree.items() if not degree)
+    order = []
+    while ready:
+        nodeId = ready.pop()
+        order.append(nodeId)
+        for child in downstream[nodeId]:
+            inDegree[child] -= 1
+            if not inDegree[child]:
+                ready.append(child)
+    if len(order) != len(nodeSet):
+        remaining = set(n for n, degree in inDegree.items() if degree)
+        raise GraphCycleError(findCycle(model, remaining))
+    return order
+
+
+def findCycle(model, nodeIds=None):
+    """
+    Returns the node ids of one cycle or None when the nodes are acyclic.
+    """
+    if nodeIds is None:
+        nodeIds = [node.id for node in model.nodes()]
+    nodeSet = set(nodeIds)
+    state = {}
+    for start in nodeSet:
+        if start in state:
+            continue
+        # iterative depth first search, state 1 = on the stack, 2 = done.
+        stack = [(start, iter(model.downstreamNodes(start)))]
+        path = [start]
+        state[start] = 1
+        while stack:
+            nodeId, children = stack[-1]
+            for child in children:
+                if child not in nodeSet:
+                    continue
+                if state.get(child) == 1:
+                    return path[path.index(child):]
+                if child not in state:
+                    state[child] = 1
+                    path.append(child)
+                    stack.append((child, iter(model.downstreamNodes(child))))
+                    break
+            else:
+                state[nodeId] = 2
+                stack.pop()
+                path.pop()
+    return None
+
+
+def downstreamClosure(model, nodeIds):
+    """
+    Returns the given nodes and every node reachable from their outputs.
+    """
+    result = set(nodeIds)
+    stack = list(result)
+    while stack:
+        for child in model.downstreamNodes(stack.pop()):
+            if child not in result:
+                result.add(child)
+                stack.append(child)
+    return result
+
+
+def upstreamClosure(model, nodeIds, stop=None):
+    """
+    Returns the given nodes and every node feeding their inputs.
+
+    Args:
+        model (GraphModel): the graph.
+        nodeIds (iterable[int]): start nodes.
+        stop (callable): optional predicate, nodes for which it returns True
+            are not walked through.
+    """
+    result = set(nodeIds)
+    stack = list(result)
+    while stack:
+        for parent in model.upstreamNodes(stack.pop()):
+            if parent not in result and not (stop and stop(parent)):
+                result.add(parent)
+                stack.append(parent)
+    return result
+
+
+class GraphEvaluator(object):
+    """
+    Evaluates a GraphModel with per node result caching.
+
+    The evaluator listens to the model changeCallbacks: connecting,
+    disconnecting, changing an attribute of a node or adding or renaming
+    one of its ports marks it and everything downstream dirty.
+
+    Args:
+        model (GraphModel): the graph to evaluate.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._typeComputes = {}
+        self._nodeComputes = {}
+        self._results = {}
+        # ids of the nodes computed by the last evaluate() call.
+        self.lastComputed = []
+        # functions called with the set of node ids that became dirty.
+        self.dirtyCallbacks = []
+        # persistent results, see setResultCache().
+        self.resultCache = None
+        self.uncachedTypes = set()
+        self._keys = {}
+        # nodeId: [hits, misses] of the result cache, and functions called
+        # with (nodeId, hit) on each lookup.
+        self.cacheStats = {}
+        self.cacheCallbacks = []
+        model.changeCallbacks.append(self._modelChanged)
+
+    def close(self):
+        """
+        Stop listening to the model.
+        """
+        if self._modelChanged in self.model.changeCallbacks:
+            self.model.changeCallbacks.remove(self._modelChanged)
+
+    def registerType(self, nodeType, func):
+        """
+        Set the compute function of every node of a type.
+
+        Args:
+            nodeType (str): node type, NodeItem class name for scene nodes.
+            func (callable): func(node, inputs) -> dict of outputs.
+        """
+        self._typeComputes[nodeType] = func
+        self.markDirty([n.id for n in self.model.nodes()
+                        if n.nodeType == nodeType])
+
+    def setCompute(self, nodeId, func):
+        """
+        Set the compute function of a single node, overrides the type one.
+        """
+        self._nodeComputes[nodeId] = func
+        self.markDirty([nodeId])
+
+    def setResultCache(self, cache, uncachedTypes=()):
+        """
+        Look up and store the node results in a persistent cache.
+
+        Args:
+            cache (graphCache.ResultCache): the cache, None to stop caching.
+            uncachedTypes (iterable[str]): node types always computed, for
+                compute functions with side effects or external inputs.
+        """
+        self.resultCache = cache
+        self.uncachedTypes = set(uncachedTypes)
+
+    def resultKey(self, nodeId):
+        """
+        Returns the cache key of the result of a node, derived from its
+        type, parameters and the keys of the nodes feeding it.
+        """
+        key = self._keys.get(nodeId)
+        if key is not None:
+            return key
+        model = self.model
+        # upstream keys first, without recursion on deep graphs.
+        pending = [n for n in upstreamClosure(model, [nodeId])
+                   if n not in self._keys]
+        for upstreamId in topologicalSort(model, pending):
+            node = model.node(upstreamId)
+            attrs = dict((name, value)
+                         for name, value in (node.attrs or {}).items()
+                         if name not in UNKEYED_ATTRS)
+            inputs = []
+            for portId in node.inputs:
+                port = model.port(portId)
+                sources = []
+                for edgeId in sorted(port.edges):
+                    outPort = model.port(model.edge(edgeId).outPortId)
+                    sources.append((self._keys[outPort.nodeId], outPort.name))
+                inputs.append((port.name, sources))
+            func = self.computeFunction(upstreamId)
+            salt = ''
+            if func is not None:
+                # a compute function can set "cacheVersion" when its code
+                # changes.
+                salt = '{}.{}:{}'.format(
+                    getattr(func, '__module__', ''),
+                    getattr(func, '__name__', ''),
+                    getattr(func, 'cacheVersion', ''))
+            outputs = [model.port(portId).name for portId in node.outputs]
+            self._keys[upstreamId] = resultKey(
+                node.nodeType, attrs, inputs, salt, outputs)
+        return self._keys[nodeId]
+
+    def _cacheable(self, nodeId):
+        return self.resultCache is not None and \
+            self.computeFunction(nodeId) is not None and \
+            self.model.node(nodeId).nodeType not in self.uncachedTypes
+
+    def loadCachedResult(self, nodeId):
+        """
+        Take the result of a node from the result cache.
+
+        Returns:
+            bool: True on a hit, the node is clean.
+        """
+        if not self._cacheable(nodeId):
+            return False
+        result = self.resultCache.get(self.resultKey(nodeId))
+        hit = result is not None
+        stats = self.cacheStats.setdefault(nodeId, [0, 0])
+        stats[0 if hit else 1] += 1
+        if hit:
+            self._results[nodeId] = result
+        for cb in self.cacheCallbacks:
+            cb(nodeId, hit)
+        return hit
+
+    def computeFunction(self, nodeId):
+        func = self._nodeComputes.get(nodeId)
+        if func is None:
+            func = self._typeComputes.get(self.model.node(nodeId).nodeType)
+        return func
+
+    def setParam(self, nodeId, name, value):
+        """
+        Set a node parameter, the node and its downstream become dirty.
+        """
+        self.model.setAttr(nodeId, name, value)
+
+    def isDirty(self, nodeId):
+        return nodeId not in self._results
+
+    def cachedResult(self, nodeId):
+        return self._results.get(nodeId)
+
+    def markDirty(self, nodeIds):
+        """
+        Drop the cached results of the nodes and of everything downstream.
+
+        Returns:
+            set[int]: the nodes that were clean and are now dirty.
+        """
+        model = self.model
+        dirty = set()
+        starts = set(n for n in nodeIds if model.hasNode(n))
+        stack = list(starts)
+        visited = set(starts)
+        while stack:
+            nodeId = stack.pop()
+            hadKey = self._keys.pop(nodeId, None) is not None
+            if self._results.pop(nodeId, None) is not None:
+                dirty.add(nodeId)
+            elif nodeId not in starts and not hadKey:
+                # everything below a dirty node without a cache key is
+                # already dirty and has no key either.
+                continue
+            for child in model.downstreamNodes(nodeId):
+                if child not in visited:
+                    visited.add(child)
+                    stack.append(child)
+        if dirty:
+            for cb in self.dirtyCallbacks:
+                cb(dirty)
+        return dirty
+
+    def _modelChanged(self, kind, record):
+        if kind in ('connect', 'disconnect'):
+            if self.model.hasPort(record.inPortId):
+                self.markDirty([self.model.port(record.inPortId).nodeId])
+        elif kind == 'attr':
+            self.markDirty([record.id])
+        elif kind in ('addPort', 'portName'):
+            # inputs and results are keyed by port name, the keys below
+            # hold the output port names.
+            self.markDirty([record.nodeId])
+        elif kind == 'removeNode':
+            self._results.pop(record.id, None)
+            self._keys.pop(record.id, None)
+            self.cacheStats.pop(record.id, None)
+            self._nodeComputes.pop(record.id, None)
+        elif kind == 'clear':
+            self._results.clear()
+            self._keys.clear()
+            self.cacheStats.clear()
+            self._nodeComputes.clear()
+
+    def dirtyUpstream(self, nodeIds):
+        """
+        Returns the dirty nodes the given nodes depend on, themselves
+        included, in evaluation order.
+        """
+        needed = upstreamClosure(
+            self.model, [n for n in nodeIds if self.isDirty(n)],
+            stop=lambda nodeId: not self.isDirty(nodeId))
+        return topologicalSort(self.model, needed)
+
+    def gatherInputs(self, nodeId):
+        """
+        Returns the input values of a node from the cached upstream results.
+        """
+        model = self.model
+        inputs = {}
+        for portId in model.node(nodeId).inputs:
+            port = model.port(portId)
+            values = []
+            for edgeId in sorted(port.edges):
+                outPort = model.port(model.edge(edgeId).outPortId)
+                result = self._results.get(outPort.nodeId) or {}
+                values.append(result.get(outPort.name))
+            if port.connectionLimit == 1:
+                inputs[port.name] = values[0] if values else None
+            else:
+                inputs[port.name] = values
+        return inputs
+
+    def computeNode(self, nodeId):
+        """
+        Run the compute function of one node with its current inputs and
+        cache the result, the upstream results must be available.
+        """
+        if self.loadCachedResult(nodeId):
+            return self._results[nodeId]
+        func = self.computeFunction(nodeId)
+        result = None
+        if func is not None:
+            result = func(self.model.node(nodeId), self.gatherInputs(nodeId))
+        return self.storeResult(nodeId, result)
+
+    def storeResult(self, nodeId, result):
+        """
+        Cache the value returned by the compute function of a node, used by
+        schedulers running the compute functions themselves.
+
+        Returns:
+            dict: the output values of the node.
+        """
+        if result is None:
+            result = {}
+        elif not isinstance(result, dict):
+            node = self.model.node(nodeId)
+            if len(node.outputs) != 1:
+                raise TypeError(
+                    'compute of node {} must return a dict'.format(nodeId))
+            result = {self.model.port(node.outputs[0]).name: result}
+        self._results[nodeId] = result
+        if self._cacheable(nodeId):
+            self.resultCache.put(self.resultKey(nodeId), result)
+        return result
+
+    def evaluate(self, nodeId, portName=None):
+        """
+        Evaluate a node, only dirty nodes it depends on are computed.
+
+        Args:
+            nodeId (int): node to evaluate.
+            portName (str): output port to return, all outputs when None.
+
+        Returns:
+            the output value or the dict of all output values.
+        """
+        self.lastComputed = []
+        for upstreamId in self.dirtyUpstream([nodeId]):
+            self.computeNode(upstreamId)
+            self.lastComputed.append(upstreamId)
+        result = self._results[nodeId]
+        if portName is None:
+            return result
+        return result.get(portName)
+
+    def evaluateAll(self):
+        """
+        Evaluate every dirty node of the graph.
+        """
+        self.lastComputed = []
+        for nodeId in topologicalSort(self.model):
+            if self.isDirty(nodeId):
+                self.computeNode(nodeId)
+                self.lastComputed.append(nodeId)
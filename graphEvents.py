@@ -0,0 +1,239 @@
+#!/usr/bin/python
+"""
+Batched graph change events.
+
+The GraphModel changeCallbacks are called synchronously after every single
+change, which suits the indexes kept in step with the model but floods
+anything heavier: dragging a node moves it once per mouse event and
+deleting a selection sends a notification per node and edge.
+
+A GraphEventBus turns the model changes into typed GraphEvents and
+coalesces them inside transactions, subscribers are called once with the
+events of the whole transaction, one event per type carrying the ids of
+every record involved:
+
+    bus = GraphEventBus(model)
+    bus.subscribe(panel.refresh, (NODE_ADDED, NODE_REMOVED))
+    with bus.transaction():
+        for nodeId in nodeIds:
+            model.removeNode(nodeId)
+    # panel.refresh([GraphEvent('nodeRemoved', [...])]) is called here.
+
+Outside of a transaction every change is published right away.  A record
+added and removed in the same transaction is not reported, moves and edits
+of a record added in the transaction are folded in its NODE_ADDED.  Qt is
+not required.
+"""
+import collections
+import contextlib
+
+NODE_ADDED = 'nodeAdded'
+NODE_REMOVED = 'nodeRemoved'
+NODE_MOVED = 'nodeMoved'
+NODE_RESIZED = 'nodeResized'
+NODE_RENAMED = 'nodeRenamed'
+NODE_CHANGED = 'nodeChanged'
+CONNECTED = 'connected'
+DISCONNECTED = 'disconnected'
+GROUP_CHANGED = 'groupChanged'
+CLEARED = 'cleared'
+
+# order of the events of a batch, removals before additions.
+EVENT_TYPES = (CLEARED, DISCONNECTED, NODE_REMOVED, NODE_ADDED, CONNECTED,
+               NODE_MOVED, NODE_RESIZED, NODE_RENAMED, NODE_CHANGED,
+               GROUP_CHANGED)
+
+# events folded in the NODE_ADDED of the same node.
+_NODE_UPDATES = (NODE_MOVED, NODE_RESIZED, NODE_RENAMED, NODE_CHANGED)
+
+
+class GraphEvent(object):
+    """
+    Changes of one type, the ids are node ids, edge ids for CONNECTED and
+    DISCONNECTED, group ids for GROUP_CHANGED and empty for CLEARED.
+    """
+
+    __slots__ = ('type', 'ids')
+
+    def __init__(self, eventType, ids):
+        self.type = eventType
+        self.ids = ids
+
+    def __repr__(self):
+        return 'GraphEvent(\'{}\', {})'.format(self.type, self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class GraphEventBus(object):
+    """
+    Typed, batched notifications of the changes of a GraphModel.
+
+    Args:
+        model (GraphModel): the graph.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        # [callback, set of types or None]
+        self._subscribers = []
+        self._depth = 0
+        self._flushing = False
+        # event type: OrderedDict of ids, used as an ordered set.
+        self._pending = {}
+        # last published (x, y, width, height) to tell moves from resizes.
+        self._geometry = dict(
+            (node.id, (node.x, node.y, node.width, node.height))
+            for node in model.nodes())
+        model.changeCallbacks.append(self._modelChanged)
+
+    def close(self):
+        """
+        Stop listening to the model, pending events are dropped.
+        """
+        if self._modelChanged in self.model.changeCallbacks:
+            self.model.changeCallbacks.remove(self._modelChanged)
+        self._pending = {}
+
+    def subscribe(self, callback, types=None):
+        """
+        Call a function with the list of GraphEvents of each batch.
+
+        Args:
+            callback (callable): callback(events), only called when the
+                batch has events of the subscribed types.
+            types (iterable[str]): event types to receive, all when None.
+        """
+        self._subscribers.append(
+            [callback, None if types is None else frozenset(types)])
+
+    def unsubscribe(self, callback):
+        self._subscribers = [s for s in self._subscribers
+                             if s[0] != callback]
+
+    def begin(self):
+        """
+        Open a transaction, transactions nest and the events are published
+        when the outermost one ends.  See transaction().
+        """
+        self._depth += 1
+
+    def end(self):
+        if self._depth:
+            self._depth -= 1
+        if not self._depth:
+            self.flush()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context manager publishing the changes made in the block as one
+        batch.
+        """
+        self.begin()
+        try:
+            yield self
+        finally:
+            self.end()
+
+    def inTransaction(self):
+        return self._depth > 0
+
+    def _add(self, eventType, recordId):
+        entry = self._pending.get(eventType)
+        if entry is None:
+            entry = self._pending[eventType] = collections.OrderedDict()
+        entry[recordId] = None
+
+    def _discard(self, eventType, recordId):
+        entry = self._pending.get(eventType)
+        if entry is None or recordId not in entry:
+            return False
+        del entry[recordId]
+        return True
+
+    def _isPending(self, eventType, recordId):
+        entry = self._pending.get(eventType)
+        return entry is not None and recordId in entry
+
+    def _nodeUpdated(self, eventType, nodeId):
+        if not self._isPending(NODE_ADDED, nodeId):
+            self._add(eventType, nodeId)
+
+    def _modelChanged(self, kind, record):
+        geometry = self._geometry
+        if kind == 'geometry':
+            new = (record.x, record.y, record.width, record.height)
+            old = geometry.get(record.id)
+            geometry[record.id] = new
+            if old is None or old[:2] != new[:2]:
+                self._nodeUpdated(NODE_MOVED, record.id)
+            if old is not None and old[2:] != new[2:]:
+                self._nodeUpdated(NODE_RESIZED, record.id)
+        elif kind == 'addNode':
+            geometry[record.id] = (
+                record.x, record.y, record.width, record.height)
+            self._add(NODE_ADDED, record.id)
+        elif kind == 'removeNode':
+            geometry.pop(record.id, None)
+            for eventType in _NODE_UPDATES:
+                self._discard(eventType, record.id)
+            if not self._discard(NODE_ADDED, record.id):
+                self._add(NODE_REMOVED, record.id)
+        elif kind in ('name', 'portName'):
+            nodeId = record.id if kind == 'name' else record.nodeId
+            self._nodeUpdated(NODE_RENAMED, nodeId)
+        elif kind in ('attr', 'addPort'):
+            nodeId = record.id if kind == 'attr' else record.nodeId
+            self._nodeUpdated(NODE_CHANGED, nodeId)
+        elif kind == 'connect':
+            self._add(CONNECTED, record.id)
+        elif kind == 'disconnect':
+            if not self._discard(CONNECTED, record.id):
+                self._add(DISCONNECTED, record.id)
+        elif kind in ('addGroup', 'removeGroup', 'groupState'):
+            self._add(GROUP_CHANGED, record.id)
+        elif kind == 'group':
+            if record.groupId is not None:
+                self._add(GROUP_CHANGED, record.groupId)
+            self._nodeUpdated(NODE_CHANGED, record.id)
+        elif kind == 'clear':
+            geometry.clear()
+            self._pending = {}
+            self._add(CLEARED, None)
+        else:
+            return
+        if not self._depth:
+            self.flush()
+
+    def flush(self):
+        """
+        Publish the pending events now, even inside a transaction.
+        """
+        if self._flushing:
+            # a subscriber changed the model, the loop below picks it up.
+            return
+        self._flushing = True
+        try:
+            while self._pending:
+                pending, self._pending = self._pending, {}
+                events = []
+                for eventType in EVENT_TYPES:
+                    entry = pending.get(eventType)
+                    if entry:
+                        ids = [] if eventType == CLEARED else list(entry)
+                        events.append(GraphEvent(eventType, ids))
+                if events:
+                    self._publish(events)
+        finally:
+            self._flushing = False
+
+    def _publish(self, events):
+        for callback, types in list(self._subscribers):
+            if types is None:
+                callback(events)
+                continue
+            selected = [event for event in events if event.type in types]
+            if selected:
+                callback(selected)
@@ -0,0 +1,281 @@
+#!/usr/bin/python
+"""
+Layered (Sugiyama) layout of a GraphModel.
+
+Edges run from "out" ports on the right of a node to "in" ports on the left,
+so nodes are placed in columns from left to right:
+
+    1. cycles are broken by reversing the back edges of a depth first
+       search, then nodes get the longest path layer pulled as close as
+       possible to the nodes they feed.
+    2. edges spanning several layers get a chain of dummy vertices and the
+       order of every layer is refined by barycenter sweeps, the position
+       of a neighbor being its order plus the relative index of the port
+       the edge uses.
+    3. columns are as wide as their widest node, nodes are stacked in each
+       column at their model height and moved toward the ports they
+       connect to without overlapping.
+
+The layout works on a snapshot of plain tuples, snapshotLayout() is the
+only step reading the model so computeLayout() can run on another thread
+or process while the graph is edited.  Qt is not required.
+"""
+
+
+def snapshotLayout(model, nodeIds=None):
+    """
+    Capture what the layout needs from a model.
+
+    Args:
+        model (GraphModel): the graph.
+        nodeIds (iterable[int]): nodes to lay out, edges to other nodes are
+            ignored. All nodes when None.
+
+    Returns:
+        tuple(list[tuple], list[tuple]): (nodeId, x, y, width, height) node
+        records and (outNodeId, outFraction, inNodeId, inFraction) edge
+        records, a fraction is the relative height of the port on its node.
+    """
+    if nodeIds is None:
+        nodeIds = [node.id for node in model.nodes()]
+    nodeSet = set(nodeIds)
+    nodes = []
+    edges = []
+    for nodeId in nodeIds:
+        node = model.node(nodeId)
+        nodes.append((node.id, node.x, node.y, node.width, node.height))
+        count = len(node.outputs)
+        for portId in node.outputs:
+            port = model.port(portId)
+            outFraction = (port.index + 1.0) / (count + 1)
+            for edgeId in sorted(port.edges):
+                inPort = model.port(model.edge(edgeId).inPortId)
+                if inPort.nodeId not in nodeSet:
+                    continue
+                inCount = len(model.node(inPort.nodeId).inputs)
+                edges.append((nodeId, outFraction, inPort.nodeId,
+                              (inPort.index + 1.0) / (inCount + 1)))
+    return nodes, edges
+
+
+def _acyclicEdges(count, edges):
+    # reverse the back edges of an iterative depth first search.
+    children = [[] for _ in range(count)]
+    for idx, (u, v, _, _) in enumerate(edges):
+        children[u].append((v, idx))
+    state = [0] * count
+    reversed_ = set()
+    for start in range(count):
+        if state[start]:
+            continue
+        state[start] = 1
+        stack = [(start, iter(children[start]))]
+        while stack:
+            vertex, it = stack[-1]
+            for child, idx in it:
+                if state[child] == 1:
+                    reversed_.add(idx)
+                elif not state[child]:
+                    state[child] = 1
+                    stack.append((child, iter(children[child])))
+                    break
+            else:
+                state[vertex] = 2
+                stack.pop()
+    result = []
+    for idx, (u, v, fu, fv) in enumerate(edges):
+        if idx in reversed_:
+            # the fractions stay attached to their own node.
+            result.append((v, u, fv, fu))
+        else:
+            result.append((u, v, fu, fv))
+    return result
+
+
+def _assignLayers(count, edges):
+    preds = [[] for _ in range(count)]
+    succs = [[] for _ in range(count)]
+    inDegree = [0] * count
+    for u, v, _, _ in edges:
+        succs[u].append(v)
+        preds[v].append(u)
+        inDegree[v] += 1
+    ready = [n for n in range(count) if not inDegree[n]]
+    order = []
+    while ready:
+        vertex = ready.pop()
+        order.append(vertex)
+        for child in succs[vertex]:
+            inDegree[child] -= 1
+            if not inDegree[child]:
+                ready.append(child)
+    layers = [0] * count
+    for vertex in order:
+        for parent in preds[vertex]:
+            if layers[parent] + 1 > layers[vertex]:
+                layers[vertex] = layers[parent] + 1
+    # pull nodes toward the nodes they feed to shorten the edges.
+    for vertex in reversed(order):
+        if succs[vertex]:
+            layers[vertex] = min(layers[c] for c in succs[vertex]) - 1
+    return layers
+
+
+def _sweepOrder(layers, pos, neighbors):
+    for layer in layers:
+        keys = {}
+        for vertex in layer:
+            links = neighbors[vertex]
+            if links:
+                keys[vertex] = sum(pos[n] + f for n, f, _ in links) / \
+                    len(links)
+            else:
+                keys[vertex] = pos[vertex]
+        layer.sort(key=lambda v: (keys[v], pos[v]))
+        for idx, vertex in enumerate(layer):
+            pos[vertex] = idx
+
+
+def _placeLayer(layer, tops, heights, gaps, desired):
+    # closest non overlapping placement keeping the order, the average of
+    # pushing overlapping vertices down and pushing them up.
+    count = len(layer)
+    down = list(desired)
+    up = list(desired)
+    for idx in range(1, count):
+        limit = down[idx - 1] + heights[layer[idx - 1]] + gaps[idx]
+        if down[idx] < limit:
+            down[idx] = limit
+    for idx in range(count - 2, -1, -1):
+        limit = up[idx + 1] - heights[layer[idx]] - gaps[idx + 1]
+        if up[idx] > limit:
+            up[idx] = limit
+    for idx, vertex in enumerate(layer):
+        tops[vertex] = (down[idx] + up[idx]) * 0.5
+
+
+def _alignLayer(layer, tops, heights, gaps, neighbors):
+    desired = []
+    for vertex in layer:
+        links = neighbors[vertex]
+        if links:
+            total = sum(tops[n] + f * heights[n] for n, f, _ in links)
+            ownPort = sum(own for _, _, own in links) * heights[vertex]
+            desired.append((total - ownPort) / len(links))
+        else:
+            desired.append(tops[vertex])
+    _placeLayer(layer, tops, heights, gaps, desired)
+
+
+def computeLayout(nodes, edges, layerSpacing=80.0, nodeSpacing=30.0,
+                  edgeSpacing=10.0, iterations=4, origin=None):
+    """
+    Compute node positions from a snapshotLayout().
+
+    Args:
+        nodes (list[tuple]): (nodeId, x, y, width, height) records.
+        edges (list[tuple]): (outNodeId, outFraction, inNodeId, inFraction)
+            records.
+        layerSpacing (float): horizontal gap between the columns.
+        nodeSpacing (float): vertical gap between the nodes of a column.
+        edgeSpacing (float): vertical gap around edges crossing a column.
+        iterations (int): number of down and up sweeps of the ordering and
+            of the coordinate assignment.
+        origin (tuple): (x, y) of the top left of the result, the top left
+            of the current node bounds when None.
+
+    Returns:
+        dict: {nodeId: (x, y)} positions.
+    """
+    if not nodes:
+        return {}
+    count = len(nodes)
+    index = dict((record[0], idx) for idx, record in enumerate(nodes))
+    vertexEdges = []
+    for outId, fu, inId, fv in edges:
+        u, v = index[outId], index[inId]
+        if u != v:
+            vertexEdges.append((u, v, fu, fv))
+    vertexEdges = _acyclicEdges(count, vertexEdges)
+    layerOf = _assignLayers(count, vertexEdges)
+
+    widths = [record[3] for record in nodes]
+    heights = [record[4] for record in nodes]
+    # neighbor lists of (vertex, fraction on the neighbor, own fraction).
+    ups = [[] for _ in range(count)]
+    downs = [[] for _ in range(count)]
+    for u, v, fu, fv in vertexEdges:
+        layer = layerOf[u]
+        # dummy vertices of the columns crossed by a long edge.
+        while layer + 1 < layerOf[v]:
+            layer += 1
+            dummy = len(layerOf)
+            layerOf.append(layer)
+            widths.append(0.0)
+            heights.append(0.0)
+            ups.append([(u, fu, 0.0)])
+            downs.append([])
+            downs[u].append((dummy, 0.0, fu))
+            u, fu = dummy, 0.0
+        ups[v].append((u, fu, fv))
+        downs[u].append((v, fv, fu))
+
+    layers = [[] for _ in range(max(layerOf) + 1)]
+    for vertex in range(len(layerOf)):
+        layers[layerOf[vertex]].append(vertex)
+    pos = [0] * len(layerOf)
+    for layer in layers:
+        for idx, vertex in enumerate(layer):
+            pos[vertex] = idx
+
+    for _ in range(iterations):
+        _sweepOrder(layers[1:], pos, ups)
+        _sweepOrder(layers[-2::-1], pos, downs)
+
+    # gap above each vertex of a column, edges crossing a column only
+    # keep a small gap around them.
+    gaps = []
+    for layer in layers:
+        gaps.append([0.0] + [
+            nodeSpacing if layer[idx - 1] < count and layer[idx] < count
+            else edgeSpacing for idx in range(1, len(layer))])
+    tops = [0.0] * len(layerOf)
+    for layer, layerGaps in zip(layers, gaps):
+        top = 0.0
+        for vertex, gap in zip(layer, layerGaps):
+            top += gap
+            tops[vertex] = top
+            top += heights[vertex]
+        # center the columns on each other before aligning them.
+        for vertex in layer:
+            tops[vertex] -= top / 2.0
+    for _ in range(iterations):
+        for idx in range(1, len(layers)):
+            _alignLayer(layers[idx], tops, heights, gaps[idx], ups)
+        for idx in range(len(layers) - 2, -1, -1):
+            _alignLayer(layers[idx], tops, heights, gaps[idx], downs)
+
+    lefts = []
+    left = 0.0
+    for layer in layers:
+        lefts.append(left)
+        left += max(widths[v] for v in layer) + layerSpacing
+
+    if origin is None:
+        origin = (min(record[1] for record in nodes),
+                  min(record[2] for record in nodes))
+    top = min(tops[:count])
+    return dict((nodes[v][0], (origin[0] + lefts[layerOf[v]],
+                               origin[1] + tops[v] - top))
+                for v in range(count))
+
+
+def layoutModel(model, nodeIds=None, **options):
+    """
+    Snapshot and lay out a model, see computeLayout() for the options.
+
+    Returns:
+        dict: {nodeId: (x, y)} positions, the model is not changed.
+    """
+    nodes, edges = snapshotLayout(model, nodeIds)
+    return computeLayout(nodes, edges, **options)
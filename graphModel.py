@@ -0,0 +1,480 @@
+#!/usr/bin/python
+"""
+Headless graph model.
+
+Pure python records for nodes, ports and edges with integer ids and
+adjacency indexes.  The model has no Qt dependency so large graphs can be
+built and traversed in batch jobs, the NodeScene mirrors it and only
+creates graphics items for the nodes a NodeViewer needs to show.
+"""
+
+
+class GraphNode(object):
+    """
+    Node record of a GraphModel.
+    """
+
+    __slots__ = ('id', 'name', 'nodeType', 'x', 'y', 'width', 'height',
+                 'color', 'textColor', 'inputs', 'outputs', 'attrs',
+                 'groupId')
+
+    def __init__(self, nodeId, name, nodeType=None, x=0.0, y=0.0,
+                 width=50.0, height=50.0):
+        self.id = nodeId
+        self.name = name
+        self.nodeType = nodeType
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.color = None
+        self.textColor = None
+        self.inputs = []
+        self.outputs = []
+        self.attrs = None
+        self.groupId = None
+
+    def __repr__(self):
+        return 'GraphNode({}, \'{}\')'.format(self.id, self.name)
+
+    def ports(self):
+        return self.inputs + self.outputs
+
+
+class GraphPort(object):
+    """
+    Port record of a GraphModel, "edges" is the set of connected edge ids
+    and "dataType" the optional type checked by the graphRules.
+    """
+
+    __slots__ = ('id', 'nodeId', 'name', 'portType', 'connectionLimit',
+                 'index', 'edges', 'dataType')
+
+    def __init__(self, portId, nodeId, name, portType, connectionLimit=-1,
+                 index=0, dataType=None):
+        self.id = portId
+        self.nodeId = nodeId
+        self.name = name
+        self.portType = portType
+        self.connectionLimit = connectionLimit
+        self.index = index
+        self.edges = set()
+        self.dataType = dataType
+
+    def __repr__(self):
+        return 'GraphPort({}, \'{}\', \'{}\')'.format(
+            self.id, self.name, self.portType)
+
+
+class GraphEdge(object):
+    """
+    Edge record of a GraphModel, always stored from the "out" port to the
+    "in" port.
+    """
+
+    __slots__ = ('id', 'outPortId', 'inPortId')
+
+    def __init__(self, edgeId, outPortId, inPortId):
+        self.id = edgeId
+        self.outPortId = outPortId
+        self.inPortId = inPortId
+
+    def __repr__(self):
+        return 'GraphEdge({}, {} -> {})'.format(
+            self.id, self.outPortId, self.inPortId)
+
+
+class GraphGroup(object):
+    """
+    Group record of a GraphModel, a set of nodes that can be collapsed
+    behind a single item.  "x" and "y" place the collapsed item, None until
+    the group is first collapsed.
+    """
+
+    __slots__ = ('id', 'name', 'nodeIds', 'collapsed', 'x', 'y')
+
+    def __init__(self, groupId, name):
+        self.id = groupId
+        self.name = name
+        self.nodeIds = set()
+        self.collapsed = False
+        self.x = None
+        self.y = None
+
+    def __repr__(self):
+        return 'GraphGroup({}, \'{}\')'.format(self.id, self.name)
+
+
+class GraphModel(object):
+    """
+    Container for the node, port, edge and group records of a graph.
+
+    Functions in "changeCallbacks" are called with (kind, record) after each
+    change, kind is one of 'addNode', 'removeNode', 'addPort', 'connect',
+    'disconnect', 'attr', 'geometry' (node moved or resized), 'name' (node
+    renamed), 'portName' (port renamed), 'group' (node
+    moved to another group), 'addGroup', 'removeGroup', 'groupState'
+    (group collapsed or expanded) or 'clear'.  graphEvents.GraphEventBus
+    batches them into typed events for observers that do not need every
+    single change.
+    """
+
+    def __init__(self):
+        self._nodes = {}
+        self._ports = {}
+        self._edges = {}
+        self._groups = {}
+        self._nextNodeId = 1
+        self._nextPortId = 1
+        self._nextEdgeId = 1
+        self._nextGroupId = 1
+        self.changeCallbacks = []
+
+    def _notify(self, kind, record):
+        for cb in self.changeCallbacks:
+            cb(kind, record)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, nodeId):
+        return nodeId in self._nodes
+
+    def node(self, nodeId):
+        return self._nodes[nodeId]
+
+    def port(self, portId):
+        return self._ports[portId]
+
+    def edge(self, edgeId):
+        return self._edges[edgeId]
+
+    def nodes(self):
+        return self._nodes.values()
+
+    def edges(self):
+        return self._edges.values()
+
+    def group(self, groupId):
+        return self._groups[groupId]
+
+    def groups(self):
+        return self._groups.values()
+
+    def hasGroup(self, groupId):
+        return groupId in self._groups
+
+    def hasNode(self, nodeId):
+        return nodeId in self._nodes
+
+    def hasPort(self, portId):
+        return portId in self._ports
+
+    def hasEdge(self, edgeId):
+        return edgeId in self._edges
+
+    def addNode(self, name='Untitled_Node', nodeType=None, x=0.0, y=0.0,
+                width=50.0, height=50.0, nodeId=None):
+        """
+        Add a node record.
+
+        Args:
+            name (str): name of the node.
+            nodeType (str): optional type name used by node factories.
+            x (float): x position.
+            y (float): y position.
+            width (float): width of the node.
+            height (float): height of the node.
+            nodeId (int): explicit id, a new one is allocated when None.
+
+        Returns:
+            GraphNode: the new node.
+        """
+        if nodeId is None:
+            nodeId = self._nextNodeId
+        elif nodeId in self._nodes:
+            raise ValueError('node id {} already exists'.format(nodeId))
+        self._nextNodeId = max(self._nextNodeId, nodeId + 1)
+        node = GraphNode(nodeId, name, nodeType, x, y, width, height)
+        self._nodes[nodeId] = node
+        if self.changeCallbacks:
+            self._notify('addNode', node)
+        return node
+
+    def addPort(self, nodeId, name, portType, connectionLimit=-1,
+                portId=None, dataType=None):
+        """
+        Add a port record to a node.
+
+        Args:
+            nodeId (int): id of the parent node.
+            name (str): port label.
+            portType (str): 'in' or 'out'.
+            connectionLimit (int): max connections, -1 for unlimited.
+            portId (int): explicit id, a new one is allocated when None.
+            dataType (str): type of the values, None accepts any type.
+
+        Returns:
+            GraphPort: the new port.
+        """
+        node = self._nodes[nodeId]
+        if portType == 'in':
+            ports = node.inputs
+        elif portType == 'out':
+            ports = node.outputs
+        else:
+            raise ValueError('invalid port type: {}'.format(portType))
+        if portId is None:
+            portId = self._nextPortId
+        elif portId in self._ports:
+            raise ValueError('port id {} already exists'.format(portId))
+        self._nextPortId = max(self._nextPortId, portId + 1)
+        port = GraphPort(portId, nodeId, name, portType, connectionLimit,
+                         len(ports), dataType)
+        ports.append(portId)
+        self._ports[portId] = port
+        if self.changeCallbacks:
+            self._notify('addPort', port)
+        return port
+
+    def removeNode(self, nodeId):
+        """
+        Remove a node with its ports and edges.
+
+        Returns:
+            list[GraphEdge]: the edges that were removed with the node.
+        """
+        node = self._nodes[nodeId]
+        removed = [self.disconnect(edgeId)
+                   for edgeId in sorted(self.nodeEdges(nodeId))]
+        del self._nodes[nodeId]
+        for portId in node.inputs + node.outputs:
+            del self._ports[portId]
+        # the record keeps its groupId so listeners know where it was.
+        if node.groupId is not None:
+            self._groups[node.groupId].nodeIds.discard(nodeId)
+        if self.changeCallbacks:
+            self._notify('removeNode', node)
+        return removed
+
+    def connect(self, portId1, portId2, edgeId=None):
+        """
+        Connect two ports, the order of the ports does not matter.
+
+        Returns:
+            GraphEdge: the new edge.
+        """
+        port1, port2 = self._ports[portId1], self._ports[portId2]
+        if port1.portType == port2.portType:
+            raise ValueError('cannot connect two "{}" ports'.format(
+                port1.portType))
+        if port1.nodeId == port2.nodeId:
+            raise ValueError('cannot connect a node to itself')
+        if port1.portType == 'in':
+            port1, port2 = port2, port1
+        if edgeId is None:
+            edgeId = self._nextEdgeId
+        elif edgeId in self._edges:
+            raise ValueError('edge id {} already exists'.format(edgeId))
+        self._nextEdgeId = max(self._nextEdgeId, edgeId + 1)
+        edge = GraphEdge(edgeId, port1.id, port2.id)
+        self._edges[edgeId] = edge
+        port1.edges.add(edgeId)
+        port2.edges.add(edgeId)
+        if self.changeCallbacks:
+            self._notify('connect', edge)
+        return edge
+
+    def disconnect(self, edgeId):
+        """
+        Remove an edge, returns the removed edge or None if it did not exist.
+        """
+        edge = self._edges.pop(edgeId, None)
+        if edge is None:
+            return None
+        for portId in (edge.outPortId, edge.inPortId):
+            port = self._ports.get(portId)
+            if port:
+                port.edges.discard(edgeId)
+        if self.changeCallbacks:
+            self._notify('disconnect', edge)
+        return edge
+
+    def addGroup(self, name='Group', nodeIds=(), groupId=None):
+        """
+        Add a group and move nodes into it.
+
+        Args:
+            name (str): name of the group.
+            nodeIds (iterable[int]): nodes of the group.
+            groupId (int): explicit id, a new one is allocated when None.
+
+        Returns:
+            GraphGroup: the new group.
+        """
+        if groupId is None:
+            groupId = self._nextGroupId
+        elif groupId in self._groups:
+            raise ValueError('group id {} already exists'.format(groupId))
+        self._nextGroupId = max(self._nextGroupId, groupId + 1)
+        group = GraphGroup(groupId, name)
+        self._groups[groupId] = group
+        if self.changeCallbacks:
+            self._notify('addGroup', group)
+        for nodeId in nodeIds:
+            self.setNodeGroup(nodeId, groupId)
+        return group
+
+    def removeGroup(self, groupId):
+        """
+        Remove a group, its nodes are kept outside of any group.
+        """
+        group = self._groups[groupId]
+        for nodeId in list(group.nodeIds):
+            self.setNodeGroup(nodeId, None)
+        del self._groups[groupId]
+        if self.changeCallbacks:
+            self._notify('removeGroup', group)
+
+    def setNodeGroup(self, nodeId, groupId):
+        """
+        Move a node to a group, None takes it out of its group.
+        """
+        node = self._nodes[nodeId]
+        if node.groupId == groupId:
+            return
+        if node.groupId is not None:
+            self._groups[node.groupId].nodeIds.discard(nodeId)
+        if groupId is not None:
+            self._groups[groupId].nodeIds.add(nodeId)
+        node.groupId = groupId
+        if self.changeCallbacks:
+            self._notify('group', node)
+
+    def setGroupCollapsed(self, groupId, collapsed=True):
+        group = self._groups[groupId]
+        if group.collapsed == collapsed:
+            return
+        group.collapsed = collapsed
+        if self.changeCallbacks:
+            self._notify('groupState', group)
+
+    def findEdge(self, outPortId, inPortId):
+        port = self._ports[outPortId]
+        for edgeId in port.edges:
+            if self._edges[edgeId].inPortId == inPortId:
+                return self._edges[edgeId]
+        return None
+
+    def attr(self, nodeId, name, default=None):
+        attrs = self._nodes[nodeId].attrs
+        if attrs is None:
+            return default
+        return attrs.get(name, default)
+
+    def setAttr(self, nodeId, name, value):
+        """
+        Set a node attribute such as a compute parameter.
+        """
+        node = self._nodes[nodeId]
+        if node.attrs is None:
+            node.attrs = {}
+        node.attrs[name] = value
+        if self.changeCallbacks:
+            self._notify('attr', node)
+
+    def setNodeName(self, nodeId, name):
+        node = self._nodes[nodeId]
+        node.name = name
+        if self.changeCallbacks:
+            self._notify('name', node)
+
+    def setPortName(self, portId, name):
+        port = self._ports[portId]
+        port.name = name
+        if self.changeCallbacks:
+            self._notify('portName', port)
+
+    def setNodePos(self, nodeId, x, y):
+        node = self._nodes[nodeId]
+        node.x, node.y = x, y
+        if self.changeCallbacks:
+            self._notify('geometry', node)
+
+    def setNodeSize(self, nodeId, width, height):
+        node = self._nodes[nodeId]
+        node.width, node.height = width, height
+        if self.changeCallbacks:
+            self._notify('geometry', node)
+
+    def connectedPorts(self, portId):
+        """
+        Returns the ids of the ports connected to the given port.
+        """
+        port = self._ports[portId]
+        if port.portType == 'in':
+            return [self._edges[e].outPortId for e in port.edges]
+        return [self._edges[e].inPortId for e in port.edges]
+
+    def nodeEdges(self, nodeId):
+        """
+        Returns the ids of all the edges connected to a node.
+        """
+        node = self._nodes[nodeId]
+        edges = set()
+        for portId in node.inputs + node.outputs:
+            edges.update(self._ports[portId].edges)
+        return edges
+
+    def upstreamNodes(self, nodeId):
+        """
+        Returns the ids of the nodes directly connected to the node inputs.
+        """
+        result = set()
+        for portId in self._nodes[nodeId].inputs:
+            for edgeId in self._ports[portId].edges:
+                outPort = self._ports[self._edges[edgeId].outPortId]
+                result.add(outPort.nodeId)
+        return result
+
+    def downstreamNodes(self, nodeId):
+        """
+        Returns the ids of the nodes directly connected to the node outputs.
+        """
+        result = set()
+        for portId in self._nodes[nodeId].outputs:
+            for edgeId in self._ports[portId].edges:
+                inPort = self._ports[self._edges[edgeId].inPortId]
+                result.add(inPort.nodeId)
+        return result
+
+    def nodesInRect(self, x, y, width, height):
+        """
+        Returns the nodes with a bounding box intersecting the given rect.
+        """
+        right, bottom = x + width, y + height
+        return [n for n in self._nodes.values()
+                if n.x < right and n.x + n.width > x and
+                n.y < bottom and n.y + n.height > y]
+
+    def bounds(self):
+        """
+        Returns the (x, y, width, height) bounding box of all nodes or None
+        if the model is empty.
+        """
+        if not self._nodes:
+            return None
+        nodes = self._nodes.values()
+        left = min(n.x for n in nodes)
+        top = min(n.y for n in nodes)
+        right = max(n.x + n.width for n in nodes)
+        bottom = max(n.y + n.height for n in nodes)
+        return left, top, right - left, bottom - top
+
+    def clear(self):
+        self._nodes.clear()
+        self._ports.clear()
+        self._edges.clear()
+        self._groups.clear()
+        if self.changeCallbacks:
+            self._notify('clear', None)
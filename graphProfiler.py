@@ -0,0 +1,194 @@
+#!/usr/bin/python
+"""
+Hot path instrumentation.
+
+The graph items report counters and timings to the module "profiler".
+Collection is off by default, every instrumented call site only tests
+profiler.enabled before doing anything so the disabled cost is a single
+attribute lookup.
+
+Counters and timers accumulate until reset(), the counts of the current
+frame are also kept apart and moved to "lastFrame" by endFrame(), which
+the NodeViewer calls after each paint.  Qt is not required.
+
+    from graphProfiler import profiler
+    profiler.enable()
+    ...
+    print(profiler.report())
+    profiler.dump('profile.json')
+"""
+import collections
+import contextlib
+import json
+import time
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Profiler(object):
+    """
+    Counters and timers keyed by name.
+
+    Args:
+        frameHistory (int): number of frame end times kept for the FPS.
+    """
+
+    def __init__(self, frameHistory=120):
+        self.enabled = False
+        self._frameTimes = collections.deque(maxlen=frameHistory)
+        self.reset()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """
+        Forget every counter, timer and frame.
+        """
+        self._counters = {}
+        # timer name: [calls, total seconds, max seconds]
+        self._timers = {}
+        self._frame = {}
+        self._frameCount = 0
+        self._frameTimes.clear()
+        self.lastFrame = {}
+
+    def count(self, name, amount=1):
+        """
+        Add to a counter and to the counts of the current frame.
+        """
+        self._counters[name] = self._counters.get(name, 0) + amount
+        self._frame[name] = self._frame.get(name, 0) + amount
+
+    def addTime(self, name, seconds):
+        """
+        Record one call of a timer, the call is counted in the frame too.
+        """
+        timer = self._timers.get(name)
+        if timer is None:
+            self._timers[name] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+        self._frame[name] = self._frame.get(name, 0) + 1
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        """
+        Context manager timing its block, for code off the hot paths.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = clock()
+        try:
+            yield
+        finally:
+            self.addTime(name, clock() - start)
+
+    def endFrame(self):
+        """
+        Close the current frame, its counts become "lastFrame".
+        """
+        self._frameTimes.append(clock())
+        self._frameCount += 1
+        self.lastFrame, self._frame = self._frame, {}
+
+    def fps(self, window=1.0):
+        """
+        Returns the number of frames per second over the last "window"
+        seconds of painting.
+        """
+        times = self._frameTimes
+        if len(times) < 2:
+            return 0.0
+        last = times[-1]
+        frames = [t for t in times if last - t <= window]
+        if len(frames) < 2:
+            return 0.0
+        return (len(frames) - 1) / (last - frames[0])
+
+    def counter(self, name):
+        return self._counters.get(name, 0)
+
+    def timer(self, name):
+        """
+        Returns the (calls, total, max) seconds of a timer.
+        """
+        return tuple(self._timers.get(name, (0, 0.0, 0.0)))
+
+    def slowest(self, count=5, key='max'):
+        """
+        Returns the names of the timers with the highest max or total time.
+
+        Args:
+            count (int): number of names.
+            key (str): 'max', 'total' or 'mean'.
+        """
+        def value(item):
+            calls, total, maximum = item[1]
+            if key == 'max':
+                return maximum
+            if key == 'mean':
+                return total / calls
+            return total
+
+        ordered = sorted(self._timers.items(), key=value, reverse=True)
+        return [name for name, _ in ordered[:count]]
+
+    def stats(self):
+        """
+        Returns a JSON friendly dict of everything collected.
+        """
+        timers = {}
+        for name, (calls, total, maximum) in self._timers.items():
+            timers[name] = {'calls': calls, 'total': total, 'max': maximum,
+                            'mean': total / calls}
+        return {
+            'counters': dict(self._counters),
+            'timers': timers,
+            'frames': self._frameCount,
+            'fps': self.fps(),
+            'lastFrame': dict(self.lastFrame),
+        }
+
+    def dump(self, path):
+        """
+        Write the stats() to a JSON file.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.stats(), f, indent=2, sort_keys=True)
+
+    def report(self, count=10):
+        """
+        Returns a text table of the timers sorted by total time.
+        """
+        lines = ['{:<36} {:>8} {:>10} {:>10} {:>10}'.format(
+            'timer', 'calls', 'total(ms)', 'mean(ms)', 'max(ms)')]
+        for name in self.slowest(count, 'total'):
+            calls, total, maximum = self._timers[name]
+            lines.append('{:<36} {:>8} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                name, calls, total * 1000, total / calls * 1000,
+                maximum * 1000))
+        for name in sorted(self._counters):
+            lines.append('{:<36} {:>8}'.format(name, self._counters[name]))
+        return '\n'.join(lines)
+
+
+def handlerName(func):
+    """
+    Returns a readable "Class.method" name for a callback.
+    """
+    owner = getattr(func, '__self__', None)
+    name = getattr(func, '__name__', None) or repr(func)
+    if owner is not None:
+        return '{}.{}'.format(owner.__class__.__name__, name)
+    return name
+
+
+profiler = Profiler()
@@ -0,0 +1,592 @@
+#!/usr/bin/python
+"""
+Registry of the node types, imported on first use.
+
+A node type is a NodeItem subclass named by a target "module:Class".  The
+registry knows the types from:
+
+    - entry points of the ENTRY_POINT_GROUP group, the entry point name is
+      the type name and its value the target.
+    - module paths, discoverModules() reads the source of every module of a
+      directory and finds the classes deriving from NodeItem.
+    - register() and registerClass() calls.
+
+Nothing is imported while discovering, the port schema of a type (the
+literal addInputPort() and addOutputPort() calls of its __init__) is read
+from the module source so the palette lists and searches the types without
+importing them.  A schema that cannot be read statically is taken from the
+first instance instead.  The schemas are cached in a JSON file next to the
+modification time and size of their source, later sessions only parse the
+modules that changed:
+
+    registry = NodeTypeRegistry(cachePath)
+    registry.discoverEntryPoints()
+    registry.discoverModules('/studio/nodes', 'studio.nodes')
+    registry.save()
+    item = registry.create('Blur')  # imports studio.nodes.filters here
+
+A class sets its type name, palette label and category with the "nodeType",
+"label" and "category" class attributes, the class name is the default type
+name.  Qt is not required.
+"""
+import ast
+import importlib
+import json
+import os
+import sys
+import tempfile
+
+from graphProfiler import profiler, clock
+
+ENTRY_POINT_GROUP = 'pySideNodeGraph.nodes'
+CACHE_FORMAT = 'nodeTypes'
+CACHE_VERSION = 1
+# base classes of the node types, the classes deriving from a discovered
+# type are node types too.
+BASE_NAMES = ('NodeItem',)
+# NodeItem.addInputPort() and addOutputPort() defaults.
+_PORT_DEFAULTS = ('input', -1, None)
+_PORT_ARGS = ('label', 'connectionLimit', 'dataType')
+_PORT_CALLS = {'addInputPort': 'inputs', 'addOutputPort': 'outputs'}
+
+
+class NodeTypeError(LookupError):
+    """
+    Raised for an unknown type or a target that cannot be imported.
+    """
+
+
+class NodeTypeInfo(object):
+    """
+    What the palette knows of a type without importing it.
+
+    The inputs and outputs are lists of [name, connectionLimit, dataType],
+    None while the schema is unknown.
+    """
+
+    __slots__ = ('typeName', 'target', 'label', 'category', 'inputs',
+                 'outputs', 'source')
+
+    def __init__(self, typeName, target, label=None, category=None,
+                 inputs=None, outputs=None, source=None):
+        self.typeName = typeName
+        self.target = target
+        self.label = label or typeName
+        self.category = category
+        self.inputs = inputs
+        self.outputs = outputs
+        # module file the schema was read from, None for entry points whose
+        # module was not found.
+        self.source = source
+
+    def __repr__(self):
+        return 'NodeTypeInfo(\'{}\', \'{}\')'.format(self.typeName,
+                                                     self.target)
+
+    @property
+    def moduleName(self):
+        return self.target.partition(':')[0]
+
+    @property
+    def className(self):
+        return self.target.partition(':')[2]
+
+    def hasSchema(self):
+        return self.inputs is not None and self.outputs is not None
+
+    def toRecord(self):
+        return [self.typeName, self.target, self.label, self.category,
+                self.inputs, self.outputs]
+
+    @classmethod
+    def fromRecord(cls, record, source=None):
+        typeName, target, label, category, inputs, outputs = record
+        return cls(typeName, target, label, category, inputs, outputs, source)
+
+
+def nodeTypeName(item):
+    """
+    Returns the type name of a node item: the nodeType attribute set by
+    NodeTypeRegistry.create() or in the body of its class, not inherited,
+    else the class name.
+    """
+    typeName = vars(item).get('nodeType')
+    if typeName:
+        return typeName
+    cls = type(item)
+    return vars(cls).get('nodeType') or cls.__name__
+
+
+def _literal(node):
+    # the value of a literal expression, raises ValueError otherwise.
+    return ast.literal_eval(node)
+
+
+def _portCall(call):
+    # [name, connectionLimit, dataType] of a literal port call.
+    values = list(_PORT_DEFAULTS)
+    for idx, arg in enumerate(call.args):
+        values[idx] = _literal(arg)
+    for keyword in call.keywords:
+        values[_PORT_ARGS.index(keyword.arg)] = _literal(keyword.value)
+    return values
+
+
+def _initPorts(function, methods):
+    """
+    Returns the {'inputs': [...], 'outputs': [...]} ports added by an
+    __init__, None when they depend on the run time or may be added by one
+    of the class "methods".
+    """
+    ports = {'inputs': [], 'outputs': []}
+    # statements whose body runs once, the others make the schema dynamic.
+    stack = list(reversed(function.body))
+    while stack:
+        statement = stack.pop()
+        if isinstance(statement, ast.With):
+            stack.extend(reversed(statement.body))
+            continue
+        for node in ast.walk(statement):
+            if not isinstance(node, ast.Call) or \
+                    not isinstance(node.func, ast.Attribute):
+                continue
+            if node.func.attr in methods:
+                return None
+            if node.func.attr not in _PORT_CALLS:
+                continue
+            if not isinstance(statement, ast.Expr) or \
+                    statement.value is not node:
+                return None
+            if not isinstance(node.func.value, ast.Name) or \
+                    node.func.value.id != 'self':
+                return None
+            try:
+                port = _portCall(node)
+            except (ValueError, IndexError, TypeError):
+                # computed arguments or **kwargs.
+                return None
+            ports[_PORT_CALLS[node.func.attr]].append(port)
+    return ports
+
+
+def _baseName(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def scanSource(source, moduleName, baseNames=BASE_NAMES):
+    """
+    Find the node classes of a module source without running it.
+
+    Args:
+        source (str): python source.
+        moduleName (str): name the module is imported with.
+        baseNames (iterable[str]): names of the node base classes.
+
+    Returns:
+        list[NodeTypeInfo]: the top level classes deriving, in the module,
+        from one of the bases.
+    """
+    tree = ast.parse(source)
+    nodeClasses = set(baseNames)
+    # class name: ports, None when dynamic, missing for the bases.
+    ports = {}
+    # class name: names of the methods defined in the module and the
+    # literal class attributes.
+    methods = {}
+    classAttrs = {}
+    result = []
+    for statement in tree.body:
+        if not isinstance(statement, ast.ClassDef):
+            continue
+        bases = [_baseName(base) for base in statement.bases]
+        nodeBases = [base for base in bases if base in nodeClasses]
+        if not nodeBases:
+            continue
+        nodeClasses.add(statement.name)
+        attrs = {}
+        init = None
+        classMethods = set()
+        for base in reversed(nodeBases):
+            classMethods.update(methods.get(base, ()))
+            attrs.update(classAttrs.get(base, {}))
+        # a type name is not inherited, see NodeTypeRegistry.registerClass().
+        attrs.pop('nodeType', None)
+        for item in statement.body:
+            if isinstance(item, ast.FunctionDef):
+                classMethods.add(item.name)
+                if item.name == '__init__':
+                    init = item
+            elif isinstance(item, ast.Assign) and len(item.targets) == 1 \
+                    and isinstance(item.targets[0], ast.Name):
+                try:
+                    attrs[item.targets[0].id] = _literal(item.value)
+                except (ValueError, TypeError):
+                    pass
+        # ports of the first node base, a base outside of the module may
+        # add ports of its own.
+        base = nodeBases[0]
+        if base in baseNames:
+            inherited = {'inputs': [], 'outputs': []}
+        else:
+            inherited = ports.get(base)
+        methods[statement.name] = classMethods
+        classAttrs[statement.name] = attrs
+        if init is None or inherited is None:
+            classPorts = inherited if init is None else None
+        else:
+            classPorts = _initPorts(init, classMethods - set(['__init__']))
+            if classPorts is not None:
+                classPorts = dict((key, inherited[key] + classPorts[key])
+                                  for key in classPorts)
+        ports[statement.name] = classPorts
+        info = NodeTypeInfo(
+            attrs.get('nodeType') or statement.name,
+            '{}:{}'.format(moduleName, statement.name),
+            attrs.get('label'), attrs.get('category'))
+        if classPorts is not None:
+            info.inputs = classPorts['inputs']
+            info.outputs = classPorts['outputs']
+        result.append(info)
+    return result
+
+
+def findSource(moduleName, paths=None):
+    """
+    Returns the source file of a module found on sys.path without importing
+    it or its packages, None when it is not a plain source file.
+    """
+    parts = moduleName.split('.')
+    for root in (sys.path if paths is None else paths):
+        base = os.path.join(root or os.curdir, *parts)
+        for path in (base + '.py', os.path.join(base, '__init__.py')):
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return [stat.st_mtime, stat.st_size]
+
+
+def _entryPoints(group):
+    # (name, value) of the installed entry points of a group.
+    try:
+        from importlib import metadata
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return []
+        return [(ep.name, '{}:{}'.format(ep.module_name, '.'.join(ep.attrs)))
+                for ep in pkg_resources.iter_entry_points(group)]
+    entryPoints = metadata.entry_points()
+    if hasattr(entryPoints, 'select'):
+        selected = entryPoints.select(group=group)
+    else:
+        selected = entryPoints.get(group, [])
+    return [(ep.name, ep.value) for ep in selected]
+
+
+class NodeTypeRegistry(object):
+    """
+    Node types known by name, their classes imported on first use.
+
+    Args:
+        cachePath (str): JSON file of the schemas, see save().  Nothing is
+            cached when None.
+        baseNames (iterable[str]): names of the node base classes looked
+            for by discoverModules().
+    """
+
+    def __init__(self, cachePath=None, baseNames=BASE_NAMES):
+        self.cachePath = cachePath
+        self.baseNames = tuple(baseNames)
+        self._types = {}
+        self._classes = {}
+        # source path: [stamp, moduleName, [type records]]
+        self._files = {}
+        self._dirty = False
+        # lower case search text of the types, built on first search.
+        self._texts = None
+        self.parsedFiles = 0
+        self.cachedFiles = 0
+        if cachePath is not None:
+            self._readCache()
+
+    def __contains__(self, typeName):
+        return typeName in self._types
+
+    def __len__(self):
+        return len(self._types)
+
+    def _readCache(self):
+        try:
+            with open(self.cachePath) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if data.get('format') != CACHE_FORMAT or \
+                data.get('version') != CACHE_VERSION:
+            return
+        self._files = data.get('files', {})
+
+    def save(self):
+        """
+        Write the schema cache when something new was parsed or learned,
+        the file is replaced atomically.
+        """
+        if self.cachePath is None or not self._dirty:
+            return
+        folder = os.path.dirname(os.path.abspath(self.cachePath))
+        handle, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as f:
+                json.dump({'format': CACHE_FORMAT, 'version': CACHE_VERSION,
+                           'files': self._files}, f, separators=(',', ':'))
+            if os.path.exists(self.cachePath) and sys.platform == 'win32':
+                os.remove(self.cachePath)
+            os.rename(tmp, self.cachePath)
+        except (IOError, OSError):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._dirty = False
+
+    def _add(self, info):
+        self._types[info.typeName] = info
+        self._texts = None
+
+    def register(self, typeName, target, label=None, category=None,
+                 inputs=None, outputs=None):
+        """
+        Register a type by its "module:Class" target, nothing is imported.
+        """
+        self._add(NodeTypeInfo(typeName, target, label, category, inputs,
+                               outputs))
+
+    def registerClass(self, cls, typeName=None, label=None, category=None):
+        """
+        Register a class already imported, the schema is taken from the
+        first instance.
+        """
+        typeName = typeName or vars(cls).get('nodeType') or cls.__name__
+        self.register(
+            typeName, '{}:{}'.format(cls.__module__, cls.__name__),
+            label or getattr(cls, 'label', None),
+            category or getattr(cls, 'category', None))
+        self._classes[typeName] = cls
+
+    def _scanFile(self, path, moduleName):
+        # the types of a module file, parsed only when it changed.
+        path = os.path.abspath(path)
+        try:
+            stamp = _stamp(path)
+        except OSError:
+            return []
+        entry = self._files.get(path)
+        if entry is not None and entry[0] == stamp and entry[1] == moduleName:
+            self.cachedFiles += 1
+            return [NodeTypeInfo.fromRecord(r, path) for r in entry[2]]
+        try:
+            with open(path) as f:
+                infos = scanSource(f.read(), moduleName, self.baseNames)
+        except (IOError, SyntaxError, UnicodeDecodeError):
+            infos = []
+        self.parsedFiles += 1
+        self._files[path] = [stamp, moduleName,
+                             [info.toRecord() for info in infos]]
+        self._dirty = True
+        for info in infos:
+            info.source = path
+        return infos
+
+    def discoverModules(self, path, package=None):
+        """
+        Register the node classes of the modules of a directory.
+
+        Args:
+            path (str): directory of the modules, searched recursively, or
+                a single module file.
+            package (str): package the directory is imported as, None when
+                the directory itself is on sys.path (it is added to it).
+
+        Returns:
+            list[str]: the type names found.
+        """
+        start = clock() if profiler.enabled else None
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            folder, files = os.path.dirname(path), [path]
+        else:
+            folder, files = path, []
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.') and
+                                 os.path.isfile(os.path.join(root, d,
+                                                             '__init__.py')))
+                files.extend(os.path.join(root, name) for name in
+                             sorted(names) if name.endswith('.py'))
+        if package is None and folder not in sys.path:
+            sys.path.append(folder)
+        found = []
+        for filePath in files:
+            parts = os.path.relpath(filePath, folder)[:-3].split(os.sep)
+            if parts[-1] == '__init__':
+                parts.pop()
+            if package:
+                parts.insert(0, package)
+            if not parts:
+                continue
+            for info in self._scanFile(filePath, '.'.join(parts)):
+                self._add(info)
+                found.append(info.typeName)
+        if start is not None:
+            profiler.addTime('NodeTypeRegistry.discover', clock() - start)
+        return found
+
+    def discoverPackage(self, packageName):
+        """
+        Register the node classes of an installed package, found on
+        sys.path without importing it.
+        """
+        path = findSource(packageName)
+        if path is None:
+            raise NodeTypeError('package not found: {}'.format(packageName))
+        if os.path.basename(path) == '__init__.py':
+            return self.discoverModules(os.path.dirname(path), packageName)
+        return self.discoverModules(path,
+                                    packageName.rpartition('.')[0] or None)
+
+    def discoverEntryPoints(self, group=ENTRY_POINT_GROUP):
+        """
+        Register the types declared as entry points, their schema is read
+        from the module source when it is found on sys.path.
+
+        Returns:
+            list[str]: the type names found.
+        """
+        start = clock() if profiler.enabled else None
+        found = []
+        for typeName, target in _entryPoints(group):
+            moduleName, _, className = target.partition(':')
+            info = None
+            path = findSource(moduleName)
+            if path is not None:
+                for scanned in self._scanFile(path, moduleName):
+                    if scanned.target == target:
+                        info = scanned
+            if info is None:
+                info = NodeTypeInfo(typeName, target, source=path)
+            info.typeName = typeName
+            self._add(info)
+            found.append(typeName)
+        if start is not None:
+            profiler.addTime('NodeTypeRegistry.discover', clock() - start)
+        return found
+
+    def info(self, typeName):
+        info = self._types.get(typeName)
+        if info is None:
+            raise NodeTypeError('unknown node type: {}'.format(typeName))
+        return info
+
+    def types(self, category=None):
+        """
+        Returns the NodeTypeInfos sorted by label, of one category if given.
+        """
+        infos = [info for info in self._types.values()
+                 if category is None or info.category == category]
+        return sorted(infos, key=lambda info: (info.label.lower(),
+                                               info.typeName))
+
+    def categories(self):
+        return sorted(set(info.category for info in self._types.values()
+                          if info.category))
+
+    def search(self, query, limit=None):
+        """
+        Find the types whose name, label, category or port names contain
+        every word of a query, case insensitive.  Labels starting with the
+        query come first.
+
+        Returns:
+            list[NodeTypeInfo]
+        """
+        texts = self._texts
+        if texts is None:
+            texts = self._texts = {}
+            for info in self._types.values():
+                words = [info.typeName, info.label, info.category or '']
+                for port in (info.inputs or []) + (info.outputs or []):
+                    words.append(port[0] or '')
+                texts[info.typeName] = ' '.join(words).lower()
+        tokens = query.lower().split()
+        found = [self._types[typeName] for typeName, text in texts.items()
+                 if all(token in text for token in tokens)]
+        query = query.strip().lower()
+        found.sort(key=lambda info: (not info.label.lower().startswith(query),
+                                     info.label.lower(), info.typeName))
+        if limit is not None:
+            del found[limit:]
+        return found
+
+    def isLoaded(self, typeName):
+        return typeName in self._classes
+
+    def load(self, typeName):
+        """
+        Returns the class of a type, its module is imported the first time.
+        """
+        cls = self._classes.get(typeName)
+        if cls is not None:
+            return cls
+        info = self.info(typeName)
+        start = clock() if profiler.enabled else None
+        try:
+            module = importlib.import_module(info.moduleName)
+            cls = getattr(module, info.className)
+        except (ImportError, AttributeError) as error:
+            raise NodeTypeError('cannot load {} from {}: {}'.format(
+                typeName, info.target, error))
+        if start is not None:
+            profiler.addTime('NodeTypeRegistry.load', clock() - start)
+        self._classes[typeName] = cls
+        return cls
+
+    def create(self, typeName, name=None):
+        """
+        Make an item of a type, the class is loaded if needed.
+
+        Args:
+            typeName (str): registered type.
+            name (str): node name, the class default when None.
+
+        Returns:
+            NodeItem: the item, its nodeType set to the type name.
+        """
+        cls = self.load(typeName)
+        item = cls() if name is None else cls(name)
+        item.nodeType = typeName
+        if hasattr(item, 'portSchema'):
+            self._learnSchema(self._types[typeName], item.portSchema())
+        return item
+
+    def _learnSchema(self, info, schema):
+        # the ports of an instance replace a schema read from the source.
+        inputs = [list(port) for port in schema[0]]
+        outputs = [list(port) for port in schema[1]]
+        if inputs == info.inputs and outputs == info.outputs:
+            return
+        info.inputs, info.outputs = inputs, outputs
+        self._texts = None
+        entry = self._files.get(info.source)
+        if entry is None:
+            return
+        for record in entry[2]:
+            if record[1] == info.target:
+                record[4], record[5] = info.inputs, info.outputs
+                self._dirty = True
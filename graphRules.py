@@ -0,0 +1,202 @@
+#!/usr/bin/python
+"""
+Connection rules.
+
+ConnectionRules holds the port data types and the implicit conversions
+between them, the transitive closure of the conversions is precomputed so a
+compatibility check is a dict and set lookup.  A port without a data type
+connects to anything.
+
+TopologicalIndex keeps a topological order of the nodes of a GraphModel up
+to date as edges are added (Pearce-Kelly), an edge going forward in the
+order can never close a cycle so most checks do not walk the graph at all,
+and the others only search the nodes between the two ends.  Qt is not
+required.
+"""
+from graphEvaluator import topologicalSort, GraphCycleError
+
+
+class ConnectionRules(object):
+    """
+    Data types and the implicit conversions allowed between them.
+
+    Example:
+        rules = ConnectionRules()
+        rules.addConversion('int', 'float')
+        rules.addConversion('float', 'string')
+        rules.isCompatible('int', 'string')  # True
+    """
+
+    def __init__(self):
+        self._conversions = {}
+        self._matrix = None
+
+    def addConversion(self, fromType, toType):
+        """
+        Allow an output of "fromType" to feed an input of "toType".
+        """
+        self._conversions.setdefault(fromType, set()).add(toType)
+        self._matrix = None
+
+    def removeConversion(self, fromType, toType):
+        self._conversions.get(fromType, set()).discard(toType)
+        self._matrix = None
+
+    def _buildMatrix(self):
+        matrix = {}
+        for fromType in self._conversions:
+            reached = set([fromType])
+            stack = [fromType]
+            while stack:
+                for toType in self._conversions.get(stack.pop(), ()):
+                    if toType not in reached:
+                        reached.add(toType)
+                        stack.append(toType)
+            matrix[fromType] = frozenset(reached)
+        self._matrix = matrix
+        return matrix
+
+    def compatibleTypes(self, outType):
+        """
+        Returns the set of input types an output of "outType" can feed.
+        """
+        matrix = self._matrix
+        if matrix is None:
+            matrix = self._buildMatrix()
+        return matrix.get(outType, frozenset([outType]))
+
+    def isCompatible(self, outType, inType):
+        if outType is None or inType is None or outType == inType:
+            return True
+        matrix = self._matrix
+        if matrix is None:
+            matrix = self._buildMatrix()
+        return inType in matrix.get(outType, ())
+
+
+class TopologicalIndex(object):
+    """
+    Topological order of the nodes of a GraphModel kept up to date from
+    the model changeCallbacks.
+
+    If the model gets a cycle anyway (GraphModel.connect() does not check
+    the rules) the index turns invalid and the checks walk the graph until
+    the cycle is removed.
+
+    Args:
+        model (GraphModel): the graph.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._order = {}
+        self._next = 0
+        self._valid = True
+        self.rebuild()
+        model.changeCallbacks.append(self._modelChanged)
+
+    def close(self):
+        """
+        Stop listening to the model.
+        """
+        if self._modelChanged in self.model.changeCallbacks:
+            self.model.changeCallbacks.remove(self._modelChanged)
+
+    def rebuild(self):
+        """
+        Recompute the order from scratch, returns True when the graph is
+        acyclic.
+        """
+        try:
+            order = topologicalSort(self.model)
+        except GraphCycleError:
+            self._valid = False
+            return False
+        self._order = dict((nodeId, idx) for idx, nodeId in enumerate(order))
+        self._next = len(order)
+        self._valid = True
+        return True
+
+    def isValid(self):
+        return self._valid
+
+    def order(self, nodeId):
+        return self._order.get(nodeId)
+
+    def _modelChanged(self, kind, record):
+        if kind == 'addNode':
+            self._order[record.id] = self._next
+            self._next += 1
+        elif kind == 'removeNode':
+            self._order.pop(record.id, None)
+        elif kind == 'connect':
+            if self._valid:
+                model = self.model
+                self._addEdge(model.port(record.outPortId).nodeId,
+                              model.port(record.inPortId).nodeId)
+        elif kind == 'disconnect':
+            if not self._valid:
+                self.rebuild()
+        elif kind == 'clear':
+            self._order.clear()
+            self._next = 0
+            self._valid = True
+
+    def _search(self, start, step, inside):
+        # nodes reachable from start through "step" staying inside bounds.
+        found = set([start])
+        stack = [start]
+        while stack:
+            for nodeId in step(stack.pop()):
+                if nodeId not in found and inside(self._order[nodeId]):
+                    found.add(nodeId)
+                    stack.append(nodeId)
+        return found
+
+    def _addEdge(self, outNodeId, inNodeId):
+        order = self._order
+        lower, upper = order[inNodeId], order[outNodeId]
+        if lower > upper:
+            return
+        model = self.model
+        forward = self._search(inNodeId, model.downstreamNodes,
+                               lambda idx: idx <= upper)
+        if outNodeId in forward:
+            self._valid = False
+            return
+        backward = self._search(outNodeId, model.upstreamNodes,
+                                lambda idx: idx >= lower)
+        # the upstream part moves before the downstream part, reusing the
+        # same order slots.
+        nodes = sorted(backward, key=order.get) + sorted(forward, key=order.get)
+        slots = sorted(order[n] for n in nodes)
+        for nodeId, slot in zip(nodes, slots):
+            order[nodeId] = slot
+
+    def wouldCreateCycle(self, outNodeId, inNodeId):
+        """
+        Returns True when an edge from outNodeId to inNodeId closes a cycle.
+        """
+        if outNodeId == inNodeId:
+            return True
+        if not self._valid:
+            return outNodeId in self._search(
+                inNodeId, self.model.downstreamNodes, lambda idx: True)
+        upper = self._order[outNodeId]
+        if self._order[inNodeId] > upper:
+            return False
+        return outNodeId in self._search(
+            inNodeId, self.model.downstreamNodes, lambda idx: idx <= upper)
+
+    def ancestors(self, nodeId):
+        """
+        Returns the node and every node feeding it.
+        """
+        return self._search(nodeId, self.model.upstreamNodes, lambda idx: True)
+
+    def descendants(self, nodeId):
+        """
+        Returns the node and every node it feeds.
+        """
+        return self._search(
+            nodeId, self.model.downstreamNodes, lambda idx: True)
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+"""
+Qt front end of the GraphScheduler.
+
+GraphRunner drives a scheduler from the GUI thread: completed futures are
+handed over through a queued signal so the NodeViewer never blocks and
+every progress signal is emitted in the GUI thread.
+"""
+from PySide import QtCore
+
+from graphScheduler import GraphScheduler
+
+
+class _QtScheduler(GraphScheduler):
+
+    def __init__(self, runner, *args, **kwargs):
+        super(_QtScheduler, self).__init__(*args, **kwargs)
+        self._runner = runner
+
+    def _futureDone(self, future):
+        self._runner._futureCompleted.emit(future)
+
+    # the futures go through the Qt event loop, never the done queue the
+    # blocking calls read.
+    def run(self, nodeIds=None, timeout=None):
+        raise RuntimeError('a GraphRunner cannot block, call start() and '
+                           'wait for its finished signal')
+
+    def wait(self, timeout=None):
+        raise RuntimeError('a GraphRunner cannot block, wait for its '
+                           'finished signal')
+
+
+class GraphRunner(QtCore.QObject):
+    """
+    Runs the dirty nodes of a GraphEvaluator in the background.
+
+    Args:
+        evaluator (GraphEvaluator): evaluator to run.
+        maxThreads (int): size of the thread pool.
+        maxProcesses (int): size of the process pool.
+        defaultAffinity (str): affinity of nodes without a hint.
+        parent (QtCore.QObject): parent object.
+    """
+
+    nodeStarted = QtCore.Signal(int)
+    nodeFinished = QtCore.Signal(int)
+    nodeFailed = QtCore.Signal(int, str)
+    progress = QtCore.Signal(int, int)
+    finished = QtCore.Signal()
+    cancelled = QtCore.Signal()
+
+    _futureCompleted = QtCore.Signal(object)
+
+    def __init__(self, evaluator, maxThreads=None, maxProcesses=None,
+                 defaultAffinity='thread', parent=None):
+        super(GraphRunner, self).__init__(parent)
+        self.scheduler = _QtScheduler(
+            self, evaluator, maxThreads, maxProcesses, defaultAffinity)
+        self.scheduler.startedCallbacks.append(self.nodeStarted.emit)
+        self.scheduler.finishedCallbacks.append(self.nodeFinished.emit)
+        self.scheduler.progressCallbacks.append(self.progress.emit)
+        self.scheduler.failedCallbacks.append(self._nodeFailed)
+        self.scheduler.doneCallbacks.append(self.finished.emit)
+        self.scheduler.cancelledCallbacks.append(self.cancelled.emit)
+        self._futureCompleted.connect(
+            self.scheduler.processFuture, QtCore.Qt.QueuedConnection)
+
+    def _nodeFailed(self, nodeId, error):
+        self.nodeFailed.emit(nodeId, str(error))
+
+    def isRunning(self):
+        return self.scheduler.isRunning()
+
+    def start(self, nodeIds=None):
+        """
+        Start computing, see GraphScheduler.start().
+        """
+        return self.scheduler.start(nodeIds)
+
+    def cancel(self):
+        self.scheduler.cancel()
+
+    def shutdown(self, wait=True):
+        self.scheduler.shutdown(wait)
@@ -0,0 +1,296 @@
+#!/usr/bin/python
+"""
+Parallel execution of a GraphEvaluator.
+
+The scheduler computes the dirty nodes of a graph on concurrent.futures
+pools, a node is submitted as soon as all the nodes feeding it are done so
+independent branches run at the same time.
+
+Each node has an affinity picking where its compute function runs:
+
+    'thread'   thread pool, for I/O bound work or code releasing the GIL.
+    'process'  process pool, for GIL bound python work.  The compute
+               function, node and inputs must be picklable, so the function
+               has to be defined at module level.
+    'main'     inline in the thread driving the scheduler.
+
+Changing the graph structure or a node attribute while a run is active
+cancels it.
+
+Nodes found in the result cache of the evaluator are completed without
+being submitted, see GraphEvaluator.setResultCache().
+"""
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from concurrent import futures
+
+from graphEvaluator import topologicalSort
+
+AFFINITIES = ('thread', 'process', 'main')
+
+
+def _runCompute(func, node, inputs):
+    if func is None:
+        return None
+    return func(node, inputs)
+
+
+class GraphScheduler(object):
+    """
+    Runs the dirty nodes of a GraphEvaluator on thread and process pools.
+
+    Functions in the callback lists are called from the thread driving the
+    scheduler (the one calling start/wait/processFuture):
+
+        startedCallbacks    cb(nodeId)
+        finishedCallbacks   cb(nodeId)
+        progressCallbacks   cb(doneCount, totalCount)
+        failedCallbacks     cb(nodeId, exception)
+        doneCallbacks       cb()  the whole run completed.
+        cancelledCallbacks  cb()
+
+    Args:
+        evaluator (GraphEvaluator): evaluator holding the compute functions
+            and receiving the results.
+        maxThreads (int): size of the thread pool.
+        maxProcesses (int): size of the process pool.
+        defaultAffinity (str): affinity of nodes without a hint.
+    """
+
+    def __init__(self, evaluator, maxThreads=None, maxProcesses=None,
+                 defaultAffinity='thread'):
+        self.evaluator = evaluator
+        self.model = evaluator.model
+        self.maxThreads = maxThreads
+        self.maxProcesses = maxProcesses
+        self.defaultAffinity = defaultAffinity
+        self._typeAffinities = {}
+        self._executors = {}
+        self._futures = {}
+        self._doneQueue = queue.Queue()
+        self._ready = []
+        self._waiting = {}
+        self._total = 0
+        self._done = 0
+        self._generation = 0
+        self._active = False
+        self.startedCallbacks = []
+        self.finishedCallbacks = []
+        self.progressCallbacks = []
+        self.failedCallbacks = []
+        self.doneCallbacks = []
+        self.cancelledCallbacks = []
+
+    def isRunning(self):
+        return self._active
+
+    def setTypeAffinity(self, nodeType, affinity):
+        """
+        Set the affinity hint of every node of a type.
+
+        Args:
+            nodeType (str): node type.
+            affinity (str): 'thread', 'process' or 'main'.
+        """
+        if affinity not in AFFINITIES:
+            raise ValueError('invalid affinity: {}'.format(affinity))
+        self._typeAffinities[nodeType] = affinity
+
+    def setNodeAffinity(self, nodeId, affinity):
+        """
+        Set the affinity hint of a single node, stored as the "affinity"
+        node attribute without marking the node dirty.
+        """
+        if affinity not in AFFINITIES:
+            raise ValueError('invalid affinity: {}'.format(affinity))
+        node = self.model.node(nodeId)
+        if node.attrs is None:
+            node.attrs = {}
+        node.attrs['affinity'] = affinity
+
+    def affinity(self, nodeId):
+        affinity = self.model.attr(nodeId, 'affinity')
+        if affinity is None:
+            affinity = self._typeAffinities.get(
+                self.model.node(nodeId).nodeType, self.defaultAffinity)
+        return affinity
+
+    def _executor(self, affinity):
+        executor = self._executors.get(affinity)
+        if executor is None:
+            if affinity == 'process':
+                executor = futures.ProcessPoolExecutor(self.maxProcesses)
+            else:
+                executor = futures.ThreadPoolExecutor(self.maxThreads)
+            self._executors[affinity] = executor
+        return executor
+
+    def shutdown(self, wait=True):
+        """
+        Cancel the run and stop the worker pools.
+        """
+        self.cancel()
+        for executor in self._executors.values():
+            executor.shutdown(wait)
+        self._executors.clear()
+
+    def start(self, nodeIds=None):
+        """
+        Start computing the dirty nodes, returns without waiting.
+
+        Args:
+            nodeIds (list[int]): nodes whose dirty dependencies are computed,
+                every dirty node of the graph when None.
+
+        Returns:
+            int: the number of nodes to compute.
+        """
+        self.cancel()
+        evaluator, model = self.evaluator, self.model
+        if nodeIds is None:
+            plan = [n for n in topologicalSort(model) if evaluator.isDirty(n)]
+        else:
+            plan = evaluator.dirtyUpstream(nodeIds)
+        planSet = set(plan)
+        self._waiting = {}
+        for nodeId in plan:
+            self._waiting[nodeId] = len(
+                [n for n in model.upstreamNodes(nodeId) if n in planSet])
+        self._ready = [n for n in reversed(plan) if not self._waiting[n]]
+        self._total = len(plan)
+        self._done = 0
+        if not plan:
+            for cb in self.doneCallbacks:
+                cb()
+            return 0
+        self._active = True
+        model.changeCallbacks.append(self._modelChanged)
+        self._pump()
+        return self._total
+
+    def run(self, nodeIds=None, timeout=None):
+        """
+        Compute the dirty nodes and block until they are done.
+
+        Returns:
+            bool: True when the run completed.
+        """
+        self.start(nodeIds)
+        return self.wait(timeout)
+
+    def wait(self, timeout=None):
+        """
+        Process completed nodes until the run is over.
+
+        Returns:
+            bool: True when the run completed, False if it was cancelled,
+            failed or timed out.
+        """
+        while self._active and self._futures:
+            try:
+                future = self._doneQueue.get(timeout=timeout)
+            except queue.Empty:
+                return False
+            self.processFuture(future)
+        return not self._active and self._done == self._total
+
+    def cancel(self):
+        """
+        Cancel the active run, results of nodes still running are dropped.
+        """
+        if not self._active:
+            return
+        self._generation += 1
+        self._active = False
+        for future in self._futures:
+            future.cancel()
+        self._futures.clear()
+        self._ready = []
+        self._waiting = {}
+        if self._modelChanged in self.model.changeCallbacks:
+            self.model.changeCallbacks.remove(self._modelChanged)
+        for cb in self.cancelledCallbacks:
+            cb()
+
+    def _modelChanged(self, kind, record):
+        if kind in ('connect', 'disconnect', 'attr', 'removeNode', 'clear'):
+            self.cancel()
+
+    def _pump(self):
+        evaluator, model = self.evaluator, self.model
+        while self._ready and self._active:
+            nodeId = self._ready.pop()
+            if evaluator.loadCachedResult(nodeId):
+                for cb in self.startedCallbacks:
+                    cb(nodeId)
+                self._complete(nodeId, evaluator.cachedResult(nodeId))
+                continue
+            func = evaluator.computeFunction(nodeId)
+            inputs = evaluator.gatherInputs(nodeId)
+            for cb in self.startedCallbacks:
+                cb(nodeId)
+            affinity = self.affinity(nodeId)
+            if func is None or affinity == 'main':
+                try:
+                    result = _runCompute(func, model.node(nodeId), inputs)
+                except Exception as e:
+                    self._fail(nodeId, e)
+                    return
+                self._complete(nodeId, result)
+                continue
+            future = self._executor(affinity).submit(
+                _runCompute, func, model.node(nodeId), inputs)
+            self._futures[future] = (self._generation, nodeId)
+            future.add_done_callback(self._futureDone)
+
+    def _futureDone(self, future):
+        # called from the worker thread, hand the future over to the
+        # thread driving the scheduler.
+        self._doneQueue.put(future)
+
+    def processFuture(self, future):
+        """
+        Store the result of a finished future and submit the nodes it was
+        blocking, must be called from the thread driving the scheduler.
+        """
+        info = self._futures.pop(future, None)
+        if info is None or info[0] != self._generation or future.cancelled():
+            return
+        nodeId = info[1]
+        error = future.exception()
+        if error is not None:
+            self._fail(nodeId, error)
+            return
+        self._complete(nodeId, future.result())
+        self._pump()
+
+    def _complete(self, nodeId, result):
+        try:
+            self.evaluator.storeResult(nodeId, result)
+        except Exception as e:
+            self._fail(nodeId, e)
+            return
+        self._done += 1
+        del self._waiting[nodeId]
+        for child in self.model.downstreamNodes(nodeId):
+            if child in self._waiting:
+                self._waiting[child] -= 1
+                if not self._waiting[child]:
+                    self._ready.append(child)
+        for cb in self.finishedCallbacks:
+            cb(nodeId)
+        for cb in self.progressCallbacks:
+            cb(self._done, self._total)
+        if self._done == self._total:
+            self._active = False
+            self.model.changeCallbacks.remove(self._modelChanged)
+            for cb in self.doneCallbacks:
+                cb()
+
+    def _fail(self, nodeId, error):
+        for cb in self.failedCallbacks:
+            cb(nodeId, error)
+        self.cancel()
@@ -0,0 +1,365 @@
+#!/usr/bin/python
+"""
+Search index over the node names and port labels of a GraphModel.
+
+Every name is lower cased and split into terms, the index keeps:
+
+    - the sorted list of the node names, the names equal to or starting
+      with the query rank first and are found by bisection.
+    - the sorted list of terms, a query shorter than three characters is a
+      term prefix found by bisection.
+    - the nodes of every trigram of the names, a longer query intersects
+      the nodes of its two rarest trigrams and only checks the remaining
+      nodes against the names.
+    - the words of the padded trigrams of every term, a query word of four
+      characters or more also matches the words sharing most of its
+      trigrams, which finds names with a typo.
+
+The index follows the model changeCallbacks so adding, removing or renaming
+nodes and ports only reindexes the nodes involved.  Qt is not required.
+
+On 100k nodes (benchmarks/benchSearch.py) single short words answer in
+well under a millisecond and longer words, substrings and typos in 1 to
+4 ms.  Several common words are the slowest query shape, their node sets
+are intersected: 5 to 8 ms.  Building the index takes several seconds.
+
+    index = SearchIndex(model)
+    index.search('blur in', limit=50)
+"""
+import bisect
+import collections
+import re
+
+# number of words starting with a short query word above which the nodes of
+# the words are not gathered, the candidates are checked one by one instead.
+PREFIX_TERM_LIMIT = 2000
+# nodes of the rarest trigram of a query word below which the candidates are
+# checked against the names rather than intersected with the next trigram.
+INTERSECT_MIN = 64
+
+_SPLIT = re.compile(r'[^0-9a-z]+')
+
+
+def _trigrams(text):
+    return {text[idx:idx + 3] for idx in range(len(text) - 2)}
+
+
+def _words(text):
+    words = set(_SPLIT.split(text))
+    words.discard('')
+    return words
+
+
+class SearchIndex(object):
+    """
+    Incremental node search of a GraphModel.
+
+    Args:
+        model (GraphModel): the graph.
+        fuzzy (float): trigram similarity (Dice coefficient) a word with a
+            typo must have with a query word of four characters or more,
+            0 turns the fuzzy matches off.
+    """
+
+    def __init__(self, model, fuzzy=0.5):
+        self.model = model
+        self.fuzzy = fuzzy
+        self.rebuild()
+        model.changeCallbacks.append(self._modelChanged)
+
+    def close(self):
+        """
+        Stop listening to the model.
+        """
+        if self._modelChanged in self.model.changeCallbacks:
+            self.model.changeCallbacks.remove(self._modelChanged)
+
+    def __len__(self):
+        return len(self._texts)
+
+    def rebuild(self):
+        """
+        Index every node of the model from scratch.
+        """
+        # nodeId: (lower case name, lower case port labels, words, first one
+        # and two characters of the words)
+        self._texts = {}
+        self._nodeGrams = {}
+        # trigram: set of nodeIds
+        self._grams = collections.defaultdict(set)
+        # word: set of nodeIds, the sorted words and the words of the
+        # padded trigrams used by the fuzzy matches.
+        self._terms = {}
+        self._sortedTerms = []
+        self._termGrams = {}
+        # sorted (lower case name, nodeId)
+        self._names = []
+        # the sorted lists are sorted once at the end of a rebuild.
+        self._building = True
+        try:
+            for node in self.model.nodes():
+                self._add(node)
+        finally:
+            self._building = False
+        self._sortedTerms = sorted(self._terms)
+        self._names = sorted((texts[0], nodeId)
+                             for nodeId, texts in self._texts.items())
+
+    def _modelChanged(self, kind, record):
+        if kind in ('addNode', 'name'):
+            self._remove(record.id)
+            self._add(record)
+        elif kind in ('addPort', 'portName'):
+            self._remove(record.nodeId)
+            self._add(self.model.node(record.nodeId))
+        elif kind == 'removeNode':
+            self._remove(record.id)
+        elif kind == 'clear':
+            self.rebuild()
+
+    def _add(self, node):
+        model = self.model
+        name = (node.name or '').lower()
+        labels = tuple((model.port(portId).name or '').lower()
+                       for portId in node.inputs + node.outputs)
+        grams = _trigrams(name)
+        words = _words(name)
+        for label in labels:
+            grams.update(_trigrams(label))
+            words.update(_words(label))
+        heads = set(word[:1] for word in words)
+        heads.update(word[:2] for word in words)
+        self._texts[node.id] = (name, labels, frozenset(words),
+                                frozenset(heads))
+        if not self._building:
+            bisect.insort(self._names, (name, node.id))
+        self._nodeGrams[node.id] = grams
+        index = self._grams
+        for gram in grams:
+            index[gram].add(node.id)
+        for word in words:
+            nodes = self._terms.get(word)
+            if nodes is None:
+                nodes = self._terms[word] = set()
+                self._addTerm(word)
+            nodes.add(node.id)
+
+    def _addTerm(self, word):
+        if not self._building:
+            bisect.insort(self._sortedTerms, word)
+        for gram in _trigrams(' {} '.format(word)):
+            self._termGrams.setdefault(gram, set()).add(word)
+
+    def _removeTerm(self, word):
+        del self._terms[word]
+        terms = self._sortedTerms
+        idx = bisect.bisect_left(terms, word)
+        if idx < len(terms) and terms[idx] == word:
+            del terms[idx]
+        for gram in _trigrams(' {} '.format(word)):
+            words = self._termGrams[gram]
+            words.discard(word)
+            if not words:
+                del self._termGrams[gram]
+
+    def _remove(self, nodeId):
+        texts = self._texts.pop(nodeId, None)
+        if texts is None:
+            return
+        names = self._names
+        idx = bisect.bisect_left(names, (texts[0], nodeId))
+        if idx < len(names) and names[idx] == (texts[0], nodeId):
+            del names[idx]
+        for gram in self._nodeGrams.pop(nodeId):
+            nodes = self._grams[gram]
+            nodes.discard(nodeId)
+            if not nodes:
+                del self._grams[gram]
+        for word in texts[2]:
+            nodes = self._terms[word]
+            nodes.discard(nodeId)
+            if not nodes:
+                self._removeTerm(word)
+
+    def similarTerms(self, word):
+        """
+        Returns the indexed words close to "word" by trigram similarity.
+        """
+        grams = _trigrams(' {} '.format(word))
+        hits = {}
+        for gram in grams:
+            for term in self._termGrams.get(gram, ()):
+                hits[term] = hits.get(term, 0) + 1
+        result = set()
+        for term, shared in hits.items():
+            # padded words of n characters have n trigrams.
+            if 2.0 * shared / (len(grams) + len(term)) >= self.fuzzy:
+                result.add(term)
+        return result
+
+    def _prefixRange(self, prefix):
+        terms = self._sortedTerms
+        start = bisect.bisect_left(terms, prefix)
+        end = bisect.bisect_left(terms, prefix + u'\uffff', start)
+        return start, end
+
+    def _nameRange(self, prefix):
+        names = self._names
+        start = bisect.bisect_left(names, (prefix,))
+        end = bisect.bisect_left(names, (prefix + u'\uffff',), start)
+        return start, end
+
+    def _leadingMatches(self, query, checks, candidates, limit):
+        # the first "limit" matches named "query" or starting with it, by
+        # name: the best ranked ones whatever the candidates budget.
+        start, end = self._nameRange(query)
+        if isinstance(candidates, set) and len(candidates) < end - start:
+            texts = self._texts
+            named = sorted((texts[n][0], n) for n in candidates
+                           if texts[n][0].startswith(query))
+        else:
+            named = (self._names[idx] for idx in range(start, end))
+        found = []
+        for _, nodeId in named:
+            if self._matches(nodeId, checks):
+                found.append(nodeId)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def _candidates(self, token, fuzzyTerms):
+        # superset of the nodes matching a query word, None when too large
+        # to gather.
+        if len(token) < 3:
+            start, end = self._prefixRange(token)
+            if end - start > PREFIX_TERM_LIMIT:
+                return None
+            nodes = set()
+            for term in self._sortedTerms[start:end]:
+                nodes.update(self._terms[term])
+            return nodes
+        postings = []
+        for gram in _trigrams(token):
+            nodes = self._grams.get(gram)
+            if nodes is None:
+                postings = []
+                break
+            postings.append(nodes)
+        nodes = set()
+        if postings:
+            # the two rarest trigrams, checking the names against the query
+            # is cheaper than more intersections of large sets.
+            postings.sort(key=len)
+            nodes = postings[0]
+            if len(postings) > 1 and len(nodes) >= INTERSECT_MIN:
+                nodes = nodes & postings[1]
+        if fuzzyTerms:
+            nodes = set(nodes)
+            for term in fuzzyTerms:
+                nodes.update(self._terms[term])
+        return nodes
+
+    def _allCandidates(self, token):
+        # every node with a word starting with "token", lazily, a node may
+        # come once per matching word.
+        start, end = self._prefixRange(token)
+        for term in self._sortedTerms[start:end]:
+            for nodeId in self._terms[term]:
+                yield nodeId
+
+    def _matches(self, nodeId, checks):
+        name, labels, words, heads = self._texts[nodeId]
+        for token, fuzzyTerms in checks:
+            if len(token) < 3:
+                if token not in heads:
+                    return False
+            elif token not in name and \
+                    not any(token in label for label in labels):
+                if not (fuzzyTerms and not fuzzyTerms.isdisjoint(words)):
+                    return False
+        return True
+
+    def _rank(self, nodeId, query):
+        # exact name, name prefix, name substring, port label, fuzzy.
+        name, labels = self._texts[nodeId][:2]
+        if name == query:
+            return 0, name
+        if name.startswith(query):
+            return 1, name
+        if query in name:
+            return 2, name
+        if any(query in label for label in labels):
+            return 3, name
+        return 4, name
+
+    def search(self, query, limit=100):
+        """
+        Find the nodes matching every word of a query.
+
+        Args:
+            query (str): case insensitive text, a word of less than three
+                characters matches the start of a name or label word,
+                longer ones match anywhere in a name or label or, with a
+                typo, a whole word.
+            limit (int): maximum number of results, all when None.
+
+        Returns:
+            list[int]: node ids, exact names first, then names starting
+            with the query, containing it, port labels and typos.
+        """
+        tokens = query.lower().split()
+        if not tokens:
+            return []
+        checks = []
+        for token in tokens:
+            fuzzyTerms = None
+            if self.fuzzy and len(token) >= 4:
+                # words containing the token already match.
+                fuzzyTerms = set(term for term in self.similarTerms(token)
+                                 if token not in term)
+            checks.append((token, fuzzyTerms))
+        # a single short word is looked up lazily, gathering the nodes of
+        # its words only pays off to intersect them with other words.
+        sets = [self._candidates(token, fuzzyTerms)
+                for token, fuzzyTerms in checks
+                if len(token) >= 3 or len(checks) > 1]
+        sets = sorted((nodes for nodes in sets if nodes is not None), key=len)
+        if sets:
+            candidates = sets[0]
+            for nodes in sets[1:]:
+                candidates = candidates & nodes
+        else:
+            candidates = self._allCandidates(max(tokens, key=len))
+        query = max(tokens, key=len)
+        found = []
+        if limit is not None:
+            found = self._leadingMatches(query, checks, candidates, limit)
+            if len(found) >= limit:
+                return found
+        seen = set(found)
+        # look past the limit so the best ranked of the other matches are
+        # likely kept.
+        budget = None if limit is None else limit * 4
+        for nodeId in candidates:
+            if nodeId not in seen and self._matches(nodeId, checks):
+                seen.add(nodeId)
+                found.append(nodeId)
+                if budget is not None and len(found) >= budget:
+                    break
+        found.sort(key=lambda n: self._rank(n, query))
+        if limit is not None:
+            del found[limit:]
+        return found
+
+    def bounds(self, nodeIds):
+        """
+        Returns the (x, y, width, height) scene bounds of nodes or None.
+        """
+        nodes = [self.model.node(nodeId) for nodeId in nodeIds]
+        if not nodes:
+            return None
+        left = min(n.x for n in nodes)
+        top = min(n.y for n in nodes)
+        right = max(n.x + n.width for n in nodes)
+        bottom = max(n.y + n.height for n in nodes)
+        return left, top, right - left, bottom - top
@@ -0,0 +1,448 @@
+#!/usr/bin/python
+"""
+Graph serialization.
+
+Saves and loads a GraphModel in two formats, both are read as a stream so a
+large file can populate a model (and the NodeScene mirroring it) in chunks.
+
+JSON lines (".json" / ".jsonl"), one record per line:
+
+    {"format": "pySideNodeGraph", "version": 3, "nodes": N, "edges": M}
+    {"node": id, "name": str, "type": str, "pos": [x, y], "size": [w, h],
+     "color": str, "textColor": str, "attrs": {name: value},
+     "inputs": [[portId, name, connectionLimit, dataType], ...],
+     "outputs": [[portId, name, connectionLimit, dataType], ...]}
+    {"edge": [edgeId, outPortId, inPortId]}
+
+Binary (any other extension), little endian:
+
+    header   <4sHIII   magic "PSNG", version, string count, node count,
+                       edge count
+    strings  per string <I length followed by the utf-8 bytes
+    nodes    per node <IddddiiiiiHH id, x, y, width, height, name, type,
+                       color, textColor, attrs, input count, output count
+             followed per port by <Iiii  port id, name, connectionLimit,
+                       dataType
+    edges    edge count * 3 uint32  edge id, out port id, in port id
+
+String fields of the binary format are indexes in the string table, -1
+stands for None, the attrs are a JSON object.  Node records are always
+written before the edges.  The node attrs (the parameters of the
+graphEvaluator) must be JSON serializable, the others are not saved.
+Version 2 files, without node attrs and with <H string lengths, and version
+1 files, without port data types either, are still read.
+
+dumpNodes() and loadNodes() encode a selection of nodes with the edges
+between them as a single compact JSON object, the clipboard payload of the
+NodeScene copies, loaded nodes, ports and edges get new ids.
+"""
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+
+from graphModel import GraphModel
+
+FORMAT_NAME = 'pySideNodeGraph'
+FORMAT_VERSION = 3
+BINARY_MAGIC = b'PSNG'
+JSON_EXTENSIONS = ('.json', '.jsonl')
+
+_HEADER = struct.Struct('<4sHIII')
+_STRING_LEN = struct.Struct('<I')
+_NODE = struct.Struct('<IddddiiiiiHH')
+_PORT = struct.Struct('<Iiii')
+# string length and node record of the version 1 and 2 binary formats.
+_STRING_LEN_V2 = struct.Struct('<H')
+_NODE_V2 = struct.Struct('<IddddiiiiHH')
+# port record of the version 1 binary format.
+_PORT_V1 = struct.Struct('<Iii')
+_EDGE_SIZE = 12
+
+
+class GraphFormatError(ValueError):
+    """
+    Raised when a file is not a valid serialized graph.
+    """
+
+
+def _isJson(path):
+    return os.path.splitext(path)[1].lower() in JSON_EXTENSIONS
+
+
+def save(model, path):
+    """
+    Save a model, the format is picked from the file extension.
+
+    Args:
+        model (GraphModel): graph to save.
+        path (str): destination file.
+    """
+    if _isJson(path):
+        saveJson(model, path)
+    else:
+        saveBinary(model, path)
+
+
+def iterLoad(path, model, chunkSize=1000, useMmap=False):
+    """
+    Stream a saved graph into a model.
+
+    Args:
+        path (str): file to load.
+        model (GraphModel): model receiving the records.
+        chunkSize (int): number of records added between yields.
+        useMmap (bool): memory map binary files instead of reading them.
+
+    Yields:
+        tuple(list[GraphNode], list[GraphEdge]): the records added since the
+        previous chunk.
+    """
+    if _isJson(path):
+        return iterLoadJson(path, model, chunkSize)
+    return iterLoadBinary(path, model, chunkSize, useMmap)
+
+
+def load(path, model=None, useMmap=False):
+    """
+    Load a saved graph.
+
+    Args:
+        path (str): file to load.
+        model (GraphModel): model receiving the records, a new one is made
+            when None.
+        useMmap (bool): memory map binary files instead of reading them.
+
+    Returns:
+        GraphModel: the loaded model.
+    """
+    if model is None:
+        model = GraphModel()
+    for _ in iterLoad(path, model, chunkSize=sys.maxsize, useMmap=useMmap):
+        pass
+    return model
+
+
+def _addNode(model, nodeId, name, nodeType, x, y, w, h, color, textColor,
+             inputs, outputs, attrs=None):
+    node = model.addNode(name, nodeType, x, y, w, h, nodeId=nodeId)
+    node.color = color
+    node.textColor = textColor
+    node.attrs = dict(attrs) if attrs else None
+    for portType, ports in (('in', inputs), ('out', outputs)):
+        for record in ports:
+            # version 1 records have no data type.
+            dataType = record[3] if len(record) > 3 else None
+            model.addPort(nodeId, record[1], portType, record[2],
+                          portId=record[0], dataType=dataType)
+    return node
+
+
+def _savedAttrs(node):
+    # the attrs of a node if they serialize as JSON, else None.
+    attrs = node.attrs or None
+    if attrs:
+        try:
+            json.dumps(attrs)
+        except (TypeError, ValueError):
+            attrs = None
+    return attrs
+
+
+def _portRecords(model, portIds):
+    records = []
+    for portId in portIds:
+        port = model.port(portId)
+        records.append((port.id, port.name, port.connectionLimit,
+                        port.dataType))
+    return records
+
+
+# JSON lines --------------------------------------------------------------
+
+def saveJson(model, path):
+    with open(path, 'w') as f:
+        header = {'format': FORMAT_NAME, 'version': FORMAT_VERSION,
+                  'nodes': len(model), 'edges': len(model.edges())}
+        f.write(json.dumps(header) + '\n')
+        for node in model.nodes():
+            record = {
+                'node': node.id, 'name': node.name, 'type': node.nodeType,
+                'pos': [node.x, node.y], 'size': [node.width, node.height],
+                'color': node.color, 'textColor': node.textColor,
+                'inputs': _portRecords(model, node.inputs),
+                'outputs': _portRecords(model, node.outputs)}
+            attrs = _savedAttrs(node)
+            if attrs:
+                record['attrs'] = attrs
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        for edge in model.edges():
+            record = {'edge': [edge.id, edge.outPortId, edge.inPortId]}
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+def iterLoadJson(path, model, chunkSize=1000):
+    with open(path, 'r') as f:
+        header = json.loads(f.readline() or 'null')
+        if not isinstance(header, dict) or header.get('format') != FORMAT_NAME:
+            raise GraphFormatError('{} is not a graph file'.format(path))
+        if header.get('version', 0) > FORMAT_VERSION:
+            raise GraphFormatError('unsupported graph version {}'.format(
+                header.get('version')))
+        nodes, edges = [], []
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'node' in record:
+                x, y = record['pos']
+                w, h = record['size']
+                nodes.append(_addNode(
+                    model, record['node'], record['name'], record.get('type'),
+                    x, y, w, h, record.get('color'), record.get('textColor'),
+                    record['inputs'], record['outputs'],
+                    record.get('attrs')))
+            elif 'edge' in record:
+                edgeId, outPortId, inPortId = record['edge']
+                edges.append(model.connect(outPortId, inPortId, edgeId))
+            if len(nodes) + len(edges) >= chunkSize:
+                yield nodes, edges
+                nodes, edges = [], []
+        if nodes or edges:
+            yield nodes, edges
+
+
+# binary -------------------------------------------------------------------
+
+class _FileReader(object):
+
+    def __init__(self, fileObj):
+        self._file = fileObj
+
+    def read(self, size):
+        data = self._file.read(size)
+        if len(data) != size:
+            raise GraphFormatError('unexpected end of file')
+        return data
+
+    def unpack(self, fmt):
+        return fmt.unpack(self.read(fmt.size))
+
+
+class _BufferReader(object):
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._offset = 0
+
+    def read(self, size):
+        start = self._offset
+        self._offset += size
+        if self._offset > len(self._buffer):
+            raise GraphFormatError('unexpected end of file')
+        return self._buffer[start:self._offset]
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self._buffer, self._offset)
+        self._offset += fmt.size
+        return values
+
+
+def saveBinary(model, path):
+    strings = {}
+
+    def index(text):
+        if text is None:
+            return -1
+        idx = strings.get(text)
+        if idx is None:
+            idx = strings[text] = len(strings)
+        return idx
+
+    nodeData = []
+    for node in model.nodes():
+        attrs = _savedAttrs(node)
+        if attrs:
+            attrs = json.dumps(attrs, sort_keys=True, separators=(',', ':'))
+        nodeData.append(_NODE.pack(
+            node.id, node.x, node.y, node.width, node.height,
+            index(node.name), index(node.nodeType),
+            index(node.color), index(node.textColor), index(attrs),
+            len(node.inputs), len(node.outputs)))
+        for portId in node.inputs + node.outputs:
+            port = model.port(portId)
+            nodeData.append(_PORT.pack(
+                port.id, index(port.name), port.connectionLimit,
+                index(port.dataType)))
+
+    edgeData = array.array('I')
+    for edge in model.edges():
+        edgeData.extend((edge.id, edge.outPortId, edge.inPortId))
+    if sys.byteorder == 'big':
+        edgeData.byteswap()
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(BINARY_MAGIC, FORMAT_VERSION, len(strings),
+                             len(model), len(model.edges())))
+        for text, _ in sorted(strings.items(), key=lambda item: item[1]):
+            data = text.encode('utf-8')
+            f.write(_STRING_LEN.pack(len(data)))
+            f.write(data)
+        f.write(b''.join(nodeData))
+        f.write(edgeData.tostring() if sys.version_info[0] < 3
+                else edgeData.tobytes())
+
+
+def iterLoadBinary(path, model, chunkSize=1000, useMmap=False):
+    with open(path, 'rb') as f:
+        if useMmap:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            reader = _BufferReader(buffer)
+        else:
+            buffer = None
+            reader = _FileReader(f)
+        try:
+            for chunk in _iterBinaryRecords(reader, model, chunkSize):
+                yield chunk
+        finally:
+            if buffer is not None:
+                buffer.close()
+
+
+def _iterBinaryRecords(reader, model, chunkSize):
+    magic, version, stringCount, nodeCount, edgeCount = reader.unpack(_HEADER)
+    if magic != BINARY_MAGIC:
+        raise GraphFormatError('not a binary graph file')
+    if version > FORMAT_VERSION:
+        raise GraphFormatError('unsupported graph version {}'.format(version))
+
+    lengthFormat = _STRING_LEN if version >= 3 else _STRING_LEN_V2
+    strings = []
+    for _ in range(stringCount):
+        length, = reader.unpack(lengthFormat)
+        strings.append(bytes(reader.read(length)).decode('utf-8'))
+
+    def text(idx):
+        return strings[idx] if idx >= 0 else None
+
+    portFormat = _PORT if version >= 2 else _PORT_V1
+
+    nodes = []
+    for _ in range(nodeCount):
+        if version >= 3:
+            (nodeId, x, y, w, h, name, nodeType, color, textColor, attrs,
+             inCount, outCount) = reader.unpack(_NODE)
+            attrs = text(attrs)
+            attrs = json.loads(attrs) if attrs else None
+        else:
+            (nodeId, x, y, w, h, name, nodeType, color, textColor,
+             inCount, outCount) = reader.unpack(_NODE_V2)
+            attrs = None
+        ports = []
+        for _ in range(inCount + outCount):
+            record = reader.unpack(portFormat)
+            dataType = text(record[3]) if len(record) > 3 else None
+            ports.append((record[0], text(record[1]), record[2], dataType))
+        nodes.append(_addNode(
+            model, nodeId, text(name), text(nodeType), x, y, w, h,
+            text(color), text(textColor), ports[:inCount], ports[inCount:],
+            attrs))
+        if len(nodes) >= chunkSize:
+            yield nodes, []
+            nodes = []
+    if nodes:
+        yield nodes, []
+
+    remaining = edgeCount
+    while remaining:
+        count = min(remaining, max(chunkSize, 1))
+        remaining -= count
+        values = array.array('I')
+        data = bytes(reader.read(count * _EDGE_SIZE))
+        if sys.version_info[0] < 3:
+            values.fromstring(data)
+        else:
+            values.frombytes(data)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        edges = []
+        for i in range(0, len(values), 3):
+            edges.append(model.connect(values[i + 1], values[i + 2],
+                                       values[i]))
+        yield [], edges
+
+
+# selections ---------------------------------------------------------------
+
+def dumpNodes(model, nodeIds):
+    """
+    Encode nodes and the edges between them as compact JSON, the payload of
+    clipboard copies.  Edges to nodes outside of the selection are left out.
+
+    Returns:
+        bytes: the encoded nodes.
+    """
+    nodeSet = set(nodeIds)
+    nodes = []
+    edges = []
+    for nodeId in nodeSet:
+        node = model.node(nodeId)
+        # parameters that do not serialize are not copied.
+        attrs = _savedAttrs(node)
+        nodes.append([node.id, node.name, node.nodeType, node.x, node.y,
+                      node.width, node.height, node.color, node.textColor,
+                      attrs, _portRecords(model, node.inputs),
+                      _portRecords(model, node.outputs)])
+        for portId in node.outputs:
+            for edgeId in model.port(portId).edges:
+                edge = model.edge(edgeId)
+                if model.port(edge.inPortId).nodeId in nodeSet:
+                    edges.append([edge.outPortId, edge.inPortId])
+    data = {'format': FORMAT_NAME, 'version': FORMAT_VERSION,
+            'nodes': nodes, 'edges': edges}
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def loadNodes(data, model, x=None, y=None):
+    """
+    Add the nodes of a dumpNodes() payload to a model with new ids.
+
+    Args:
+        data (bytes): the encoded nodes.
+        model (GraphModel): model receiving the copies.
+        x (float): left of the copies, their original left when None.
+        y (float): top of the copies, their original top when None.
+
+    Returns:
+        list[GraphNode]: the new nodes.
+    """
+    try:
+        payload = json.loads(data.decode('utf-8'))
+    except ValueError:
+        raise GraphFormatError('invalid node data')
+    if not isinstance(payload, dict) or payload.get('format') != FORMAT_NAME:
+        raise GraphFormatError('invalid node data')
+    records = payload['nodes']
+    if not records:
+        return []
+    dx = 0.0 if x is None else x - min(record[3] for record in records)
+    dy = 0.0 if y is None else y - min(record[4] for record in records)
+    portIds = {}
+    nodes = []
+    for (nodeId, name, nodeType, nx, ny, w, h, color, textColor, attrs,
+         inputs, outputs) in records:
+        node = model.addNode(name, nodeType, nx + dx, ny + dy, w, h)
+        node.color = color
+        node.textColor = textColor
+        node.attrs = dict(attrs) if attrs else None
+        for portType, ports in (('in', inputs), ('out', outputs)):
+            for portId, portName, limit, dataType in ports:
+                portIds[portId] = model.addPort(
+                    node.id, portName, portType, limit,
+                    dataType=dataType).id
+        nodes.append(node)
+    for outPortId, inPortId in payload['edges']:
+        model.connect(portIds[outPortId], portIds[inPortId])
+    return nodes
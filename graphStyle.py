@@ -0,0 +1,156 @@
+#!/usr/bin/python
+"""
+Colors, pens and brushes shared by the graph items.
+
+Colors are parsed once and pens/brushes are built once per role, items look
+the current GraphTheme of their NodeScene up when they paint so restyling a
+graph is a single NodeScene.setTheme() call.
+"""
+from PySide import QtGui, QtCore
+
+_colorCache = {}
+
+
+def color(value):
+    """
+    Returns a cached QColor for a color string such as '#5E8E9C'.
+    """
+    result = _colorCache.get(value)
+    if result is None:
+        result = _colorCache[value] = QtGui.QColor(value)
+    return result
+
+
+class GraphTheme(object):
+    """
+    Named colors with the pens and brushes derived from them.
+
+    Args:
+        colors (dict): color role overrides, see GraphTheme.COLORS.
+    """
+
+    COLORS = {
+        'scene.background': '#181818',
+        'node.background': '#0B0E13',
+        'node.selected': '#2C3233',
+        'group.background': '#16222D',
+        'node.border': '#3C3C3C',
+        'node.text': '#B3B3B3',
+        'node.match': '#E0A526',
+        'node.cache': '#6F8F5A',
+        'port.default': '#5E8E9C',
+        'port.defaultBorder': '#435967',
+        'port.hover': '#D7C008',
+        'port.clicked': '#6A3C56',
+        'port.clickedBorder': '#AF8BA6',
+        'port.target': '#62A84E',
+        'port.targetBorder': '#3C6B31',
+        'sizer': '#57431A',
+        'sizer.border': '#A18961',
+        'pipe.solid': '#C28D34',
+        'pipe.dotted': '#4A596C',
+        'pipe.selected': '#E3E3E3',
+        'hud.background': '#101010',
+        'hud.text': '#9BD36A',
+        'minimap.background': '#101010',
+        'minimap.node': '#5A6470',
+        'minimap.pipe': '#7A6030',
+        'minimap.view': '#E3E3E3',
+    }
+
+    # pen role: (color role, width, style)
+    PENS = {
+        'node.border': ('node.border', 1, QtCore.Qt.SolidLine),
+        'node.highlight': ('node.text', 1, QtCore.Qt.DashLine),
+        'node.match': ('node.match', 2, QtCore.Qt.SolidLine),
+        'node.cache': ('node.cache', 1, QtCore.Qt.SolidLine),
+        'port.default': ('port.defaultBorder', 4, QtCore.Qt.SolidLine),
+        'port.hover': ('port.defaultBorder', 4, QtCore.Qt.SolidLine),
+        'port.clicked': ('port.clickedBorder', 2, QtCore.Qt.SolidLine),
+        'port.target': ('port.targetBorder', 4, QtCore.Qt.SolidLine),
+        'sizer': ('sizer.border', 1, QtCore.Qt.SolidLine),
+        'pipe.solid': ('pipe.solid', 1, QtCore.Qt.SolidLine),
+        'pipe.dotted': ('pipe.dotted', 2, QtCore.Qt.DashDotDotLine),
+        'pipe.selected': ('pipe.selected', 2, QtCore.Qt.SolidLine),
+        'hud.text': ('hud.text', 1, QtCore.Qt.SolidLine),
+        'minimap.view': ('minimap.view', 1, QtCore.Qt.SolidLine),
+    }
+
+    # brush role: color role
+    BRUSHES = {
+        'scene.background': 'scene.background',
+        'node.background': 'node.background',
+        'node.selected': 'node.selected',
+        'group.background': 'group.background',
+        'port.default': 'port.default',
+        'port.hover': 'port.hover',
+        'port.clicked': 'port.clicked',
+        'port.target': 'port.target',
+        'sizer': 'sizer',
+        'hud.background': 'hud.background',
+        'minimap.background': 'minimap.background',
+    }
+
+    def __init__(self, colors=None):
+        self._colors = dict(self.COLORS)
+        if colors:
+            self._colors.update(colors)
+        self._pens = {}
+        self._brushes = {}
+
+    def derive(self, colors):
+        """
+        Returns a new theme with some of the colors replaced.
+        """
+        merged = dict(self._colors)
+        merged.update(colors)
+        return GraphTheme(merged)
+
+    def colorValue(self, role):
+        return self._colors[role]
+
+    def color(self, role):
+        return color(self._colors[role])
+
+    def pen(self, role, override=None):
+        """
+        Returns the shared pen of a role.
+
+        Args:
+            role (str): pen role, see GraphTheme.PENS.
+            override (str): color string replacing the role color.
+        """
+        key = (role, override)
+        pen = self._pens.get(key)
+        if pen is None:
+            colorRole, width, style = self.PENS[role]
+            pen = QtGui.QPen(color(override or self._colors[colorRole]), width)
+            pen.setStyle(style)
+            self._pens[key] = pen
+        return pen
+
+    def brush(self, role, override=None):
+        """
+        Returns the shared brush of a role.
+
+        Args:
+            role (str): brush role, see GraphTheme.BRUSHES.
+            override (str): color string replacing the role color.
+        """
+        key = (role, override)
+        brush = self._brushes.get(key)
+        if brush is None:
+            colorRole = self.BRUSHES[role]
+            brush = QtGui.QBrush(color(override or self._colors[colorRole]))
+            self._brushes[key] = brush
+        return brush
+
+
+defaultTheme = GraphTheme()
+
+
+def itemTheme(item):
+    """
+    Returns the theme of the scene an item belongs to.
+    """
+    return getattr(item.scene(), 'theme', defaultTheme)
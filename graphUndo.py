@@ -0,0 +1,429 @@
+#!/usr/bin/python
+"""
+Undo/redo of graph edits.
+
+UndoStack follows the QUndoStack interface (push, undo, redo, macros,
+merging of commands with the same id, clean state) and is bounded both by
+a number of steps and by the total cost of the commands, the cost of a
+command being the number of records it stores.
+
+Commands store compact deltas: node, port and edge ids, geometries and the
+records of removed nodes, never items or copies of the whole graph.  They
+work on a NodeScene through its model and removeNodes(), restoreNodes(),
+setNodeGeometry(), connectPortIds() and disconnectEdges() methods.  Qt is
+not required.
+"""
+import contextlib
+
+
+class UndoCommand(object):
+    """
+    Base class of the undoable edits.
+
+    Args:
+        text (str): description shown in menus.
+    """
+
+    def __init__(self, text=''):
+        self.text = text
+
+    def redo(self):
+        pass
+
+    def undo(self):
+        pass
+
+    def id(self):
+        """
+        Commands with the same id other than -1 can be merged.
+        """
+        return -1
+
+    def mergeWith(self, other):
+        """
+        Absorb the next command, returns True when it was merged.
+        """
+        return False
+
+    def cost(self):
+        """
+        Returns the number of records the command holds.
+        """
+        return 1
+
+
+class MacroCommand(UndoCommand):
+    """
+    Group of commands undone and redone as one step.
+    """
+
+    def __init__(self, text='', commands=None):
+        super(MacroCommand, self).__init__(text)
+        self.commands = list(commands or [])
+
+    def redo(self):
+        for command in self.commands:
+            command.redo()
+
+    def undo(self):
+        for command in reversed(self.commands):
+            command.undo()
+
+    def cost(self):
+        return sum(command.cost() for command in self.commands) or 1
+
+
+class UndoStack(object):
+    """
+    Bounded history of UndoCommands.
+
+    Functions in "changedCallbacks" are called without arguments whenever
+    the index or the commands of the stack changed.
+
+    Args:
+        undoLimit (int): max number of steps kept, 0 for unlimited.
+        costLimit (int): max total cost of the steps kept, 0 for unlimited.
+    """
+
+    def __init__(self, undoLimit=1000, costLimit=1000000):
+        self.undoLimit = undoLimit
+        self.costLimit = costLimit
+        self.changedCallbacks = []
+        self._commands = []
+        self._costs = []
+        self._cost = 0
+        self._index = 0
+        self._cleanIndex = 0
+        self._macros = []
+        self._active = False
+
+    def _changed(self):
+        for cb in self.changedCallbacks:
+            cb()
+
+    def count(self):
+        return len(self._commands)
+
+    def index(self):
+        return self._index
+
+    def totalCost(self):
+        return self._cost
+
+    def isActive(self):
+        """
+        Returns True while a command is being undone or redone.
+        """
+        return self._active
+
+    def canUndo(self):
+        return not self._macros and self._index > 0
+
+    def canRedo(self):
+        return not self._macros and self._index < len(self._commands)
+
+    def undoText(self):
+        return self._commands[self._index - 1].text if self.canUndo() else ''
+
+    def redoText(self):
+        return self._commands[self._index].text if self.canRedo() else ''
+
+    def isClean(self):
+        return self._index == self._cleanIndex
+
+    def setClean(self):
+        self._cleanIndex = self._index
+        self._changed()
+
+    def clear(self):
+        self._commands = []
+        self._costs = []
+        self._cost = 0
+        self._index = 0
+        self._cleanIndex = 0
+        self._macros = []
+        self._changed()
+
+    def setUndoLimit(self, undoLimit, costLimit=None):
+        """
+        Change the limits, the oldest steps are dropped right away.
+        """
+        self.undoLimit = undoLimit
+        if costLimit is not None:
+            self.costLimit = costLimit
+        self._trim()
+        self._changed()
+
+    def _run(self, func):
+        self._active = True
+        try:
+            func()
+        finally:
+            self._active = False
+
+    def push(self, command, applied=False):
+        """
+        Add a command to the stack, the steps that were undone are dropped.
+
+        Args:
+            command (UndoCommand): the edit.
+            applied (bool): the edit was already made, skip the first redo.
+        """
+        if not applied:
+            self._run(command.redo)
+        if self._macros:
+            self._macros[-1].commands.append(command)
+            return
+        del self._commands[self._index:]
+        self._cost -= sum(self._costs[self._index:])
+        del self._costs[self._index:]
+        if self._cleanIndex > self._index:
+            self._cleanIndex = -1
+        if self._index and self._index != self._cleanIndex:
+            previous = self._commands[-1]
+            if command.id() != -1 and command.id() == previous.id() and \
+                    previous.mergeWith(command):
+                cost = previous.cost()
+                self._cost += cost - self._costs[-1]
+                self._costs[-1] = cost
+                self._trim()
+                self._changed()
+                return
+        cost = command.cost()
+        self._commands.append(command)
+        self._costs.append(cost)
+        self._cost += cost
+        self._index += 1
+        self._trim()
+        self._changed()
+
+    def _trim(self):
+        # drop the oldest steps over the limits, the last one is always kept.
+        drop = 0
+        cost = self._cost
+        count = len(self._commands)
+        while count - drop > 1 and (
+                (self.undoLimit and count - drop > self.undoLimit) or
+                (self.costLimit and cost > self.costLimit)):
+            cost -= self._costs[drop]
+            drop += 1
+        if not drop:
+            return
+        del self._commands[:drop]
+        del self._costs[:drop]
+        self._cost = cost
+        self._index = max(self._index - drop, 0)
+        if self._cleanIndex >= 0:
+            self._cleanIndex -= drop
+            if self._cleanIndex < 0:
+                self._cleanIndex = -1
+
+    def undo(self):
+        if not self.canUndo():
+            return
+        self._index -= 1
+        self._run(self._commands[self._index].undo)
+        self._changed()
+
+    def redo(self):
+        if not self.canRedo():
+            return
+        command = self._commands[self._index]
+        self._index += 1
+        self._run(command.redo)
+        self._changed()
+
+    def beginMacro(self, text):
+        """
+        Start grouping the pushed commands in a single step until
+        endMacro(), macros can be nested.
+        """
+        self._macros.append(MacroCommand(text))
+
+    def endMacro(self):
+        macro = self._macros.pop()
+        if macro.commands:
+            self.push(macro, applied=True)
+
+    @contextlib.contextmanager
+    def macro(self, text):
+        """
+        Context manager grouping the commands pushed in the block in a
+        single step, the macro is closed even when the block raises.
+        """
+        self.beginMacro(text)
+        try:
+            yield self
+        finally:
+            self.endMacro()
+
+
+# snapshots ----------------------------------------------------------------
+
+def snapshotNodes(model, nodeIds, isMaterialized=None):
+    """
+    Capture what is needed to restore nodes.
+
+    Args:
+        model (GraphModel): the graph.
+        nodeIds (iterable[int]): nodes to capture.
+        isMaterialized (callable): optional predicate telling whether a node
+            has an item to restore.
+
+    Returns:
+        tuple(list[tuple], list[tuple]): the node records and the
+        (edgeId, outPortId, inPortId) records of their edges.
+    """
+    nodes = []
+    edgeIds = set()
+    for nodeId in nodeIds:
+        node = model.node(nodeId)
+        ports = []
+        for portIds in (node.inputs, node.outputs):
+            records = []
+            for portId in portIds:
+                port = model.port(portId)
+                records.append((portId, port.name, port.connectionLimit,
+                                port.dataType))
+                edgeIds.update(port.edges)
+            ports.append(tuple(records))
+        nodes.append((
+            node.id, node.name, node.nodeType, node.x, node.y, node.width,
+            node.height, node.color, node.textColor,
+            dict(node.attrs) if node.attrs else None, ports[0], ports[1],
+            node.groupId, bool(isMaterialized and isMaterialized(nodeId))))
+    edges = []
+    for edgeId in sorted(edgeIds):
+        edge = model.edge(edgeId)
+        edges.append((edge.id, edge.outPortId, edge.inPortId))
+    return nodes, edges
+
+
+def _snapshotCost(nodes, edges):
+    return sum(1 + len(node[10]) + len(node[11]) for node in nodes) + \
+        len(edges)
+
+
+# commands -----------------------------------------------------------------
+
+class AddNodesCommand(UndoCommand):
+    """
+    Nodes added to the scene, push it with applied=True once they exist.
+    """
+
+    def __init__(self, scene, nodeIds, text='Add Nodes'):
+        super(AddNodesCommand, self).__init__(text)
+        self.scene = scene
+        self.nodes, self.edges = snapshotNodes(
+            scene.model, nodeIds, scene.isMaterialized)
+
+    def redo(self):
+        self.scene.restoreNodes(self.nodes, self.edges)
+
+    def undo(self):
+        self.scene.removeNodes([node[0] for node in self.nodes])
+
+    def cost(self):
+        return _snapshotCost(self.nodes, self.edges)
+
+
+class RemoveNodesCommand(UndoCommand):
+    """
+    Removal of nodes with their edges.
+    """
+
+    def __init__(self, scene, nodeIds, text='Delete Nodes'):
+        super(RemoveNodesCommand, self).__init__(text)
+        self.scene = scene
+        self.nodes, self.edges = snapshotNodes(
+            scene.model, nodeIds, scene.isMaterialized)
+
+    def redo(self):
+        self.scene.removeNodes([node[0] for node in self.nodes])
+
+    def undo(self):
+        self.scene.restoreNodes(self.nodes, self.edges)
+
+    def cost(self):
+        return _snapshotCost(self.nodes, self.edges)
+
+
+class EdgeEditsCommand(UndoCommand):
+    """
+    Sequence of connections and disconnections.
+
+    Args:
+        scene (NodeScene): the scene.
+        edits (list[tuple]): (connected, edgeId, outPortId, inPortId) in the
+            order they happen, edgeId may be None for a new connection and
+            is allocated by the first redo.
+    """
+
+    def __init__(self, scene, edits, text='Edit Connections'):
+        super(EdgeEditsCommand, self).__init__(text)
+        self.scene = scene
+        self.edits = list(edits)
+
+    def _apply(self, connected, edgeId, outPortId, inPortId):
+        if connected:
+            return self.scene.connectPortIds(outPortId, inPortId, edgeId).id
+        self.scene.disconnectEdges([edgeId])
+        return edgeId
+
+    def redo(self):
+        for idx, (connected, edgeId, outPortId, inPortId) in enumerate(
+                self.edits):
+            edgeId = self._apply(connected, edgeId, outPortId, inPortId)
+            self.edits[idx] = (connected, edgeId, outPortId, inPortId)
+
+    def undo(self):
+        for connected, edgeId, outPortId, inPortId in reversed(self.edits):
+            self._apply(not connected, edgeId, outPortId, inPortId)
+
+    def cost(self):
+        return len(self.edits)
+
+
+class NodeGeometryCommand(UndoCommand):
+    """
+    Moves and resizes of nodes.
+
+    Args:
+        scene (NodeScene): the scene.
+        changes (dict): {nodeId: (oldGeometry, newGeometry)} with geometries
+            as (x, y, width, height) tuples.
+        merge (bool): merge with the next geometry command of the same nodes
+            also pushed with merge, used for continuous edits.
+    """
+
+    ID = 1
+
+    def __init__(self, scene, changes, merge=False, text=None):
+        if text is None:
+            moved = any(old[:2] != new[:2] for old, new in changes.values())
+            text = 'Move Nodes' if moved else 'Resize Nodes'
+        super(NodeGeometryCommand, self).__init__(text)
+        self.scene = scene
+        self.changes = dict(changes)
+        self.merge = merge
+
+    def redo(self):
+        for nodeId, (_, geometry) in self.changes.items():
+            self.scene.setNodeGeometry(nodeId, *geometry)
+
+    def undo(self):
+        for nodeId, (geometry, _) in self.changes.items():
+            self.scene.setNodeGeometry(nodeId, *geometry)
+
+    def id(self):
+        return self.ID if self.merge else -1
+
+    def mergeWith(self, other):
+        if not other.merge or set(other.changes) != set(self.changes):
+            return False
+        for nodeId, (_, geometry) in other.changes.items():
+            self.changes[nodeId] = (self.changes[nodeId][0], geometry)
+        return True
+
+    def cost(self):
+        return len(self.changes)
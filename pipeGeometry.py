@@ -0,0 +1,224 @@
+#!/usr/bin/python
+"""
+Contiguous storage of pipe curves.
+
+Pipes drawn by a PipeLayerItem keep their end points in flat float arrays,
+slot i owning the values [i * 4, i * 4 + 4) of "ends".  The curve control
+points of every pipe whose ends moved are recomputed in one pass, with
+NumPy when it is installed and a python loop otherwise.  Qt is not
+required.
+"""
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PipeGeometry(object):
+    """
+    End points and control points of cubic pipes stored by slot.
+
+    A pipe from (x1, y1) to (x2, y2) is the cubic curve with the control
+    points (cp1x, y1) and (cp2x, y2), see pySideNodeGraph.pipePath().
+
+    Args:
+        capacity (int): initial number of slots, the arrays grow as needed.
+        useNumpy (bool): vectorize the updates when NumPy is available.
+    """
+
+    def __init__(self, capacity=1024, useNumpy=True):
+        self.useNumpy = bool(useNumpy and numpy is not None)
+        self._capacity = 0
+        # x1, y1, x2, y2 of each slot.
+        self.ends = self._zeros(0)
+        # direction (1 from an "out" port, -1 from an "in" port) and max
+        # tangent length of each slot.
+        self.params = self._zeros(0)
+        # cp1x, cp2x of each slot.
+        self.controls = self._zeros(0)
+        self.used = bytearray()
+        self._free = []
+        self._size = 0
+        self._dirty = set()
+        self._grow(max(capacity, 1))
+
+    def __len__(self):
+        return self._size - len(self._free)
+
+    def _zeros(self, count):
+        if self.useNumpy:
+            return numpy.zeros(count)
+        return array.array('d', [0.0]) * count
+
+    def _grow(self, capacity):
+        def resize(values, width):
+            grown = self._zeros(capacity * width)
+            grown[:len(values)] = values
+            return grown
+
+        self.ends = resize(self.ends, 4)
+        self.params = resize(self.params, 2)
+        self.controls = resize(self.controls, 2)
+        self.used.extend(bytearray(capacity - self._capacity))
+        self._capacity = capacity
+
+    def allocate(self):
+        """
+        Returns a free slot.
+        """
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = self._size
+            self._size += 1
+            if slot >= self._capacity:
+                self._grow(self._capacity * 2)
+        self.used[slot] = 1
+        return slot
+
+    def release(self, slot):
+        self.used[slot] = 0
+        self._dirty.discard(slot)
+        self._free.append(slot)
+
+    def size(self):
+        """
+        Returns one past the highest slot ever allocated.
+        """
+        return self._size
+
+    def setEnds(self, slot, x1, y1, x2, y2, direction, maxTangent):
+        """
+        Move the end points of a slot, its control points are recomputed by
+        the next update().
+
+        Args:
+            slot (int): slot of the pipe.
+            direction (float): 1 for a pipe starting from an "out" port,
+                -1 for one starting from an "in" port.
+            maxTangent (float): max length of the curve tangents.
+        """
+        idx = slot * 4
+        self.ends[idx:idx + 4] = array.array('d', (x1, y1, x2, y2))
+        self.params[slot * 2:slot * 2 + 2] = array.array(
+            'd', (direction, maxTangent))
+        self._dirty.add(slot)
+
+    def update(self):
+        """
+        Recompute the control points of the slots moved since the last
+        update.
+
+        Returns:
+            list[int]: the updated slots.
+        """
+        if not self._dirty:
+            return []
+        slots = sorted(self._dirty)
+        self._dirty = set()
+        if self.useNumpy:
+            idx = numpy.array(slots)
+            ends = self.ends.reshape(-1, 4)[idx]
+            params = self.params.reshape(-1, 2)[idx]
+            x1, x2 = ends[:, 0], ends[:, 2]
+            tangent = numpy.minimum(numpy.abs(x1 - x2), params[:, 1])
+            tangent *= params[:, 0]
+            controls = self.controls.reshape(-1, 2)
+            controls[idx, 0] = x1 + tangent
+            controls[idx, 1] = x2 - tangent
+            return slots
+        ends, params, controls = self.ends, self.params, self.controls
+        for slot in slots:
+            x1, x2 = ends[slot * 4], ends[slot * 4 + 2]
+            direction, maxTangent = params[slot * 2], params[slot * 2 + 1]
+            tangent = min(abs(x1 - x2), maxTangent) * direction
+            controls[slot * 2] = x1 + tangent
+            controls[slot * 2 + 1] = x2 - tangent
+        return slots
+
+    def curve(self, slot):
+        """
+        Returns the (x1, y1, cp1x, cp2x, x2, y2) values of a slot.
+        """
+        ends, controls = self.ends, self.controls
+        idx = slot * 4
+        return (ends[idx], ends[idx + 1], controls[slot * 2],
+                controls[slot * 2 + 1], ends[idx + 2], ends[idx + 3])
+
+    def curves(self, start, stop):
+        """
+        Returns the (slot, x1, y1, cp1x, cp2x, x2, y2) tuples of the used
+        slots of a range.
+        """
+        stop = min(stop, self._size)
+        if start >= stop:
+            return []
+        if self.useNumpy:
+            ends = self.ends[start * 4:stop * 4].reshape(-1, 4)
+            controls = self.controls[start * 2:stop * 2].reshape(-1, 2)
+            used = numpy.frombuffer(
+                bytes(self.used[start:stop]), dtype=numpy.uint8).astype(bool)
+            slots = numpy.arange(start, stop)[used]
+            values = numpy.column_stack((
+                ends[:, 0], ends[:, 1], controls, ends[:, 2], ends[:, 3]))
+            return [(slot,) + tuple(row) for slot, row in
+                    zip(slots.tolist(), values[used].tolist())]
+        return [(slot,) + self.curve(slot) for slot in range(start, stop)
+                if self.used[slot]]
+
+    def _hulls(self, start, stop):
+        # x1, y1, x2, y2 arrays of the control hulls of the used slots.
+        ends = self.ends[start * 4:stop * 4].reshape(-1, 4)
+        controls = self.controls[start * 2:stop * 2].reshape(-1, 2)
+        used = numpy.frombuffer(
+            bytes(self.used[start:stop]), dtype=numpy.uint8).astype(bool)
+        xs = numpy.concatenate((ends[:, 0::2], controls), axis=1)[used]
+        ys = ends[:, 1::2][used]
+        slots = numpy.arange(start, stop)[used]
+        return (slots, xs.min(axis=1), ys.min(axis=1), xs.max(axis=1),
+                ys.max(axis=1))
+
+    def bounds(self, start, stop):
+        """
+        Returns the (x1, y1, x2, y2) box of the curves in a slot range or
+        None when the range has no pipe.
+        """
+        stop = min(stop, self._size)
+        if start >= stop or not any(self.used[start:stop]):
+            return None
+        if self.useNumpy:
+            _, x1, y1, x2, y2 = self._hulls(start, stop)
+            return x1.min(), y1.min(), x2.max(), y2.max()
+        boxes = [self._hull(slot) for slot in range(start, stop)
+                 if self.used[slot]]
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+    def _hull(self, slot):
+        x1, y1, cp1x, cp2x, x2, y2 = self.curve(slot)
+        xs = (x1, x2, cp1x, cp2x)
+        return min(xs), min(y1, y2), max(xs), max(y1, y2)
+
+    def candidates(self, start, stop, x, y, tolerance):
+        """
+        Returns the used slots of a range whose curve box, grown by the
+        tolerance, contains the point.
+        """
+        stop = min(stop, self._size)
+        if start >= stop:
+            return []
+        if self.useNumpy:
+            slots, x1, y1, x2, y2 = self._hulls(start, stop)
+            hit = ((x1 - tolerance <= x) & (x2 + tolerance >= x) &
+                   (y1 - tolerance <= y) & (y2 + tolerance >= y))
+            return slots[hit].tolist()
+        result = []
+        for slot in range(start, stop):
+            if self.used[slot]:
+                x1, y1, x2, y2 = self._hull(slot)
+                if x1 - tolerance <= x <= x2 + tolerance and \
+                        y1 - tolerance <= y <= y2 + tolerance:
+                    result.append(slot)
+        return result
@@ -1,32 +1,168 @@
 #!/usr/bin/python
+import collections
+import contextlib
+import functools
+import math
+
+from concurrent import futures
+
 from PySide import QtGui, QtCore
 
+import graphLayout
+import graphSerializer
+from graphEvents import GraphEventBus
+from graphModel import GraphModel
+from graphProfiler import profiler, clock, handlerName
+from graphRegistry import nodeTypeName
+from graphRules import ConnectionRules, TopologicalIndex
+from graphSearch import SearchIndex
+from graphUndo import (UndoStack, AddNodesCommand, RemoveNodesCommand,
+                       EdgeEditsCommand, NodeGeometryCommand)
+import graphStyle
+from graphStyle import defaultTheme, itemTheme
+from pipeGeometry import PipeGeometry
+from spatialIndex import SpatialGrid
+
+# view scale thresholds of the level of detail tiers, below:
+# LOD_PORT_LABEL port labels and node sizers are not drawn.
+# LOD_NODE_DETAIL nodes are drawn as flat rects without text and ports.
+# LOD_PIPE_CURVE pipes are drawn as straight lines.
+# LOD_PIPE_VISIBLE pipes are not drawn.
+# LOD_ANTIALIASING the viewer turns antialiasing off.
+LOD_PORT_LABEL = 0.6
+LOD_NODE_DETAIL = 0.35
+LOD_PIPE_CURVE = 0.35
+LOD_PIPE_VISIBLE = 0.1
+LOD_ANTIALIASING = 0.6
+
+# side of the scene rect before the graph grows it.
+SCENE_AREA = 3200.0
+# drag and drop format of a node type name, see NodePalette.
+NAME_MIME = 'component/name'
+# clipboard format of copied nodes.
+NODES_MIME = 'component/nodes'
+# offset of the copies made by NodeScene.duplicateNodes().
+DUPLICATE_OFFSET = 30.0
+
+# padding of the first and last port slots, twice the default sizer extent.
+SLOT_PADDING = 14.0
+
+
+def levelOfDetail(painter, option):
+    return option.levelOfDetailFromTransform(painter.worldTransform())
+
+
+def portSlot(index, count, padding=SLOT_PADDING):
+    """
+    Returns the (offset, factor) pair placing port "index" of "count" ports
+    at y = offset + factor * height.
+    """
+    if count == 1:
+        return 0.0, 0.5
+    factor = float(index) / (count - 1)
+    offset = 5.0 - 10.0 * factor
+    if index == 0:
+        offset += padding
+    elif index == count - 1:
+        offset -= padding
+    return offset, factor
+
+
+def batchedEvents(method):
+    """
+    Decorator running a NodeScene method as a single transaction of the
+    scene events, see graphEvents.GraphEventBus.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.events.transaction():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def pipePath(pos1, pos2, portType, maxTangent):
+    """
+    Build the curve of a pipe.
+
+    Args:
+        pos1 (QtCore.QPointF): start point.
+        pos2 (QtCore.QPointF): end point.
+        portType (str): type of the start port, 'in' or 'out'.
+        maxTangent (float): max length of the curve tangents.
+
+    Returns:
+        QtGui.QPainterPath: the pipe path.
+    """
+    path = QtGui.QPainterPath()
+    path.moveTo(pos1.x(), pos1.y())
+    cp1_offset, cp2_offset = pos1.x(), pos2.x()
+    tangent = min(abs(cp1_offset - cp2_offset), maxTangent)
+    if portType == 'in':
+        cp1_offset -= tangent
+        cp2_offset += tangent
+    elif portType == 'out':
+        cp1_offset += tangent
+        cp2_offset -= tangent
+    cp1 = QtCore.QPointF(cp1_offset, pos1.y())
+    cp2 = QtCore.QPointF(cp2_offset, pos2.y())
+    path.cubicTo(cp1, cp2, pos2)
+    return path
+
 
 class PipeItem(QtGui.QGraphicsPathItem):
 
-    def __init__(self, color='#C28D34', dottedColor='#4A596C'):
+    def __init__(self, color=None, dottedColor=None):
         super(PipeItem, self).__init__(None)
         self.setFlag(self.ItemIsSelectable, False)
+        # colors override the theme "pipe.solid" and "pipe.dotted" roles.
         self._color = color
         self._dottedColor = dottedColor
+        self._dotted = False
         self._inPort = None
         self._outPort = None
-        self.setDottedLine(False)
+        self._connection = None
+        self.edgeId = None
+        # the widest pen of the two styles so the bounds fit both.
+        self.setPen(defaultTheme.pen('pipe.dotted'))
 
     def __str__(self):
-        return 'PipeItem(color={}, dottedColor={})'.format(self._color, self._colorGhost)
+        return 'PipeItem(color={}, dottedColor={})'.format(self._color, self._dottedColor)
+
+    def currentPen(self):
+        if self._dotted:
+            return itemTheme(self).pen('pipe.dotted', self._dottedColor)
+        return itemTheme(self).pen('pipe.solid', self._color)
+
+    def paint(self, painter, option, widget=None):
+        if profiler.enabled:
+            profiler.count('items.painted')
+        lod = levelOfDetail(painter, option)
+        if lod < LOD_PIPE_VISIBLE:
+            return
+        path = self.path()
+        if path.isEmpty():
+            return
+        painter.setPen(self.currentPen())
+        if lod < LOD_PIPE_CURVE:
+            painter.drawLine(path.pointAtPercent(0.0), path.currentPosition())
+            return
+        painter.setBrush(QtCore.Qt.NoBrush)
+        painter.drawPath(path)
 
     def setColor(self, color):
         self._color = color
-        self.setDottedLine()
+        self.update()
 
     def setDottedLine(self, mode=False):
-        penType = {True:QtCore.Qt.PenStyle.DashDotDotLine, False:QtCore.Qt.PenStyle.SolidLine}
-        penColor = {True:self._dottedColor, False:self._color}
-        penSize = {True:2, False:1}
-        pen = QtGui.QPen(QtGui.QColor(penColor[mode]), penSize[mode])
-        pen.setStyle(penType[mode])
-        self.setPen(pen)
+        if mode != self._dotted:
+            self._dotted = mode
+            self.update()
+
+    def setEnds(self, pos1, pos2, portType, maxTangent):
+        """
+        Set the path from its end points, see pipePath().
+        """
+        self.setPath(pipePath(pos1, pos2, portType, maxTangent))
 
     def setInPort(self, port):
         self._inPort = port
@@ -41,19 +177,302 @@ class PipeItem(QtGui.QGraphicsPathItem):
         return self._outPort
 
     def delete(self):
-        if self._inPort:
-            self._inPort._connectedPipes.remove(self)
-        if self._outPort:
-            self._outPort._connectedPipes.remove(self)
+        if self._connection is not None:
+            self._connection.unhook()
         scene = self.scene()
         if scene:
+            if isinstance(scene, NodeScene):
+                scene._pipeDeleted(self)
             scene.removeItem(self)
 
 
+class LayerPipe(object):
+    """
+    Pipe drawn by the PipeLayerItem of a NodeScene with batched pipes, it
+    has the PipeItem interface without being a graphics item.
+    """
+
+    def __init__(self, color=None, dottedColor=None):
+        # colors override the theme "pipe.solid" and "pipe.dotted" roles.
+        self._color = color
+        self._dottedColor = dottedColor
+        self._dotted = False
+        self._selected = False
+        self._inPort = None
+        self._outPort = None
+        self._connection = None
+        self.edgeId = None
+        # layer drawing the pipe and geometry slot it owns there.
+        self.layer = None
+        self.slot = None
+
+    def __str__(self):
+        return 'LayerPipe(color={}, dottedColor={})'.format(self._color, self._dottedColor)
+
+    def scene(self):
+        if self.layer is None:
+            return None
+        return self.layer.scene()
+
+    def style(self):
+        """
+        Returns the key of the pen drawing the pipe.
+        """
+        if self._selected:
+            return ('pipe.selected', None)
+        if self._dotted:
+            return ('pipe.dotted', self._dottedColor)
+        return ('pipe.solid', self._color)
+
+    def _styleChanged(self):
+        if self.layer is not None:
+            self.layer.pipeStyleChanged(self)
+
+    def setColor(self, color):
+        self._color = color
+        self._styleChanged()
+
+    def setDottedLine(self, mode=False):
+        if mode != self._dotted:
+            self._dotted = mode
+            self._styleChanged()
+
+    def isSelected(self):
+        return self._selected
+
+    def setSelected(self, selected):
+        if selected != self._selected:
+            self._selected = selected
+            if self.layer is not None:
+                self.layer.pipeSelectionChanged(self)
+
+    def setEnds(self, pos1, pos2, portType, maxTangent):
+        if self.layer is not None:
+            self.layer.setPipeEnds(self, pos1, pos2, portType, maxTangent)
+
+    def setInPort(self, port):
+        self._inPort = port
+
+    def setOutPort(self, port):
+        self._outPort = port
+
+    def getInPort(self):
+        return self._inPort
+
+    def getOutPort(self):
+        return self._outPort
+
+    def delete(self):
+        if self._connection is not None:
+            self._connection.unhook()
+        scene = self.scene()
+        if scene:
+            scene._pipeDeleted(self)
+        if self.layer is not None:
+            self.layer.removePipe(self)
+
+
+class PipeLayerItem(QtGui.QGraphicsItem):
+    """
+    Single scene item drawing every LayerPipe of a NodeScene.
+
+    Pipe curves live in a PipeGeometry, slots are grouped in chunks of
+    CHUNK_SIZE that cache one path (or line list at low zoom) per pipe
+    style.  Painting sets each pen once and draws the cached shapes of the
+    exposed chunks, a moving pipe only rebuilds the shapes of its chunk.
+    """
+
+    CHUNK_SIZE = 512
+
+    def __init__(self, parent=None):
+        super(PipeLayerItem, self).__init__(parent)
+        self.setZValue(-1)
+        self.setAcceptedMouseButtons(QtCore.Qt.NoButton)
+        self.setFlag(self.ItemUsesExtendedStyleOption, True)
+        self.reset()
+
+    def reset(self):
+        """
+        Forget every pipe.
+        """
+        for pipe in getattr(self, '_pipes', ()):
+            if pipe is not None:
+                pipe.layer = pipe.slot = None
+        self.geometry = PipeGeometry()
+        self._pipes = []
+        self._selected = set()
+        self._chunkRects = {}
+        self._chunkShapes = {}
+        self._dirtyChunks = set()
+        if getattr(self, '_rect', None):
+            self.prepareGeometryChange()
+        self._rect = QtCore.QRectF()
+
+    def __len__(self):
+        return len(self.geometry)
+
+    def boundingRect(self):
+        return self._rect
+
+    def addPipe(self, pipe):
+        slot = self.geometry.allocate()
+        if slot < len(self._pipes):
+            self._pipes[slot] = pipe
+        else:
+            self._pipes.append(pipe)
+        pipe.layer, pipe.slot = self, slot
+        if pipe._selected:
+            self._selected.add(pipe)
+
+    def removePipe(self, pipe):
+        if pipe.layer is not self:
+            return
+        self.geometry.release(pipe.slot)
+        self._pipes[pipe.slot] = None
+        self._selected.discard(pipe)
+        self._invalidate(pipe.slot // self.CHUNK_SIZE)
+        pipe.layer = pipe.slot = None
+
+    def setPipeEnds(self, pipe, pos1, pos2, portType, maxTangent):
+        direction = -1.0 if portType == 'in' else 1.0
+        self.geometry.setEnds(pipe.slot, pos1.x(), pos1.y(), pos2.x(),
+                              pos2.y(), direction, maxTangent)
+        self._requestFlush()
+
+    def pipeStyleChanged(self, pipe):
+        self._invalidate(pipe.slot // self.CHUNK_SIZE)
+
+    def pipeSelectionChanged(self, pipe):
+        if pipe._selected:
+            self._selected.add(pipe)
+        else:
+            self._selected.discard(pipe)
+        self.pipeStyleChanged(pipe)
+
+    def selectedPipes(self):
+        return list(self._selected)
+
+    def clearSelection(self):
+        for pipe in list(self._selected):
+            pipe.setSelected(False)
+
+    def _invalidate(self, chunk):
+        self._dirtyChunks.add(chunk)
+        self._requestFlush()
+
+    def _requestFlush(self):
+        scene = self.scene()
+        if isinstance(scene, NodeScene):
+            if not scene._pipeTimer.isActive():
+                scene._pipeTimer.start()
+        else:
+            self.flush()
+
+    def flush(self):
+        """
+        Recompute the curves of the moved pipes and the bounds and shapes
+        of their chunks.
+        """
+        size = self.CHUNK_SIZE
+        chunks, self._dirtyChunks = self._dirtyChunks, set()
+        chunks.update(slot // size for slot in self.geometry.update())
+        if not chunks:
+            return
+        dirty = QtCore.QRectF()
+        for chunk in chunks:
+            self._chunkShapes.pop(chunk, None)
+            oldRect = self._chunkRects.pop(chunk, None)
+            if oldRect is not None:
+                dirty = dirty.united(oldRect)
+            bounds = self.geometry.bounds(chunk * size, (chunk + 1) * size)
+            if bounds is not None:
+                x1, y1, x2, y2 = bounds
+                # pad with the widest pipe pen.
+                rect = QtCore.QRectF(x1 - 2, y1 - 2, x2 - x1 + 4, y2 - y1 + 4)
+                self._chunkRects[chunk] = rect
+                dirty = dirty.united(rect)
+        rect = QtCore.QRectF()
+        for chunkRect in self._chunkRects.values():
+            rect = rect.united(chunkRect)
+        if rect != self._rect:
+            self.prepareGeometryChange()
+            self._rect = rect
+        self.update(dirty)
+
+    def _shapes(self, chunk, straight):
+        cache = self._chunkShapes.setdefault(chunk, {})
+        shapes = cache.get(straight)
+        if shapes is not None:
+            return shapes
+        shapes = cache[straight] = {}
+        size = self.CHUNK_SIZE
+        pipes = self._pipes
+        for slot, x1, y1, cp1x, cp2x, x2, y2 in self.geometry.curves(
+                chunk * size, (chunk + 1) * size):
+            style = pipes[slot].style()
+            if straight:
+                shapes.setdefault(style, []).append(
+                    QtCore.QLineF(x1, y1, x2, y2))
+                continue
+            path = shapes.get(style)
+            if path is None:
+                path = shapes[style] = QtGui.QPainterPath()
+            path.moveTo(x1, y1)
+            path.cubicTo(cp1x, y1, cp2x, y2, x2, y2)
+        return shapes
+
+    def paint(self, painter, option, widget=None):
+        if profiler.enabled:
+            profiler.count('items.painted')
+        lod = levelOfDetail(painter, option)
+        if lod < LOD_PIPE_VISIBLE:
+            return
+        straight = lod < LOD_PIPE_CURVE
+        exposed = option.exposedRect
+        byStyle = {}
+        for chunk, rect in self._chunkRects.items():
+            if rect.intersects(exposed):
+                for style, shape in self._shapes(chunk, straight).items():
+                    byStyle.setdefault(style, []).append(shape)
+        theme = itemTheme(self)
+        painter.setBrush(QtCore.Qt.NoBrush)
+        for (role, color), shapes in byStyle.items():
+            painter.setPen(theme.pen(role, color))
+            for shape in shapes:
+                if straight:
+                    painter.drawLines(shape)
+                else:
+                    painter.drawPath(shape)
+
+    def pipeAt(self, pos, tolerance=5.0):
+        """
+        Returns the pipe passing within the tolerance of a scene position.
+        """
+        self.flush()
+        size = self.CHUNK_SIZE
+        x, y = pos.x(), pos.y()
+        stroker = QtGui.QPainterPathStroker()
+        stroker.setWidth(tolerance * 2)
+        for chunk, rect in self._chunkRects.items():
+            if not rect.adjusted(
+                    -tolerance, -tolerance, tolerance, tolerance).contains(pos):
+                continue
+            for slot in self.geometry.candidates(
+                    chunk * size, (chunk + 1) * size, x, y, tolerance):
+                x1, y1, cp1x, cp2x, x2, y2 = self.geometry.curve(slot)
+                path = QtGui.QPainterPath()
+                path.moveTo(x1, y1)
+                path.cubicTo(cp1x, y1, cp2x, y2, x2, y2)
+                if stroker.createStroke(path).contains(pos):
+                    return self._pipes[slot]
+        return None
+
+
 class PipeConnection(object):
 
-    def __init__(self, startPort=None, endPort=None, scene=None):
-        self._pipe = PipeItem()
+    def __init__(self, startPort=None, endPort=None, scene=None, pipe=None):
+        self._pipe = pipe or PipeItem()
+        self._pipe._connection = self
         self._pipePortSetter = {
             'in':self._pipe.setInPort, 'out':self._pipe.setOutPort}
         self.fromPort = startPort
@@ -62,79 +481,117 @@ class PipeConnection(object):
         self._pos2 = None
         if self.fromPort:
             self._pos1 = self.fromPort.scenePos()
-            self.fromPort.posCallbacks.append(self.setStartPos)
+            self.fromPort._pipeCallbacks[self.setStartPos] = None
         if self.toPort:
             self._pos2 = self.toPort.scenePos()
-        scene.addItem(self._pipe)
+        if isinstance(scene, NodeScene):
+            scene.addPipe(self._pipe)
+        else:
+            scene.addItem(self._pipe)
 
     def makePath(self, pos1, pos2):
-        line = QtCore.QLineF(pos1, pos2)
-        path = QtGui.QPainterPath()
-        path.moveTo(line.x1(), line.y1())
-        cp1_offset, cp2_offset = pos1.x(), pos2.x()
+        start = clock() if profiler.enabled else None
         parentRect = self.fromPort.parentItem().boundingRect()
-        tangent = cp1_offset - cp2_offset
-        if tangent < 0:
-            tangent *= -1
-        if tangent > parentRect.width():
-            tangent = parentRect.width()
-        if self.fromPort.portType == 'in':
-            cp1_offset -= tangent
-            cp2_offset += tangent
-        elif self.fromPort.portType == 'out':
-            cp1_offset += tangent
-            cp2_offset -= tangent
-        cp1 = QtCore.QPointF(cp1_offset, pos1.y())
-        cp2 = QtCore.QPointF(cp2_offset, pos2.y())
-        path.cubicTo(cp1, cp2, pos2)
+        path = pipePath(pos1, pos2, self.fromPort.portType, parentRect.width())
+        if start is not None:
+            profiler.addTime('PipeConnection.makePath', clock() - start)
         return path
 
     def setStartPos(self, pos):
         """
-        set start point for the path
+        set start point for the path, the path itself is rebuilt on the
+        next NodeScene pipe update.
 
         Args:
-            pos:
+            pos (QtCore.QPointF): scene position of the start point.
 
         """
-        '''set start point for the path'''
         self._pos1 = pos
-        path = self.makePath(self._pos1, self._pos2)
-        self._pipe.setPath(path)
+        self.requestPathUpdate()
 
     def setEndPos(self, pos):
         """
-        set end point for the path
+        set end point for the path, the path itself is rebuilt on the
+        next NodeScene pipe update.
 
         Args:
-            pos:
+            pos (QtCore.QPointF): scene position of the end point.
 
         """
         self._pos2 = pos
-        path = self.makePath(self._pos1, self._pos2)
-        self._pipe.setPath(path)
+        self.requestPathUpdate()
+
+    def requestPathUpdate(self):
+        scene = self._pipe.scene()
+        if isinstance(scene, NodeScene):
+            scene.schedulePipeUpdate(self)
+        else:
+            self.updatePath()
 
-    def setFromPort(self):
+    def updatePath(self):
+        """
+        Rebuild the pipe path from the current start and end points.
+        """
+        if self._pos1 is None or self._pos2 is None:
+            return
+        if isinstance(self._pipe, LayerPipe):
+            parentRect = self.fromPort.parentItem().boundingRect()
+            self._pipe.setEnds(self._pos1, self._pos2,
+                               self.fromPort.portType, parentRect.width())
+        else:
+            self._pipe.setPath(self.makePath(self._pos1, self._pos2))
+
+    def setFromPort(self, fromPort):
+        if self.fromPort:
+            self.fromPort._pipeCallbacks.pop(self.setStartPos, None)
         self.fromPort = fromPort
         if self.fromPort:
-            self.pos1 = fromPort.scenePos()
-            self.fromPort.posCallbacks.append(self.setStartPos)
+            self.setStartPos(self.fromPort.scenePos())
+            self.fromPort._pipeCallbacks[self.setStartPos] = None
 
     def setToPort(self, toPort):
         self.toPort = toPort
         if self.toPort:
-            self.pos2 = self.toPort.scenePos()
-            self.toPort.posCallbacks.append(self.setEndPos)
-            self.toPort._connectedPipes.append(self._pipe)
-            self._pipePortSetter[self.toPort.portType](self.fromPort)
+            self._pos2 = self.toPort.scenePos()
+            self.toPort._pipeCallbacks[self.setEndPos] = None
+            self.toPort._connectedPipes[self._pipe] = None
+            self._pipePortSetter[self.toPort.portType](self.toPort)
+
+            self.fromPort._connectedPipes[self._pipe] = None
+            self._pipePortSetter[self.fromPort.portType](self.fromPort)
 
-            self.fromPort._connectedPipes.append(self._pipe)
-            self._pipePortSetter[self.fromPort.portType](self.toPort)
+            scene = self._pipe.scene()
+            if isinstance(scene, NodeScene):
+                scene._pipeConnected(self._pipe)
 
     def deleteConnection(self):
         self._pipe.delete()
-        if self.fromPort:
-            self.fromPort.posCallbacks.remove(self.setStartPos)
+
+    def unhook(self):
+        """
+        Drop the references the ports hold to the connection and its pipe,
+        each port lookup is a dict operation so this is O(1).
+        """
+        ports = ((self.fromPort, self.setStartPos), (self.toPort, self.setEndPos))
+        for port, callback in ports:
+            if port is not None:
+                port._pipeCallbacks.pop(callback, None)
+                port._connectedPipes.pop(self._pipe, None)
+        self._pipe.setInPort(None)
+        self._pipe.setOutPort(None)
+        self._pipe._connection = None
+
+    def detach(self):
+        """
+        Unhook the pipe from its ports and remove it from the scene without
+        touching the model edge, used when the scene recycles items.
+        """
+        self.unhook()
+        scene = self._pipe.scene()
+        if isinstance(scene, NodeScene):
+            scene.removePipe(self._pipe)
+        elif scene:
+            scene.removeItem(self._pipe)
 
 
 class PortItem(QtGui.QGraphicsEllipseItem):
@@ -142,52 +599,106 @@ class PortItem(QtGui.QGraphicsEllipseItem):
     PortItem to a NodeItem
     """
 
-    def __init__(self, parent, name, portType, connectionLimit=-1, portSize=14.0):
+    def __init__(self, parent, name, portType, connectionLimit=-1, portSize=14.0,
+                 dataType=None):
         super(PortItem, self).__init__(QtCore.QRectF(-portSize/2, -portSize/2, portSize, portSize), parent)
         self.setAcceptHoverEvents(True)
         self.setFlag(self.ItemSendsScenePositionChanges, True)
-        self._connectedPipes = []
-        self._colorDefault = ('#5E8E9C', '#435967')
-        self._colorClicked = ('#6A3C56', '#AF8BA6')
-        self.setBrush(QtGui.QBrush(QtGui.QColor(self._colorDefault[0])))
-        self.setPen(QtGui.QPen(QtGui.QColor(self._colorDefault[1]), 4))
+        # ordered sets of the connected pipes and of the callbacks of their
+        # connections, "last" pipe is the most recently connected one.
+        self._connectedPipes = collections.OrderedDict()
+        self._pipeCallbacks = collections.OrderedDict()
+        # theme role suffix of the current state: default, hover or clicked.
+        self._state = 'default'
+        self.setPen(defaultTheme.pen('port.default'))
         self.name = name
         self.portType = portType
         self.connectionLimit = connectionLimit
+        # type of the values, checked by the NodeScene connectionRules.
+        self.dataType = dataType
         self.posCallbacks = []
+        self.portId = None
 
     def __str__(self):
         return 'PortItem(\'{}\', \'{}\')'.format(self.name, self.portType)
 
+    def paint(self, painter, option, widget=None):
+        if profiler.enabled:
+            profiler.count('items.painted')
+        if levelOfDetail(painter, option) < LOD_NODE_DETAIL:
+            return
+        theme = itemTheme(self)
+        role = 'port.' + self._state
+        if self._state == 'default':
+            scene = self.scene()
+            # valid ends of the connection being dragged are highlighted.
+            if getattr(scene, '_dragPort', None) is not None and \
+                    scene.isConnectionTarget(self):
+                role = 'port.target'
+        painter.setPen(theme.pen(role))
+        painter.setBrush(theme.brush(role))
+        painter.drawEllipse(self.rect())
+
+    def setState(self, state):
+        if state != self._state:
+            self._state = state
+            self.update()
+
     def itemChange(self, change, value):
         if change == self.ItemScenePositionHasChanged:
-            for cb in self.posCallbacks:
-                cb(value)
+            if profiler.enabled:
+                self._profiledCallbacks(value)
+            else:
+                for cb in self.posCallbacks:
+                    cb(value)
+                for cb in self._pipeCallbacks:
+                    cb(value)
+            scene = self.scene()
+            if isinstance(scene, NodeScene):
+                scene._portMoved(self)
             return value
+        elif change == self.ItemSceneChange:
+            scene = self.scene()
+            if isinstance(scene, NodeScene):
+                scene._portIndex.remove(self)
+        elif change == self.ItemSceneHasChanged:
+            if isinstance(value, NodeScene):
+                value._portMoved(self)
         return super(PortItem, self).itemChange(change, value)
 
+    def _profiledCallbacks(self, value):
+        # same fan-out as itemChange() timing every handler.
+        start = clock()
+        for callbacks in (self.posCallbacks, list(self._pipeCallbacks)):
+            for cb in callbacks:
+                cbStart = clock()
+                cb(value)
+                profiler.addTime(
+                    'handler ' + handlerName(cb), clock() - cbStart)
+        profiler.addTime('PortItem.itemChange', clock() - start)
+
     def hoverEnterEvent(self, event):
-        self.setBrush(QtGui.QBrush(QtGui.QColor('#D7C008')))
+        if self._state != 'clicked':
+            self.setState('hover')
 
     def hoverLeaveEvent(self, event):
-        self.setBrush(QtGui.QBrush(QtGui.QColor(self._colorDefault[0])))
+        if self._state != 'clicked':
+            self.setState('default')
 
     def mousePressEvent(self, event):
         viewer = self.scene().getNodeViewer()
         viewer.startConnection(self)
-        self.setCursor(QtGui.QCursor(QtCore.Qt.CrossCursor))
-        self.setBrush(QtGui.QBrush(QtGui.QColor(self._colorClicked[0])))
-        self.setPen(QtGui.QPen(QtGui.QColor(self._colorClicked[1]), 2))
+        self.setCursor(QtCore.Qt.CrossCursor)
+        self.setState('clicked')
         # super(PortItem, self).mousePressEvent(event)
 
     def mouseReleaseEvent(self, event):
-        self.setCursor(QtGui.QCursor(QtCore.Qt.ArrowCursor))
-        self.setBrush(QtGui.QBrush(QtGui.QColor(self._colorDefault[0])))
-        self.setPen(QtGui.QPen(QtGui.QColor(self._colorDefault[1]), 4))
+        self.setCursor(QtCore.Qt.ArrowCursor)
+        self.setState('default')
         # super(PortItem, self).mouseReleaseEvent(event)
 
     def getConnectedPipes(self):
-        return self._connectedPipes
+        return list(self._connectedPipes)
 
     def getConnectedPorts(self):
         ports = []
@@ -207,17 +718,27 @@ class NodeSizerItem(QtGui.QGraphicsEllipseItem):
     def __init__(self, parent=None, size=6.0):
         super(NodeSizerItem, self).__init__(QtCore.QRectF(-size/2, -size/2, size, size), parent)
         self.posChangeCallbacks = []
-        self.setPen(QtGui.QPen(QtGui.QColor('#A18961'), 1))
-        self.setBrush(QtGui.QBrush(QtGui.QColor('#57431A')))
+        self.setPen(defaultTheme.pen('sizer'))
         self.setFlag(self.ItemIsSelectable, False)
         self.setFlag(self.ItemIsMovable, True)
         self.setFlag(self.ItemSendsScenePositionChanges, True)
         self.setCursor(QtGui.QCursor(QtCore.Qt.SizeFDiagCursor))
+
+    def paint(self, painter, option, widget=None):
+        if profiler.enabled:
+            profiler.count('items.painted')
+        if levelOfDetail(painter, option) < LOD_PORT_LABEL:
+            return
+        theme = itemTheme(self)
+        painter.setPen(theme.pen('sizer'))
+        painter.setBrush(theme.brush('sizer'))
+        painter.drawEllipse(self.rect())
+
     def itemChange(self, change, value):
         if change == self.ItemPositionChange:
             x, y = value.x(), value.y()
-            # TODO: make this a signal?
-            # This cannot be a signal because this is not a QObject
+            # not a QObject so no signal, the callbacks may also constrain
+            # the position.  Graph level changes are NodeScene.events.
             for cb in self.posChangeCallbacks:
                 res = cb(x, y)
                 if res:
@@ -243,6 +764,58 @@ class NodeSizerItem(QtGui.QGraphicsEllipseItem):
         self.setSelected(False)
 
 
+class NodeTextItem(QtGui.QGraphicsTextItem):
+    """
+    Text label of a NodeItem that is skipped below a zoom level.
+    """
+
+    def __init__(self, text, parent=None, minLevelOfDetail=LOD_NODE_DETAIL):
+        super(NodeTextItem, self).__init__(text, parent)
+        self.minLevelOfDetail = minLevelOfDetail
+        # color string overriding the theme "node.text" role.
+        self.textColor = None
+        self._appliedColor = None
+        self._textSize = None
+
+    def textSize(self):
+        """
+        Returns the cached (width, height) of the text bounding rect.
+        """
+        if self._textSize is None:
+            rect = self.boundingRect()
+            self._textSize = (rect.width(), rect.height())
+        return self._textSize
+
+    def setPlainText(self, text):
+        super(NodeTextItem, self).setPlainText(text)
+        self._textSize = None
+
+    def setHtml(self, text):
+        super(NodeTextItem, self).setHtml(text)
+        self._textSize = None
+
+    def setFont(self, font):
+        super(NodeTextItem, self).setFont(font)
+        self._textSize = None
+
+    def setTextWidth(self, width):
+        super(NodeTextItem, self).setTextWidth(width)
+        self._textSize = None
+
+    def paint(self, painter, option, widget=None):
+        if profiler.enabled:
+            profiler.count('items.painted')
+        if levelOfDetail(painter, option) < self.minLevelOfDetail:
+            return
+        color = self.textColor or itemTheme(self).colorValue('node.text')
+        if color != self._appliedColor:
+            # the text document keeps its own palette, only refresh it when
+            # the theme or override changed since the last paint.
+            self._appliedColor = color
+            self.setDefaultTextColor(graphStyle.color(color))
+        super(NodeTextItem, self).paint(painter, option, widget)
+
+
 class NodeItem(QtGui.QGraphicsRectItem):
     """
     Base Node Item
@@ -251,14 +824,26 @@ class NodeItem(QtGui.QGraphicsRectItem):
     def __init__(self, name='Untitled_Node', parent=None):
         super(NodeItem, self).__init__(parent)
         self.setFlags(self.ItemIsSelectable | self.ItemIsMovable)
-        self.setPen(QtGui.QPen(QtGui.QColor('#3C3C3C'), 1))
+        self.setFlag(self.ItemSendsGeometryChanges, True)
+        self.setPen(defaultTheme.pen('node.border'))
         self.name = name
+        self.nodeId = None
         self._width = 50.0
         self._height = 50.0
-        self._colorBg = '#0B0E13'
-        self._colorSelected = '#2C3233'
-        self._textColor = '#B3B3B3'
-        self._label = QtGui.QGraphicsTextItem(self.name, self)
+        # colors overriding the theme roles, None uses the theme.
+        self._colorBg = None
+        self._colorSelected = None
+        self._textColor = None
+        self._pressed = False
+        self._label = NodeTextItem(self.name, self)
+
+        # deferLayout() nesting and whether a layout was skipped meanwhile.
+        self._layoutDeferred = 0
+        self._layoutPending = False
+        # port slots and the size of the last layout, see setSize().
+        self._inSlots = []
+        self._outSlots = []
+        self._layoutSize = None
 
         # inputs and outputs of node:
         self._inputs = []
@@ -274,50 +859,111 @@ class NodeItem(QtGui.QGraphicsRectItem):
         self.setToolTip(
             'Resize: {}\n(Double Click to Reset)'.format(self.name))
 
-        self.setBackgroundColor(self._colorBg)
-        self.setTextColor(self._textColor)
         self.setResizable(True)
 
     def __str__(self):
         return 'NodeItem(name=\'{}\')'.format(self.name)
 
+    def itemChange(self, change, value):
+        if change == self.ItemPositionHasChanged:
+            scene = self.scene()
+            if self.nodeId is not None and isinstance(scene, NodeScene):
+                scene.model.setNodePos(self.nodeId, value.x(), value.y())
+        elif change == self.ItemSceneChange:
+            scene = self.scene()
+            if isinstance(scene, NodeScene):
+                scene._nodeItemRemoved(self)
+        elif change == self.ItemSceneHasChanged:
+            if isinstance(value, NodeScene):
+                value._nodeItemAdded(self)
+        return super(NodeItem, self).itemChange(change, value)
+
+    def currentBrush(self):
+        if self._pressed:
+            return itemTheme(self).brush('node.selected', self._colorSelected)
+        return itemTheme(self).brush('node.background', self._colorBg)
+
+    def paint(self, painter, option, widget=None):
+        if profiler.enabled:
+            profiler.count('items.painted')
+        if levelOfDetail(painter, option) < LOD_NODE_DETAIL:
+            painter.fillRect(self.rect(), self.currentBrush())
+            return
+        theme = itemTheme(self)
+        painter.setPen(theme.pen('node.border'))
+        painter.setBrush(self.currentBrush())
+        painter.drawRect(self.rect())
+        if option.state & QtGui.QStyle.State_Selected:
+            painter.setPen(theme.pen('node.highlight'))
+            painter.setBrush(QtCore.Qt.NoBrush)
+            painter.drawRect(self.rect())
+        scene = self.scene()
+        if self.nodeId is not None and isinstance(scene, NodeScene) and \
+                self.nodeId in scene._searchMatches:
+            painter.setPen(theme.pen('node.match'))
+            painter.setBrush(QtCore.Qt.NoBrush)
+            painter.drawRect(self.rect().adjusted(-2, -2, 2, 2))
+        evaluator = scene._cacheEvaluator \
+            if isinstance(scene, NodeScene) else None
+        stats = evaluator.cacheStats.get(self.nodeId) \
+            if evaluator is not None else None
+        if stats:
+            painter.setPen(theme.pen('node.cache'))
+            painter.drawText(
+                self.rect().adjusted(4, 0, -4, -2),
+                QtCore.Qt.AlignLeft | QtCore.Qt.AlignBottom,
+                'cache {}/{}'.format(stats[0], stats[0] + stats[1]))
+
     def mouseMoveEvent(self, event):
         super(NodeItem, self).mouseMoveEvent(event)
         self.setSelected(False)
 
     def mousePressEvent(self, event):
         super(NodeItem, self).mousePressEvent(event)
-        self.setSelectedColor(self._colorSelected)
+        self._pressed = True
+        self.update()
         self.setSelected(False)
 
     def mouseReleaseEvent(self, event):
         super(NodeItem, self).mouseReleaseEvent(event)
-        self.setBackgroundColor(self._colorBg)
+        self._pressed = False
+        self.update()
         self.setSelected(False)
 
     def _calcSize(self):
+        start = clock() if profiler.enabled else None
         inWidth, outWidth = 0, 0
         portHeight = 50
         if self._inputs:
-            for text in self._inputsTexts:
-                if text.boundingRect().width() > inWidth:
-                    inWidth = text.boundingRect().width()
-            inWidth += (self._inputs[0].boundingRect().width() * 2)
-            portHeight = self._inputs[0].boundingRect().height()
+            inWidth = max(text.textSize()[0] for text in self._inputsTexts)
+            portWidth, portHeight = self._portSize(self._inputs[0])
+            inWidth += portWidth * 2
         if self._outputs:
-            for text in self._outputsTexts:
-                if text.boundingRect().width() > outWidth:
-                    outWidth = text.boundingRect().width()
-            outWidth += (self._outputs[0].boundingRect().width() * 2)
-            portHeight = self._outputs[0].boundingRect().height()
-        width = (inWidth + outWidth) + (self._label.boundingRect().width()/2)
+            outWidth = max(text.textSize()[0] for text in self._outputsTexts)
+            portWidth, portHeight = self._portSize(self._outputs[0])
+            outWidth += portWidth * 2
+        width = (inWidth + outWidth) + (self._label.textSize()[0] / 2)
         height = portHeight * (max(len(self._inputs), len(self._outputs)) + 2)
+        if start is not None:
+            profiler.addTime('NodeItem._calcSize', clock() - start)
         return width, height
 
-    def _addPort(self, name, type, connectionLimit):
-        port = PortItem(self, name, type, connectionLimit)
-        text = QtGui.QGraphicsTextItem(port.name, self)
-        text.setDefaultTextColor(QtGui.QColor(self._textColor))
+    def _portSize(self, port):
+        rect = port.boundingRect()
+        return rect.width(), rect.height()
+
+    def _portSlots(self, count):
+        """
+        Returns the (offset, factor) pairs placing each of "count" ports at
+        y = offset + factor * height.
+        """
+        padding = self._sizer.boundingRect().height() * 2
+        return [portSlot(idx, count, padding) for idx in range(count)]
+
+    def _addPort(self, name, type, connectionLimit, dataType=None):
+        port = PortItem(self, name, type, connectionLimit, dataType=dataType)
+        text = NodeTextItem(port.name, self, LOD_PORT_LABEL)
+        text.textColor = self._textColor
         font = text.font()
         font.setPointSize(10)
         text.setFont(font)
@@ -327,15 +973,68 @@ class NodeItem(QtGui.QGraphicsRectItem):
         elif type == 'out':
             self._outputs.append(port)
             self._outputsTexts.append(text)
-        self.adjustSize()
+        scene = self.scene()
+        if self.nodeId is not None and isinstance(scene, NodeScene):
+            scene._portItemAdded(self, port)
+        if self._layoutDeferred:
+            self._layoutPending = True
+        else:
+            self.adjustSize()
+
+    @contextlib.contextmanager
+    def deferLayout(self):
+        """
+        Context manager postponing the node layout until the block exits,
+        adding N ports in the block only computes the geometry once.
+
+        Example:
+            with node.deferLayout():
+                for name in names:
+                    node.addInputPort(name)
+        """
+        self._layoutDeferred += 1
+        try:
+            yield self
+        finally:
+            self._layoutDeferred -= 1
+            if not self._layoutDeferred and self._layoutPending:
+                self._layoutPending = False
+                self.adjustSize()
+
+    def setName(self, name):
+        """
+        Rename the node, and its model record when bound to a NodeScene.
+        """
+        if name != self.name:
+            self.name = name
+            with self.deferLayout():
+                self._label.setPlainText(name)
+                self.setToolTip(
+                    'Resize: {}\n(Double Click to Reset)'.format(name))
+                self._layoutPending = True
+        scene = self.scene()
+        if self.nodeId is not None and isinstance(scene, NodeScene) and \
+                scene.model.node(self.nodeId).name != name:
+            scene.model.setNodeName(self.nodeId, name)
 
-    def addInputPort(self, label='input', connectionLimit=-1):
-        self._addPort(label, 'in', connectionLimit)
+    def addInputPort(self, label='input', connectionLimit=-1, dataType=None):
+        self._addPort(label, 'in', connectionLimit, dataType)
 
-    def addOutputPort(self, label='output', connectionLimit=-1):
-        self._addPort(label, 'out', connectionLimit)
+    def addOutputPort(self, label='output', connectionLimit=-1, dataType=None):
+        self._addPort(label, 'out', connectionLimit, dataType)
+
+    def portSchema(self):
+        """
+        Returns the (inputs, outputs) lists of (name, connectionLimit,
+        dataType) of the ports.
+        """
+        return ([(p.name, p.connectionLimit, p.dataType) for p in self._inputs],
+                [(p.name, p.connectionLimit, p.dataType) for p in self._outputs])
 
     def adjustSize(self):
+        self._inSlots = self._portSlots(len(self._inputs))
+        self._outSlots = self._portSlots(len(self._outputs))
+        self._layoutSize = None
         self._width, self._height = self._calcSize()
         self._sizer.setPos(self._width, self._height)
         self.setSize(self._width, self._height)
@@ -345,103 +1044,1753 @@ class NodeItem(QtGui.QGraphicsRectItem):
 
     def setSize(self, w, h):
         """
-        Resize block function.
+        Resize block function, only the port and label positions affected
+        by the change are updated.
 
         Args:
-            w (float): width of the circle.
-            h (float): height of the circle.
+            w (float): width of the node.
+            h (float): height of the node.
         """
-        labelRect = self._label.boundingRect()
-        inPortRect = None
-        outPortRect = None
-        if self._inputsTexts:
-            portRect = self._inputsTexts[0].boundingRect()
-        if self._outputsTexts:
-            outPortRect = self._outputsTexts[0].boundingRect()
-
         # Limit the block size:
         if h < self._height:
             h = self._height
         if w < self._width:
             w = self._width
+        if self._layoutSize == (w, h):
+            return w, h
+        start = clock() if profiler.enabled else None
+        oldW, oldH = self._layoutSize or (None, None)
+        self._layoutSize = (w, h)
         self.setRect(0.0, 0.0, w, h)
         # center label:
-        rect = self._label.boundingRect()
-        lw, lh = rect.width(), rect.height()
-        lx = (w - lw) / 2
-        ly = (h - lh) / 2
-        self._label.setPos(lx, ly)
-        # update port positions:
-        sizerRect = self._sizer.boundingRect()
-        sizerHeight = sizerRect.height()
-        padding = (0, sizerHeight * 2)
-        if len(self._inputs) == 1:
-            self._inputs[0].setPos(padding[0], h / 2)
-        elif len(self._inputs) > 1:
-            y = 5
-            dy = (h - 10) / (len(self._inputs) - 1)
-            for inp in self._inputs:
-                if inp == self._inputs[0]:
-                    inp.setPos(padding[0], y + padding[1])
-                elif inp == self._inputs[-1]:
-                    inp.setPos(padding[0], y - padding[1])
-                else:
-                    inp.setPos(padding[0], y)
-                y += dy
-        if len(self._outputs) == 1:
-            self._outputs[0].setPos(w-padding[0], h / 2)
-        elif len(self._outputs) > 1:
-            y = 5
-            dy = (h - 10) / (len(self._outputs) - 1)
-            for outp in self._outputs:
-                if outp == self._outputs[0]:
-                    outp.setPos(w-padding[0], y + padding[1])
-                elif outp == self._outputs[-1]:
-                    outp.setPos(w-padding[0], y - padding[1])
-                else:
-                    outp.setPos(w-padding[0], y)
-                y += dy
-        # update text position
-        for idx, txt in enumerate(self._inputsTexts):
-            pRect = self._inputs[idx].boundingRect()
-            pw, ph = pRect.width(), pRect.height()
-            tHeight = txt.boundingRect().height()
-            txt.setPos(self._inputs[idx].x()+(pw/2), self._inputs[idx].y()-(tHeight/2))
-        for idx, txt in enumerate(self._outputsTexts):
-            pRect = self._outputs[idx].boundingRect()
-            pw, ph = pRect.width(), pRect.height()
-            tWidth = txt.boundingRect().width()
-            tHeight = txt.boundingRect().height()
-            txt.setPos((self._outputs[idx].x()-tWidth)-(pw/2), self._outputs[idx].y()-(tHeight/2))
+        lw, lh = self._label.textSize()
+        self._label.setPos((w - lw) / 2, (h - lh) / 2)
+        # update port and text positions, inputs only move with the height
+        # and outputs with both the width and the height.
+        if h != oldH and self._inputs:
+            pw = self._portSize(self._inputs[0])[0]
+            for port, text, (offset, factor) in zip(
+                    self._inputs, self._inputsTexts, self._inSlots):
+                y = offset + factor * h
+                port.setPos(0.0, y)
+                text.setPos(pw / 2, y - (text.textSize()[1] / 2))
+        if (w != oldW or h != oldH) and self._outputs:
+            pw = self._portSize(self._outputs[0])[0]
+            for port, text, (offset, factor) in zip(
+                    self._outputs, self._outputsTexts, self._outSlots):
+                y = offset + factor * h
+                tWidth, tHeight = text.textSize()
+                port.setPos(w, y)
+                text.setPos((w - tWidth) - (pw / 2), y - (tHeight / 2))
+        scene = self.scene()
+        if self.nodeId is not None and isinstance(scene, NodeScene):
+            scene.model.setNodeSize(self.nodeId, w, h)
+        if start is not None:
+            profiler.addTime('NodeItem.setSize', clock() - start)
         return w, h
 
     def setBackgroundColor(self, color):
+        """
+        Args:
+            color (str): background color, None to use the theme color.
+        """
         self._colorBg = color
-        self.setBrush(QtGui.QBrush(QtGui.QColor(self._colorBg)))
+        self.update()
+        scene = self.scene()
+        if self.nodeId is not None and isinstance(scene, NodeScene):
+            scene.model.node(self.nodeId).color = color
 
     def setSelectedColor(self, color):
+        """
+        Args:
+            color (str): color while pressed, None to use the theme color.
+        """
         self._colorSelected = color
-        self.setBrush(QtGui.QBrush(QtGui.QColor(self._colorSelected)))
+        self.update()
 
     def setTextColor(self, color):
+        """
+        Args:
+            color (str): label color, None to use the theme color.
+        """
         self._textColor = color
-        self._label.setDefaultTextColor(QtGui.QColor(self._textColor))
-        portTexts = self._inputsTexts + self._outputsTexts
+        portTexts = [self._label] + self._inputsTexts + self._outputsTexts
         for text in portTexts:
-            text.setDefaultTextColor(QtGui.QColor(self._textColor))
+            text.textColor = color
+            text.update()
+        scene = self.scene()
+        if self.nodeId is not None and isinstance(scene, NodeScene):
+            scene.model.node(self.nodeId).textColor = color
+
+
+class GroupNodeItem(NodeItem):
+    """
+    Collapsed group of a NodeScene.
+
+    The item is not a model node, its ports proxy the ports of the grouped
+    nodes that connect to nodes outside of the group and carry their port
+    ids.  Double click opens the group in its own NodeViewer.
+    """
+
+    def __init__(self, name='Group', parent=None):
+        super(GroupNodeItem, self).__init__(name, parent)
+        self.groupId = None
+
+    def __str__(self):
+        return 'GroupNodeItem(name=\'{}\')'.format(self.name)
+
+    def currentBrush(self):
+        if self._pressed:
+            return itemTheme(self).brush('node.selected', self._colorSelected)
+        return itemTheme(self).brush('group.background', self._colorBg)
+
+    def itemChange(self, change, value):
+        if change == self.ItemPositionHasChanged:
+            scene = self.scene()
+            if self.groupId is not None and isinstance(scene, NodeScene):
+                scene._groupItemMoved(self)
+        return super(GroupNodeItem, self).itemChange(change, value)
+
+    def mouseDoubleClickEvent(self, event):
+        scene = self.scene()
+        if self.groupId is not None and isinstance(scene, NodeScene):
+            scene.openGroup(self.groupId)
+        super(GroupNodeItem, self).mouseDoubleClickEvent(event)
 
 
 class NodeScene(QtGui.QGraphicsScene):
+    """
+    Scene mirroring a GraphModel.
+
+    NodeItems added to the scene are registered in the model, model nodes
+    without an item are only materialized when requested with nodeItem() or
+    when a NodeViewer shows the area they cover.
+
+    In virtualized mode the items of nodes leaving the area shown by the
+    viewers are parked in a pool and recycled for the nodes coming into
+    view, so only the visible part of a huge graph has graphics items.
+    Parked nodes are rebuilt through the nodeFactory, custom NodeItem
+    classes need one to come back with their own class.  Edges crossing
+    the visible area with an end off screen are drawn as detached pipes
+    following the model geometry.
+
+    With batchedPipes the pipes are LayerPipes drawn by a single
+    PipeLayerItem instead of one PipeItem each, a left click on a pipe
+    selects it.
+
+    The nodes of a collapsed model group have no items, a GroupNodeItem
+    stands for them with proxy ports for the connections leaving the group.
+    A scene made with a groupId only shows the nodes of that group and
+    nodes added to it join the group, openGroup() shows one in a new
+    NodeViewer.
+    """
+
+    # emitted once a graph streamed in with loadGraph() is complete.
+    graphLoaded = QtCore.Signal()
+    # emitted once a background autoLayout() is applied.
+    layoutFinished = QtCore.Signal()
 
-    def __init__(self, parent=None, bgColor='#181818'):
+    _layoutComputed = QtCore.Signal(object)
+
+    def __init__(self, parent=None, bgColor=None, model=None, theme=None,
+                 batchedPipes=False, groupId=None):
         super(NodeScene, self).__init__(parent)
+        self.theme = theme or defaultTheme
         self.setBackgroundColor(bgColor)
+        self.model = model if model is not None else GraphModel()
+        # model group the scene is limited to, None shows the whole graph.
+        self._scopeGroupId = groupId
+        # GroupNodeItems of the collapsed groups, groups to rebuild and the
+        # (viewer, scene) pairs opened with openGroup(), by group id.
+        self._groupItems = {}
+        self._dirtyGroups = set()
+        self._groupViewers = {}
+        # callable(GraphNode) -> NodeItem used to materialize model nodes.
+        self.nodeFactory = None
+        # NodeTypeRegistry making the dropped nodes and, without a
+        # nodeFactory, the model nodes of registered types.
+        self.nodeRegistry = None
+        self._nodeItems = {}
+        self._portItems = {}
+        self._pipeItems = {}
+        # park the items of nodes out of view, see updateMaterialized().
+        self.virtualized = False
+        # scene units materialized around the viewers visible area.
+        self.materializeMargin = 200.0
+        # parked items kept per pool for recycling.
+        self.poolSize = 256
+        # space kept between the graph bounds and the scene rect edges.
+        self.sceneMargin = 800.0
+        # distance in scene units a click selects a batched pipe from.
+        self.pipePickDistance = 5.0
+        self._pipeLayer = None
+        if batchedPipes:
+            self._pipeLayer = PipeLayerItem()
+            self.addItem(self._pipeLayer)
+        # port items bucketed by scene position for hit tests.
+        self._portIndex = SpatialGrid(cellSize=64.0)
+        # model node and edge bounding boxes for the visible area queries.
+        self._nodeIndex = SpatialGrid(cellSize=256.0)
+        self._edgeIndex = SpatialGrid(cellSize=256.0)
+        # pipes of edges with an end not materialized, by edge id.
+        self._detachedPipes = {}
+        # parked NodeItems by (nodeType, input count, output count).
+        self._nodePool = {}
+        self._pipePool = []
+        self._parking = False
+        self._connecting = False
+        # typed change notifications batched per user action, see
+        # graphEvents.  Mouse gestures and the bulk edits of the scene are
+        # transactions.
+        self.events = GraphEventBus(self.model)
+        self._gestureOpen = False
+        # history of the edits made through the viewers and commands.
+        self.undoStack = UndoStack()
+        # port data type compatibility, see graphRules.
+        self.connectionRules = ConnectionRules()
+        # refuse the connections closing a cycle.
+        self.preventCycles = True
+        self._topoIndex = TopologicalIndex(self.model)
+        # name search, built on first use, and the highlighted node ids.
+        self._searchIndex = None
+        self._searchMatches = set()
+        # evaluator whose result cache hits and misses the nodes show.
+        self._cacheEvaluator = None
+        # start port of the connection being dragged and the nodes its
+        # node reaches in the other direction, see isConnectionTarget().
+        self._dragPort = None
+        self._dragReached = None
+        # (x, y, width, height) of the nodes a mouse press may move.
+        self._gesture = None
+        # pipe connections and detached edges waiting for a path rebuild.
+        self._dirtyPipes = set()
+        self._dirtyEdges = set()
+        self._pipeTimer = QtCore.QTimer(self)
+        self._pipeTimer.setSingleShot(True)
+        self._pipeTimer.setInterval(0)
+        self._pipeTimer.timeout.connect(self.flushPipeUpdates)
+        self._loader = None
+        self._loadTimer = QtCore.QTimer(self)
+        self._loadTimer.setInterval(0)
+        self._loadTimer.timeout.connect(self._loadNextChunk)
+        self._materializeTimer = QtCore.QTimer(self)
+        self._materializeTimer.setSingleShot(True)
+        self._materializeTimer.setInterval(0)
+        self._materializeTimer.timeout.connect(self.updateMaterialized)
+        # single worker computing background layouts, see autoLayout().
+        self._layoutExecutor = None
+        self._layoutFuture = None
+        self._layoutComputed.connect(
+            self._applyComputedLayout, QtCore.Qt.QueuedConnection)
+        self._resetSceneRect()
+        model = self.model
+        for node in model.nodes():
+            self._nodeMoved(node)
+        if self._scopeGroupId is None:
+            # groups collapsed before the scene was built, their members
+            # were left out of the index above.
+            for group in model.groups():
+                if not group.collapsed:
+                    continue
+                if group.x is None and group.nodeIds:
+                    group.x = min(model.node(n).x for n in group.nodeIds)
+                    group.y = min(model.node(n).y for n in group.nodeIds)
+                self._buildGroupItem(group)
+        for edge in model.edges():
+            self._edgeMoved(edge.id)
+        model.changeCallbacks.append(self._modelChanged)
+
+    def getNodeItems(self):
+        return list(self._nodeItems.values())
+
+    def getPipeItems(self):
+        return list(self._pipeItems.values())
+
+    def getPortItem(self, portId):
+        return self._portItems.get(portId)
+
+    def pipeLayer(self):
+        """
+        Returns the PipeLayerItem drawing the pipes or None when the pipes
+        are not batched.
+        """
+        return self._pipeLayer
+
+    def addPipe(self, pipe):
+        """
+        Add a PipeItem or LayerPipe to the scene.
+        """
+        if isinstance(pipe, LayerPipe):
+            self._pipeLayer.addPipe(pipe)
+        else:
+            self.addItem(pipe)
+
+    def removePipe(self, pipe):
+        if isinstance(pipe, LayerPipe):
+            if pipe.layer is not None:
+                pipe.layer.removePipe(pipe)
+        else:
+            self.removeItem(pipe)
+
+    def selectedPipes(self):
+        if self._pipeLayer is None:
+            return []
+        return self._pipeLayer.selectedPipes()
+
+    def schedulePipeUpdate(self, connection):
+        """
+        Mark a PipeConnection path dirty, dirty paths are rebuilt once on
+        the next event loop iteration no matter how many of their ports moved.
+
+        Args:
+            connection (PipeConnection): connection to update.
+        """
+        self._dirtyPipes.add(connection)
+        if not self._pipeTimer.isActive():
+            self._pipeTimer.start()
+
+    def flushPipeUpdates(self):
+        """
+        Rebuild the paths of all the dirty pipes now.
+        """
+        self._pipeTimer.stop()
+        start = clock() if profiler.enabled else None
+        dirty, self._dirtyPipes = self._dirtyPipes, set()
+        for connection in dirty:
+            if connection._pipe.scene() is self:
+                connection.updatePath()
+        dirtyEdges, self._dirtyEdges = self._dirtyEdges, set()
+        for edgeId in dirtyEdges:
+            pipe = self._detachedPipes.get(edgeId)
+            if pipe is not None:
+                self._setEdgeEnds(pipe, self.model.edge(edgeId))
+        if self._pipeLayer is not None:
+            self._pipeLayer.flush()
+        if start is not None:
+            profiler.count('pipes.rebuilt', len(dirty) + len(dirtyEdges))
+            profiler.addTime('NodeScene.flushPipeUpdates', clock() - start)
+
+    def findPort(self, pos, radius=0.0, accept=None):
+        """
+        Find the port closest to a scene position using the port index.
+
+        Args:
+            pos (QtCore.QPointF): scene position.
+            radius (float): max distance from the port shape, 0 only
+                returns a port directly under the position.
+            accept (callable): optional filter called with a PortItem.
+
+        Returns:
+            PortItem: the closest port or None.
+        """
+        start = clock() if profiler.enabled else None
+        port = self._portIndex.nearest(pos.x(), pos.y(), radius, accept)
+        if start is not None:
+            profiler.addTime('NodeScene.findPort', clock() - start)
+        return port
+
+    def _portMoved(self, port):
+        rect = port.sceneBoundingRect()
+        self._portIndex.insert(
+            port, rect.x(), rect.y(), rect.width(), rect.height())
+
+    def canConnect(self, fromPort, toPort):
+        """
+        Returns True when the rules allow a pipe between two port items:
+        opposite directions on different nodes, compatible data types and,
+        with preventCycles, no cycle closed by the new edge.
+        """
+        if toPort is None or fromPort is None or toPort is fromPort:
+            return False
+        if toPort.portType == fromPort.portType or \
+                toPort.parentItem() is fromPort.parentItem():
+            return False
+        if fromPort.portType == 'out':
+            outPort, inPort = fromPort, toPort
+        else:
+            outPort, inPort = toPort, fromPort
+        if not self.connectionRules.isCompatible(
+                outPort.dataType, inPort.dataType):
+            return False
+        if self.preventCycles and outPort.portId is not None and \
+                inPort.portId is not None:
+            # model nodes, the ports may be proxies of a collapsed group.
+            model = self.model
+            if self._closesCycle(model.port(outPort.portId).nodeId,
+                                 model.port(inPort.portId).nodeId):
+                return False
+        return True
+
+    def _closesCycle(self, outNodeId, inNodeId):
+        index = self._topoIndex
+        start = self._dragPort
+        if start is None or not index.isValid():
+            return index.wouldCreateCycle(outNodeId, inNodeId)
+        if start.portId is None:
+            return index.wouldCreateCycle(outNodeId, inNodeId)
+        startNodeId = self.model.port(start.portId).nodeId
+        if startNodeId not in (outNodeId, inNodeId):
+            return index.wouldCreateCycle(outNodeId, inNodeId)
+        if index.order(outNodeId) < index.order(inNodeId):
+            return False
+        # while dragging every candidate shares the start node, its
+        # ancestors or descendants are collected once for the whole drag.
+        if self._dragReached is None:
+            if start.portType == 'out':
+                self._dragReached = index.ancestors(startNodeId)
+            else:
+                self._dragReached = index.descendants(startNodeId)
+        if start.portType == 'out':
+            return inNodeId in self._dragReached
+        return outNodeId in self._dragReached
+
+    def beginConnectionDrag(self, port):
+        """
+        Highlight the ports a connection dragged from "port" can end on.
+        """
+        self._dragPort = port
+        self._dragReached = None
+        self.update()
+
+    def endConnectionDrag(self):
+        if self._dragPort is not None:
+            self._dragPort = None
+            self._dragReached = None
+            self.update()
+
+    def isConnectionTarget(self, port):
+        """
+        Returns True when the connection being dragged can end on "port".
+        """
+        return self._dragPort is not None and \
+            self.canConnect(self._dragPort, port)
+
+    def isMaterialized(self, nodeId):
+        return nodeId in self._nodeItems
+
+    def nodeItem(self, nodeId):
+        """
+        Returns the NodeItem of a model node, creating it if needed.
+
+        Args:
+            nodeId (int): id of the node in the model.
+
+        Returns:
+            NodeItem: the item representing the node.
+        """
+        item = self._nodeItems.get(nodeId)
+        if item is None:
+            start = clock() if profiler.enabled else None
+            item = self._createNodeItem(self.model.node(nodeId))
+            if start is not None:
+                profiler.addTime('NodeScene.nodeItem', clock() - start)
+        return item
+
+    def materializeRect(self, rect):
+        """
+        Create the items for all model nodes intersecting the given rect and
+        detached pipes for the edges crossing it.
+
+        Args:
+            rect (QtCore.QRectF): area in scene coordinates.
+        """
+        area = (rect.x(), rect.y(), rect.width(), rect.height())
+        model = self.model
+        for nodeId in self._nodeIndex.queryRect(*area):
+            if nodeId not in self._nodeItems:
+                self._createNodeItem(model.node(nodeId))
+        for edgeId in self._edgeIndex.queryRect(*area):
+            if edgeId not in self._pipeItems and \
+                    edgeId not in self._detachedPipes:
+                self._createDetachedPipe(model.edge(edgeId))
+
+    def materializedRect(self):
+        """
+        Returns the area the NodeViewers show grown by materializeMargin or
+        None when the scene has no viewer.
+        """
+        rect = None
+        for view in self.views():
+            if isinstance(view, NodeViewer):
+                viewRect = view.visibleSceneRect()
+                rect = viewRect if rect is None else rect.united(viewRect)
+        if rect is not None:
+            margin = self.materializeMargin
+            rect = rect.adjusted(-margin, -margin, margin, margin)
+        return rect
+
+    def scheduleMaterialize(self):
+        """
+        Update the materialized items on the next event loop iteration.
+        """
+        if not self._materializeTimer.isActive():
+            self._materializeTimer.start()
+
+    def updateMaterialized(self):
+        """
+        Create the items of the area shown by the NodeViewers, in
+        virtualized mode the items out of that area are parked for recycling.
+        Selected nodes and the node grabbed by the mouse are never parked.
+        """
+        self._materializeTimer.stop()
+        self._rebuildGroups()
+        rect = self.materializedRect()
+        if rect is None:
+            return
+        if self.virtualized:
+            area = (rect.x(), rect.y(), rect.width(), rect.height())
+            wanted = self._nodeIndex.queryRect(*area)
+            grabber = self.mouseGrabberItem()
+            busy = grabber.topLevelItem() if grabber else None
+            for nodeId, item in list(self._nodeItems.items()):
+                if nodeId not in wanted and item is not busy and \
+                        not item.isSelected():
+                    self._parkNodeItem(item)
+            edges = self._edgeIndex.queryRect(*area)
+            for edgeId in list(self._detachedPipes):
+                if edgeId not in edges:
+                    self._releasePipeItem(self._detachedPipes.pop(edgeId))
+        self.materializeRect(rect)
+
+    def _createNodeItem(self, node):
+        item = self._recycledNodeItem(node)
+        if item is None and self.nodeFactory:
+            item = self.nodeFactory(node)
+        elif item is None:
+            item = self._registryNodeItem(node)
+        if item is None:
+            item = NodeItem(node.name)
+            with item.deferLayout():
+                for portId in node.inputs:
+                    port = self.model.port(portId)
+                    item.addInputPort(port.name, port.connectionLimit,
+                                      port.dataType)
+                for portId in node.outputs:
+                    port = self.model.port(portId)
+                    item.addOutputPort(port.name, port.connectionLimit,
+                                       port.dataType)
+        item.nodeId = node.id
+        item.setPos(node.x, node.y)
+        item.setSize(node.width, node.height)
+        if node.color != item._colorBg:
+            item.setBackgroundColor(node.color)
+        if node.textColor != item._textColor:
+            item.setTextColor(node.textColor)
+        self.addItem(item)
+        return item
+
+    def _registryNodeItem(self, node):
+        # an item of the registered node type, None when the type is unknown
+        # or its ports no longer match the model node.
+        registry = self.nodeRegistry
+        if registry is None or node.nodeType not in registry:
+            return None
+        item = registry.create(node.nodeType, node.name)
+        if len(item._inputs) != len(node.inputs) or \
+                len(item._outputs) != len(node.outputs):
+            return None
+        self._syncNodeItem(item, node)
+        return item
+
+    def _recycledNodeItem(self, node):
+        pool = self._nodePool.get(
+            (node.nodeType, len(node.inputs), len(node.outputs)))
+        if not pool:
+            return None
+        item = pool.pop()
+        self._syncNodeItem(item, node)
+        return item
+
+    def _syncNodeItem(self, item, node):
+        # name and port settings of the model node on an item with the same
+        # number of ports.
+        model = self.model
+        with item.deferLayout():
+            item.setName(node.name)
+            portSets = ((item._inputs, item._inputsTexts, node.inputs),
+                        (item._outputs, item._outputsTexts, node.outputs))
+            for ports, texts, portIds in portSets:
+                for port, text, portId in zip(ports, texts, portIds):
+                    record = model.port(portId)
+                    port.connectionLimit = record.connectionLimit
+                    port.dataType = record.dataType
+                    if port.name != record.name:
+                        port.name = record.name
+                        text.setPlainText(record.name)
+                        item._layoutPending = True
+
+    def _parkNodeItem(self, item):
+        node = self.model.node(item.nodeId)
+        for port in item._inputs + item._outputs:
+            for pipe in list(port._connectedPipes):
+                self._unbindPipe(pipe)
+        self._parking = True
+        try:
+            self.removeItem(item)
+        finally:
+            self._parking = False
+        item._pressed = False
+        pool = self._nodePool.setdefault(
+            (node.nodeType, len(node.inputs), len(node.outputs)), [])
+        if len(pool) < self.poolSize:
+            pool.append(item)
+
+    def _unbindPipe(self, pipe):
+        # drop the item of a pipe without disconnecting its model edge.
+        self._pipeItems.pop(pipe.edgeId, None)
+        connection = pipe._connection
+        if connection is not None:
+            self._dirtyPipes.discard(connection)
+            connection.detach()
+        self._releasePipeItem(pipe)
+
+    def _takePipeItem(self):
+        if self._pipeLayer is not None:
+            return LayerPipe()
+        if self._pipePool:
+            return self._pipePool.pop()
+        return PipeItem()
+
+    def _releasePipeItem(self, pipe):
+        if pipe.scene() is self:
+            self.removePipe(pipe)
+        if isinstance(pipe, LayerPipe):
+            return
+        pipe.edgeId = None
+        pipe._dotted = False
+        pipe._color = None
+        pipe._dottedColor = None
+        pipe.setPath(QtGui.QPainterPath())
+        if len(self._pipePool) < self.poolSize:
+            self._pipePool.append(pipe)
+
+    def _createDetachedPipe(self, edge):
+        pipe = self._takePipeItem()
+        pipe.edgeId = edge.id
+        self.addPipe(pipe)
+        self._setEdgeEnds(pipe, edge)
+        self._detachedPipes[edge.id] = pipe
+        return pipe
+
+    def _portScenePos(self, portId):
+        # the port item position or the one its node layout would give it.
+        item = self._portItems.get(portId)
+        if item is not None:
+            return item.scenePos()
+        model = self.model
+        port = model.port(portId)
+        node = model.node(port.nodeId)
+        if port.portType == 'in':
+            x, count = node.x, len(node.inputs)
+        else:
+            x, count = node.x + node.width, len(node.outputs)
+        offset, factor = portSlot(port.index, count)
+        return QtCore.QPointF(x, node.y + offset + factor * node.height)
+
+    def _setEdgeEnds(self, pipe, edge):
+        model = self.model
+        outNode = model.node(model.port(edge.outPortId).nodeId)
+        pipe.setEnds(self._portScenePos(edge.outPortId),
+                     self._portScenePos(edge.inPortId), 'out', outNode.width)
+
+    def _modelChanged(self, kind, record):
+        if kind == 'geometry':
+            self._nodeMoved(record)
+            for edgeId in self.model.nodeEdges(record.id):
+                self._edgeMoved(edgeId)
+        elif kind == 'addNode':
+            self._nodeMoved(record)
+            self.scheduleMaterialize()
+        elif kind == 'addPort':
+            for edgeId in self.model.nodeEdges(record.nodeId):
+                self._edgeMoved(edgeId)
+        elif kind == 'connect':
+            self._edgeMoved(record.id)
+            if not self._connecting:
+                self._createPipe(record)
+            self._edgeGroupsChanged(record)
+            self.scheduleMaterialize()
+        elif kind == 'disconnect':
+            self._edgeIndex.remove(record.id)
+            pipe = self._pipeItems.get(record.id)
+            if pipe is not None:
+                self._unbindPipe(pipe)
+            pipe = self._detachedPipes.pop(record.id, None)
+            if pipe is not None:
+                self._releasePipeItem(pipe)
+            self._edgeGroupsChanged(record)
+        elif kind == 'removeNode':
+            self._nodeIndex.remove(record.id)
+            self._searchMatches.discard(record.id)
+            self._dropProxies(record)
+            self._groupChanged(record.groupId)
+        elif kind == 'name':
+            item = self._nodeItems.get(record.id)
+            if item is not None:
+                item.setName(record.name)
+        elif kind == 'portName':
+            self._portRenamed(record)
+        elif kind == 'group':
+            self._nodeGroupChanged(record)
+        elif kind == 'groupState':
+            if self._scopeGroupId is None:
+                if record.collapsed:
+                    self._collapseGroup(record)
+                else:
+                    self._expandGroup(record)
+        elif kind == 'removeGroup':
+            self._removeGroupItem(record.id)
+            self._dirtyGroups.discard(record.id)
+        elif kind == 'clear':
+            self._searchMatches.clear()
+            self._groupItems.clear()
+            self._dirtyGroups.clear()
+            self._nodeIndex.clear()
+            self._edgeIndex.clear()
+            for pipe in self._detachedPipes.values():
+                self._releasePipeItem(pipe)
+            self._detachedPipes.clear()
+
+    def _portRenamed(self, port):
+        item = self._nodeItems.get(port.nodeId)
+        if item is None:
+            return
+        if port.portType == 'in':
+            portItem = item._inputs[port.index]
+            text = item._inputsTexts[port.index]
+        else:
+            portItem = item._outputs[port.index]
+            text = item._outputsTexts[port.index]
+        if portItem.name != port.name:
+            portItem.name = port.name
+            with item.deferLayout():
+                text.setPlainText(port.name)
+                item._layoutPending = True
+
+    def _nodeMoved(self, node):
+        if not self._isNodeShown(node):
+            self._nodeIndex.remove(node.id)
+            return
+        self._nodeIndex.insert(node.id, node.x, node.y, node.width, node.height)
+        margin = self.sceneMargin
+        rect = self.sceneRect()
+        if node.x - margin < rect.left() or node.y - margin < rect.top() or \
+                node.x + node.width + margin > rect.right() or \
+                node.y + node.height + margin > rect.bottom():
+            self.setSceneRect(rect.united(QtCore.QRectF(
+                node.x - margin, node.y - margin,
+                node.width + margin * 2, node.height + margin * 2)))
+
+    def _edgeMoved(self, edgeId):
+        model = self.model
+        edge = model.edge(edgeId)
+        if not (self._portVisible(edge.outPortId) and
+                self._portVisible(edge.inPortId)):
+            # an end hidden in a collapsed group without proxy port.
+            self._edgeIndex.remove(edgeId)
+            self._dirtyEdges.discard(edgeId)
+            pipe = self._detachedPipes.pop(edgeId, None)
+            if pipe is not None:
+                self._releasePipeItem(pipe)
+            return
+        pos1 = self._portScenePos(edge.outPortId)
+        pos2 = self._portScenePos(edge.inPortId)
+        # the curve tangents bulge past the end points by up to the width
+        # of the node the pipe starts from.
+        bulge = model.node(model.port(edge.outPortId).nodeId).width
+        x1, x2 = sorted((pos1.x(), pos2.x()))
+        y1, y2 = sorted((pos1.y(), pos2.y()))
+        bulge = min(bulge, x2 - x1)
+        self._edgeIndex.insert(edgeId, x1 - bulge, y1, x2 - x1 + bulge * 2,
+                               y2 - y1)
+        if edgeId in self._detachedPipes:
+            self._dirtyEdges.add(edgeId)
+            if not self._pipeTimer.isActive():
+                self._pipeTimer.start()
+
+    def _resetSceneRect(self):
+        self.setSceneRect(-(SCENE_AREA / 2), -(SCENE_AREA / 2),
+                          SCENE_AREA, SCENE_AREA)
+
+    @batchedEvents
+    def clearGraph(self):
+        """
+        Remove every item and model record.
+        """
+        for viewer, scene in self._groupViewers.values():
+            viewer.close()
+            scene.releaseModel()
+        self._groupViewers.clear()
+        self._loadTimer.stop()
+        self._loader = None
+        self._dirtyPipes = set()
+        self._dirtyEdges = set()
+        if self._pipeLayer is not None:
+            # keep the layer alive through clear().
+            self.removeItem(self._pipeLayer)
+            self._pipeLayer.reset()
+        self.clear()
+        if self._pipeLayer is not None:
+            self.addItem(self._pipeLayer)
+        self._nodeItems.clear()
+        self._portItems.clear()
+        self._pipeItems.clear()
+        self._detachedPipes.clear()
+        self._nodePool.clear()
+        del self._pipePool[:]
+        self._portIndex.clear()
+        self.model.clear()
+        self._resetSceneRect()
+        self.undoStack.clear()
+
+    def releaseModel(self):
+        """
+        Stop following the model, for a scene discarded while its model
+        lives on.
+        """
+        if self._modelChanged in self.model.changeCallbacks:
+            self.model.changeCallbacks.remove(self._modelChanged)
+        self._topoIndex.close()
+        self.events.close()
+        if self._searchIndex is not None:
+            self._searchIndex.close()
+        self.hideCacheStats()
+
+    def saveGraph(self, path):
+        """
+        Save the graph, see graphSerializer for the formats.
+
+        Args:
+            path (str): destination, ".json" files are saved as JSON lines
+                and anything else in the binary format.
+        """
+        graphSerializer.save(self.model, path)
+
+    def loadGraph(self, path, chunkSize=2000, blocking=False, useMmap=False):
+        """
+        Replace the graph with a saved one.
+
+        Records are streamed into the model chunk by chunk from the event
+        loop, items are only created for the nodes the viewers show so the
+        area around the viewport is populated first.  graphLoaded is
+        emitted when the whole file is read.
+
+        Args:
+            path (str): file to load.
+            chunkSize (int): records read per event loop iteration.
+            blocking (bool): read the whole file before returning.
+            useMmap (bool): memory map binary files.
+        """
+        self.clearGraph()
+        self._loader = graphSerializer.iterLoad(
+            path, self.model, chunkSize, useMmap)
+        if blocking:
+            while self._loader:
+                self._loadNextChunk()
+        else:
+            self._loadTimer.start()
+
+    @batchedEvents
+    def _loadNextChunk(self):
+        # one event batch per chunk.
+        try:
+            nodes, edges = next(self._loader)
+        except StopIteration:
+            self._loadTimer.stop()
+            self._loader = None
+            self.graphLoaded.emit()
+            return
+        except Exception:
+            self._loadTimer.stop()
+            self._loader = None
+            raise
+        for edge in edges:
+            if edge.id not in self._pipeItems:
+                self._createPipe(edge)
+        if nodes or edges:
+            self.updateMaterialized()
+
+    def _nodeItemAdded(self, item):
+        if isinstance(item, GroupNodeItem):
+            return
+        model = self.model
+        if item.nodeId is None or not model.hasNode(item.nodeId):
+            rect = item.rect()
+            node = model.addNode(item.name, nodeTypeName(item),
+                                 item.x(), item.y(),
+                                 rect.width(), rect.height())
+            item.nodeId = node.id
+            node.color = item._colorBg
+            node.textColor = item._textColor
+            scope = self._scopeGroupId
+            if scope is not None and model.hasGroup(scope):
+                model.setNodeGroup(node.id, scope)
+        node = model.node(item.nodeId)
+        self._nodeItems[node.id] = item
+        portSets = ((item._inputs, node.inputs), (item._outputs, node.outputs))
+        for ports, portIds in portSets:
+            for idx, port in enumerate(ports):
+                if idx < len(portIds):
+                    port.portId = portIds[idx]
+                    self._portItems[port.portId] = port
+                else:
+                    self._portItemAdded(item, port)
+        rect = item.rect()
+        model.setNodeSize(node.id, rect.width(), rect.height())
+        self._bindPipes(item)
+
+    def _nodeItemRemoved(self, item):
+        if self._nodeItems.get(item.nodeId) is not item:
+            return
+        del self._nodeItems[item.nodeId]
+        for port in item._inputs + item._outputs:
+            self._portItems.pop(port.portId, None)
+            port.portId = None
+        if self._parking:
+            item.nodeId = None
+            return
+        # the model notifies every removed edge, see _modelChanged().
+        self.model.removeNode(item.nodeId)
+        item.nodeId = None
+
+    def _portItemAdded(self, item, port):
+        port.portId = self.model.addPort(
+            item.nodeId, port.name, port.portType, port.connectionLimit,
+            dataType=port.dataType).id
+        self._portItems[port.portId] = port
+
+    def _bindPipes(self, item):
+        # create the pipes of model edges between materialized nodes.
+        model = self.model
+        for port in item._inputs + item._outputs:
+            for edgeId in model.port(port.portId).edges:
+                if edgeId not in self._pipeItems:
+                    self._createPipe(model.edge(edgeId))
+
+    def _createPipe(self, edge):
+        outPort = self._portItems.get(edge.outPortId)
+        inPort = self._portItems.get(edge.inPortId)
+        if outPort is None or inPort is None:
+            return None
+        detached = self._detachedPipes.pop(edge.id, None)
+        if detached is not None:
+            self._dirtyEdges.discard(edge.id)
+            self._releasePipeItem(detached)
+        return self.connectPorts(outPort, inPort, edge.id)._pipe
+
+    def connectPorts(self, fromPort, toPort, edgeId=None):
+        """
+        Connect two port items without going through the viewer.
+
+        Args:
+            fromPort (PortItem): start port.
+            toPort (PortItem): end port.
+            edgeId (int): id of an existing model edge the pipe represents.
+
+        Returns:
+            PipeConnection: the new connection.
+        """
+        connection = PipeConnection(fromPort, None, self, self._takePipeItem())
+        connection._pipe.edgeId = edgeId
+        connection.setToPort(toPort)
+        connection.setEndPos(toPort.scenePos())
+        return connection
+
+    @batchedEvents
+    def bulkLoad(self, nodes, connections=()):
+        """
+        Add many nodes and connections at once, the scene index is
+        suspended while the items are inserted and rebuilt once afterwards.
+
+        Args:
+            nodes (list[NodeItem]): positioned nodes to add.
+            connections (list[tuple]): (fromPort, toPort) PortItem pairs.
+
+        Returns:
+            list[PipeConnection]: the new connections.
+        """
+        indexMethod = self.itemIndexMethod()
+        self.setItemIndexMethod(self.NoIndex)
+        try:
+            for node in nodes:
+                self.addItem(node)
+            result = [self.connectPorts(fromPort, toPort)
+                      for fromPort, toPort in connections]
+        finally:
+            self.setItemIndexMethod(indexMethod)
+        return result
+
+    def _pipeConnected(self, pipe):
+        if pipe.edgeId is None:
+            inPort, outPort = pipe.getInPort(), pipe.getOutPort()
+            if inPort.portId is None or outPort.portId is None:
+                return
+            self._connecting = True
+            try:
+                edge = self.model.connect(outPort.portId, inPort.portId)
+            finally:
+                self._connecting = False
+            pipe.edgeId = edge.id
+        self._pipeItems[pipe.edgeId] = pipe
+
+    def _pipeDeleted(self, pipe):
+        if pipe.edgeId is None:
+            return
+        self._pipeItems.pop(pipe.edgeId, None)
+        self.model.disconnect(pipe.edgeId)
+        pipe.edgeId = None
+
+    @batchedEvents
+    def removeNodes(self, nodeIds):
+        """
+        Remove nodes with their edges, materialized or not.  This does not
+        go through the undoStack, see deleteNodes().
+
+        Every removed model edge unbinds its pipe from both ports through
+        dict lookups, so the cost is proportional to the removed nodes and
+        edges whatever the size of the graph.
+
+        Args:
+            nodeIds (iterable[int]): ids of the nodes.
+        """
+        for nodeId in list(nodeIds):
+            item = self._nodeItems.get(nodeId)
+            if item is not None:
+                self.removeItem(item)
+            elif self.model.hasNode(nodeId):
+                self.model.removeNode(nodeId)
+
+    @batchedEvents
+    def restoreNodes(self, nodes, edges=()):
+        """
+        Add back nodes captured with graphUndo.snapshotNodes(), the nodes
+        that had an item get one again.
+
+        Args:
+            nodes (list[tuple]): node records.
+            edges (list[tuple]): (edgeId, outPortId, inPortId) records.
+        """
+        model = self.model
+        for (nodeId, name, nodeType, x, y, width, height, color, textColor,
+             attrs, inputs, outputs, groupId, materialized) in nodes:
+            node = model.addNode(name, nodeType, x, y, width, height, nodeId)
+            node.color = color
+            node.textColor = textColor
+            node.attrs = dict(attrs) if attrs else None
+            for portType, ports in (('in', inputs), ('out', outputs)):
+                for portId, portName, limit, dataType in ports:
+                    model.addPort(nodeId, portName, portType, limit, portId,
+                                  dataType)
+            if groupId is not None and model.hasGroup(groupId):
+                model.setNodeGroup(nodeId, groupId)
+        for edgeId, outPortId, inPortId in edges:
+            if not model.hasEdge(edgeId):
+                model.connect(outPortId, inPortId, edgeId)
+        for node in nodes:
+            if node[-1] and self._isNodeShown(model.node(node[0])):
+                self.nodeItem(node[0])
+
+    def copyNodes(self, nodeIds):
+        """
+        Put nodes and the pipes between them on the clipboard.
+
+        Returns:
+            bytes: the clipboard payload, see graphSerializer.dumpNodes().
+        """
+        nodeIds = [n for n in nodeIds if self.model.hasNode(n)]
+        if not nodeIds:
+            return None
+        data = graphSerializer.dumpNodes(self.model, nodeIds)
+        mime = QtCore.QMimeData()
+        mime.setData(NODES_MIME, QtCore.QByteArray(data))
+        QtGui.QApplication.clipboard().setMimeData(mime)
+        return data
+
+    def createNode(self, typeName, pos, name=None):
+        """
+        Add a node of a type of the nodeRegistry, a bare NodeItem named
+        after the type when it is not registered.
+
+        Args:
+            typeName (str): node type.
+            pos (QPointF): scene position of the node.
+            name (str): node name, the class default when None.
+
+        Returns:
+            NodeItem: the new item.
+        """
+        start = clock() if profiler.enabled else None
+        registry = self.nodeRegistry
+        if registry is not None and typeName in registry:
+            item = registry.create(typeName, name)
+        else:
+            item = NodeItem(name or typeName)
+        item.setPos(pos)
+        self.addItem(item)
+        self.undoStack.push(
+            AddNodesCommand(self, [item.nodeId], 'Add Node'), applied=True)
+        if start is not None:
+            profiler.addTime('NodeScene.createNode', clock() - start)
+        return item
+
+    def pasteNodes(self, pos=None):
+        """
+        Add copies of the clipboard nodes.
+
+        Args:
+            pos (QPointF): scene position of the top left of the copies,
+                their original position when None.
+
+        Returns:
+            list[int]: ids of the new nodes.
+        """
+        mime = QtGui.QApplication.clipboard().mimeData()
+        if mime is None or not mime.hasFormat(NODES_MIME):
+            return []
+        return self.insertNodes(mime.data(NODES_MIME).data(), pos, 'Paste')
+
+    def duplicateNodes(self, nodeIds, offset=DUPLICATE_OFFSET):
+        """
+        Copy nodes next to themselves, the clipboard is not used.
+
+        Returns:
+            list[int]: ids of the new nodes.
+        """
+        model = self.model
+        nodeIds = [n for n in nodeIds if model.hasNode(n)]
+        if not nodeIds:
+            return []
+        left = min(model.node(n).x for n in nodeIds)
+        top = min(model.node(n).y for n in nodeIds)
+        data = graphSerializer.dumpNodes(model, nodeIds)
+        return self.insertNodes(
+            data, QtCore.QPointF(left + offset, top + offset), 'Duplicate')
+
+    @batchedEvents
+    def insertNodes(self, data, pos=None, text='Paste'):
+        """
+        Add the nodes of a graphSerializer.dumpNodes() payload as one
+        undoable step, the copies get new node, port and edge ids and are
+        selected.
+
+        The copies only go into the model, items are created for the ones
+        in the materialized area like after a loadGraph() and the scene
+        index is suspended meanwhile, so pasting thousands of nodes does not
+        lay out or connect items that are not shown.
+
+        Args:
+            data (bytes): the encoded nodes.
+            pos (QPointF): scene position of the top left of the copies,
+                their original position when None.
+            text (str): undo text.
+
+        Returns:
+            list[int]: ids of the new nodes.
+        """
+        model = self.model
+        x = y = None
+        if pos is not None:
+            x, y = pos.x(), pos.y()
+        nodes = graphSerializer.loadNodes(data, model, x, y)
+        nodeIds = [node.id for node in nodes]
+        if not nodeIds:
+            return nodeIds
+        if self._scopeGroupId is not None:
+            for nodeId in nodeIds:
+                model.setNodeGroup(nodeId, self._scopeGroupId)
+        self.undoStack.push(AddNodesCommand(self, nodeIds, text), applied=True)
+        indexMethod = self.itemIndexMethod()
+        self.setItemIndexMethod(self.NoIndex)
+        try:
+            self.updateMaterialized()
+        finally:
+            self.setItemIndexMethod(indexMethod)
+        self.clearSelection()
+        for nodeId in nodeIds:
+            item = self._nodeItems.get(nodeId)
+            if item is not None:
+                item.setSelected(True)
+        return nodeIds
+
+    def autoLayout(self, nodeIds=None, background=False, **options):
+        """
+        Arrange nodes in layers from their inputs to their outputs, see
+        graphLayout.computeLayout() for the options.
+
+        Laying out a subset only moves those nodes, they are placed from
+        the top left of their current bounds.  The model is read up front
+        so a background layout runs on a worker thread while the graph is
+        edited, the positions are then applied in the GUI thread as one
+        undoable step and layoutFinished is emitted.  A new background
+        layout replaces a pending one.
+
+        Args:
+            nodeIds (iterable[int]): nodes to lay out, all when None.
+            background (bool): compute the layout off the GUI thread.
+
+        Returns:
+            dict: {nodeId: (x, y)} applied positions, None in background.
+        """
+        nodes, edges = graphLayout.snapshotLayout(self.model, nodeIds)
+        if not background:
+            positions = graphLayout.computeLayout(nodes, edges, **options)
+            self.applyLayout(positions)
+            return positions
+        if self._layoutExecutor is None:
+            self._layoutExecutor = futures.ThreadPoolExecutor(1)
+        if self._layoutFuture is not None:
+            self._layoutFuture.cancel()
+        future = self._layoutExecutor.submit(
+            graphLayout.computeLayout, nodes, edges, **options)
+        self._layoutFuture = future
+        future.add_done_callback(self._layoutComputed.emit)
+        return None
+
+    def _applyComputedLayout(self, future):
+        if future is not self._layoutFuture or future.cancelled():
+            return
+        self._layoutFuture = None
+        self.applyLayout(future.result())
+        self.layoutFinished.emit()
+
+    @batchedEvents
+    def applyLayout(self, positions, text='Layout Nodes'):
+        """
+        Move many nodes at once as a single undoable step, the scene index
+        is suspended while the items move.
+
+        Args:
+            positions (dict): {nodeId: (x, y)}, removed nodes are skipped.
+        """
+        model = self.model
+        changes = {}
+        for nodeId, (x, y) in positions.items():
+            if model.hasNode(nodeId):
+                node = model.node(nodeId)
+                old = (node.x, node.y, node.width, node.height)
+                new = (x, y, node.width, node.height)
+                if new != old:
+                    changes[nodeId] = (old, new)
+        if not changes:
+            return
+        indexMethod = self.itemIndexMethod()
+        self.setItemIndexMethod(self.NoIndex)
+        try:
+            self.undoStack.push(NodeGeometryCommand(self, changes, text=text))
+        finally:
+            self.setItemIndexMethod(indexMethod)
+        self.scheduleMaterialize()
+
+    def setNodeGeometry(self, nodeId, x, y, width, height):
+        """
+        Move and resize a node through its item when it is materialized.
+        """
+        item = self._nodeItems.get(nodeId)
+        if item is None:
+            self.model.setNodePos(nodeId, x, y)
+            self.model.setNodeSize(nodeId, width, height)
+            return
+        item.setPos(x, y)
+        # the sizer drives setSize() and has to follow the new size.
+        item._sizer.setPos(width, height)
+
+    def connectPortIds(self, outPortId, inPortId, edgeId=None):
+        """
+        Connect two model ports, the pipe is created when both nodes are
+        materialized.
+
+        Returns:
+            GraphEdge: the new edge.
+        """
+        return self.model.connect(outPortId, inPortId, edgeId)
+
+    @batchedEvents
+    def disconnectEdges(self, edgeIds):
+        for edgeId in list(edgeIds):
+            self.model.disconnect(edgeId)
+
+    @batchedEvents
+    def undo(self):
+        self.undoStack.undo()
+
+    @batchedEvents
+    def redo(self):
+        self.undoStack.redo()
+
+    @batchedEvents
+    def deleteNodes(self, nodeIds, text='Delete Nodes'):
+        """
+        Undoable removal of nodes with their edges.
+        """
+        nodeIds = [n for n in nodeIds if self.model.hasNode(n)]
+        if nodeIds:
+            self.undoStack.push(RemoveNodesCommand(self, nodeIds, text))
+
+    @batchedEvents
+    def moveNodes(self, geometries, merge=False):
+        """
+        Undoable move or resize of nodes.
+
+        Args:
+            geometries (dict): {nodeId: (x, y, width, height)}.
+            merge (bool): merge with the previous moveNodes() of the same
+                nodes also called with merge, for continuous edits.
+        """
+        changes = {}
+        for nodeId, geometry in geometries.items():
+            node = self.model.node(nodeId)
+            changes[nodeId] = (
+                (node.x, node.y, node.width, node.height), tuple(geometry))
+        self.undoStack.push(NodeGeometryCommand(self, changes, merge))
+
+    @contextlib.contextmanager
+    def recordEdgeEdits(self, text='Edit Connections'):
+        """
+        Context manager pushing the connections and disconnections made in
+        the block as a single undoable command.
+        """
+        edits = []
+
+        def record(kind, edge):
+            if kind in ('connect', 'disconnect'):
+                edits.append((kind == 'connect', edge.id, edge.outPortId,
+                              edge.inPortId))
+
+        self.model.changeCallbacks.append(record)
+        try:
+            yield edits
+        finally:
+            self.model.changeCallbacks.remove(record)
+            if edits and not self.undoStack.isActive():
+                self.undoStack.push(
+                    EdgeEditsCommand(self, edits, text), applied=True)
+
+    def _beginGesture(self, pos):
+        if self._gestureOpen:
+            # the release of the last press was not seen.
+            self._endGesture()
+        self._gestureOpen = True
+        self.events.begin()
+        nodes = set(item for item in self.selectedItems()
+                    if isinstance(item, NodeItem))
+        for item in self.items(pos):
+            item = item.topLevelItem()
+            if isinstance(item, NodeItem):
+                nodes.add(item)
+        model = self.model
+        self._gesture = {}
+        for item in nodes:
+            if item.nodeId is not None:
+                node = model.node(item.nodeId)
+                self._gesture[node.id] = (
+                    node.x, node.y, node.width, node.height)
+
+    def _endGesture(self):
+        if not self._gestureOpen:
+            return
+        self._gestureOpen = False
+        try:
+            self._pushGesture()
+        finally:
+            self.events.end()
+
+    def _pushGesture(self):
+        gesture, self._gesture = self._gesture, None
+        if not gesture:
+            return
+        model = self.model
+        changes = {}
+        for nodeId, old in gesture.items():
+            if model.hasNode(nodeId):
+                node = model.node(nodeId)
+                new = (node.x, node.y, node.width, node.height)
+                if new != old:
+                    changes[nodeId] = (old, new)
+        if changes:
+            self.undoStack.push(
+                NodeGeometryCommand(self, changes), applied=True)
+
+    def searchIndex(self):
+        """
+        Returns the graphSearch.SearchIndex of the model, it is built on the
+        first call and then follows the model changes.
+        """
+        if self._searchIndex is None:
+            with profiler.timed('SearchIndex.build'):
+                self._searchIndex = SearchIndex(self.model)
+        return self._searchIndex
+
+    def findNodes(self, query, limit=100):
+        """
+        Find nodes by name or port label, see SearchIndex.search(), a scene
+        showing a group only finds the nodes of the group.
+
+        Returns:
+            list[int]: ids of the best matching nodes.
+        """
+        start = clock() if profiler.enabled else None
+        index = self.searchIndex()
+        scope = self._scopeGroupId
+        if scope is None:
+            nodeIds = index.search(query, limit)
+        else:
+            model = self.model
+            nodeIds = [n for n in index.search(query, None)
+                       if model.node(n).groupId == scope]
+            if limit is not None:
+                del nodeIds[limit:]
+        if start is not None:
+            profiler.addTime('NodeScene.findNodes', clock() - start)
+        return nodeIds
+
+    def setSearchMatches(self, nodeIds):
+        """
+        Highlight nodes found by a search, the previous ones are cleared.
+        """
+        nodeIds = set(nodeIds)
+        changed = self._searchMatches ^ nodeIds
+        self._searchMatches = nodeIds
+        for nodeId in changed:
+            item = self._nodeItems.get(nodeId)
+            if item is not None:
+                item.update()
+
+    def searchMatches(self):
+        return set(self._searchMatches)
+
+    def showCacheStats(self, evaluator):
+        """
+        Show on the nodes how often their result was read from the result
+        cache of an evaluator, as "cache hits/lookups".
+
+        Args:
+            evaluator (GraphEvaluator): evaluator of the scene model with a
+                result cache, see GraphEvaluator.setResultCache().
+        """
+        self.hideCacheStats()
+        self._cacheEvaluator = evaluator
+        evaluator.cacheCallbacks.append(self._cacheUsed)
+        self.update()
+
+    def hideCacheStats(self):
+        evaluator = self._cacheEvaluator
+        if evaluator is None:
+            return
+        if self._cacheUsed in evaluator.cacheCallbacks:
+            evaluator.cacheCallbacks.remove(self._cacheUsed)
+        self._cacheEvaluator = None
+        self.update()
+
+    def _cacheUsed(self, nodeId, hit):
+        item = self._nodeItems.get(nodeId)
+        if item is not None:
+            item.update()
+
+    def nodesRect(self, nodeIds):
+        """
+        Returns the scene QRectF bounding model nodes, a node hidden in a
+        collapsed group counts as the GroupNodeItem.  None without nodes.
+        """
+        model = self.model
+        rect = None
+        for nodeId in nodeIds:
+            node = model.node(nodeId)
+            groupItem = None
+            if not self._isNodeShown(node):
+                groupItem = self._groupItems.get(node.groupId)
+                if groupItem is None:
+                    continue
+            if groupItem is not None:
+                nodeRect = groupItem.sceneBoundingRect()
+            else:
+                nodeRect = QtCore.QRectF(
+                    node.x, node.y, node.width, node.height)
+            rect = nodeRect if rect is None else rect.united(nodeRect)
+        return rect
+
+    @batchedEvents
+    def createGroup(self, nodeIds, name='Group', collapse=True):
+        """
+        Move nodes into a new model group.
+
+        Args:
+            nodeIds (iterable[int]): nodes of the group, they leave the
+                group they were in.
+            name (str): name of the group.
+            collapse (bool): collapse the group right away.
+
+        Returns:
+            GraphGroup: the new group.
+        """
+        group = self.model.addGroup(name, nodeIds)
+        if collapse:
+            self.model.setGroupCollapsed(group.id, True)
+        return group
+
+    def collapseGroup(self, groupId):
+        """
+        Replace the items of the group nodes by a single GroupNodeItem.
+        """
+        self.model.setGroupCollapsed(groupId, True)
+
+    def expandGroup(self, groupId):
+        """
+        Bring the group nodes back where the GroupNodeItem was.
+        """
+        self.model.setGroupCollapsed(groupId, False)
+
+    @batchedEvents
+    def ungroup(self, groupId):
+        self.model.removeGroup(groupId)
+
+    def groupItem(self, groupId):
+        """
+        Returns the GroupNodeItem of a collapsed group or None.
+        """
+        return self._groupItems.get(groupId)
+
+    def openGroup(self, groupId):
+        """
+        Show the nodes of a group in their own NodeViewer, the scene of the
+        viewer shares the model so edits appear in both.
+
+        Returns:
+            NodeViewer: the viewer of the group.
+        """
+        model = self.model
+        group = model.group(groupId)
+        pair = self._groupViewers.get(groupId)
+        if pair is None:
+            scene = NodeScene(
+                model=model, theme=self.theme, groupId=groupId,
+                batchedPipes=self._pipeLayer is not None)
+            scene.connectionRules = self.connectionRules
+            scene.preventCycles = self.preventCycles
+            pair = self._groupViewers[groupId] = (NodeViewer(scene), scene)
+        viewer = pair[0]
+        viewer.setWindowTitle(group.name)
+        viewer.resize(850, 550)
+        viewer.show()
+        viewer.raise_()
+        members = [model.node(nodeId) for nodeId in group.nodeIds]
+        if members:
+            left = min(n.x for n in members)
+            top = min(n.y for n in members)
+            right = max(n.x + n.width for n in members)
+            bottom = max(n.y + n.height for n in members)
+            viewer.centerOn((left + right) / 2.0, (top + bottom) / 2.0)
+        return viewer
+
+    def _isNodeShown(self, node):
+        groupId = node.groupId
+        if self._scopeGroupId is not None:
+            return groupId == self._scopeGroupId
+        return groupId is None or not self.model.group(groupId).collapsed
+
+    def _portVisible(self, portId):
+        # materialized, proxied or on a node the scene can show.
+        if portId in self._portItems:
+            return True
+        model = self.model
+        return self._isNodeShown(model.node(model.port(portId).nodeId))
+
+    def _groupChanged(self, groupId):
+        # rebuild the item of a collapsed group on the next update.
+        model = self.model
+        if groupId is None or self._scopeGroupId is not None or \
+                not model.hasGroup(groupId) or \
+                not model.group(groupId).collapsed:
+            return
+        self._dirtyGroups.add(groupId)
+        self.scheduleMaterialize()
+
+    def _edgeGroupsChanged(self, edge):
+        model = self.model
+        for portId in (edge.outPortId, edge.inPortId):
+            if model.hasPort(portId):
+                port = self._portItems.get(portId)
+                if port is None:
+                    node = model.node(model.port(portId).nodeId)
+                    self._groupChanged(node.groupId)
+                elif isinstance(port.parentItem(), GroupNodeItem):
+                    self._groupChanged(port.parentItem().groupId)
+
+    def _dropProxies(self, node):
+        # unbind the proxy ports standing for the ports of a node.
+        for portId in node.inputs + node.outputs:
+            port = self._portItems.get(portId)
+            if port is None or not isinstance(port.parentItem(), GroupNodeItem):
+                continue
+            for pipe in list(port._connectedPipes):
+                self._unbindPipe(pipe)
+            del self._portItems[portId]
+            port.portId = None
+            self._groupChanged(port.parentItem().groupId)
+
+    def _nodeGroupChanged(self, node):
+        self._dropProxies(node)
+        self._groupChanged(node.groupId)
+        if self._isNodeShown(node):
+            self._nodeMoved(node)
+            self.scheduleMaterialize()
+        else:
+            item = self._nodeItems.get(node.id)
+            if item is not None:
+                self._parkNodeItem(item)
+            self._nodeIndex.remove(node.id)
+        for edgeId in self.model.nodeEdges(node.id):
+            self._edgeMoved(edgeId)
+
+    def _groupEdges(self, group):
+        model = self.model
+        edges = set()
+        for nodeId in group.nodeIds:
+            edges.update(model.nodeEdges(nodeId))
+        return edges
+
+    def _collapseGroup(self, group):
+        model = self.model
+        members = [model.node(nodeId) for nodeId in group.nodeIds]
+        if members:
+            group.x = min(n.x for n in members)
+            group.y = min(n.y for n in members)
+        for node in members:
+            item = self._nodeItems.get(node.id)
+            if item is not None:
+                self._parkNodeItem(item)
+            self._nodeIndex.remove(node.id)
+        self._buildGroupItem(group)
+        for edgeId in self._groupEdges(group):
+            self._edgeMoved(edgeId)
+
+    def _expandGroup(self, group):
+        self._removeGroupItem(group.id)
+        self._dirtyGroups.discard(group.id)
+        model = self.model
+        members = [model.node(nodeId) for nodeId in group.nodeIds]
+        if members and group.x is not None:
+            # the nodes follow the moves of the collapsed item.
+            dx = group.x - min(n.x for n in members)
+            dy = group.y - min(n.y for n in members)
+            for node in members:
+                if dx or dy:
+                    model.setNodePos(node.id, node.x + dx, node.y + dy)
+        for node in members:
+            self._nodeMoved(node)
+        for edgeId in self._groupEdges(group):
+            self._edgeMoved(edgeId)
+        self.updateMaterialized()
+
+    def _buildGroupItem(self, group):
+        model = self.model
+        members = group.nodeIds
+        if not members:
+            return None
+        proxies = {'in': [], 'out': []}
+        nodes = sorted((model.node(n) for n in members),
+                       key=lambda n: (n.y, n.x))
+        for node in nodes:
+            for portId in node.inputs + node.outputs:
+                port = model.port(portId)
+                for edgeId in port.edges:
+                    edge = model.edge(edgeId)
+                    other = edge.outPortId if port.portType == 'in' \
+                        else edge.inPortId
+                    if model.port(other).nodeId not in members:
+                        proxies[port.portType].append((node, port))
+                        break
+        item = GroupNodeItem(group.name)
+        item.groupId = group.id
+        with item.deferLayout():
+            for node, port in proxies['in']:
+                item.addInputPort('{}.{}'.format(node.name, port.name),
+                                  port.connectionLimit, port.dataType)
+            for node, port in proxies['out']:
+                item.addOutputPort('{}.{}'.format(node.name, port.name),
+                                   port.connectionLimit, port.dataType)
+        records = []
+        for ports, pairs in ((item._inputs, proxies['in']),
+                             (item._outputs, proxies['out'])):
+            for port, (_, record) in zip(ports, pairs):
+                port.portId = record.id
+                self._portItems[record.id] = port
+                records.append(record)
+        item.setPos(group.x, group.y)
+        self.addItem(item)
+        self._groupItems[group.id] = item
+        for record in records:
+            for edgeId in record.edges:
+                if edgeId not in self._pipeItems:
+                    self._createPipe(model.edge(edgeId))
+        return item
+
+    def _removeGroupItem(self, groupId):
+        item = self._groupItems.pop(groupId, None)
+        if item is None:
+            return
+        for port in item._inputs + item._outputs:
+            for pipe in list(port._connectedPipes):
+                self._unbindPipe(pipe)
+            if port.portId is not None and \
+                    self._portItems.get(port.portId) is port:
+                del self._portItems[port.portId]
+            port.portId = None
+        self.removeItem(item)
+
+    def _rebuildGroups(self):
+        dirty, self._dirtyGroups = self._dirtyGroups, set()
+        model = self.model
+        for groupId in dirty:
+            item = self._groupItems.get(groupId)
+            pos = item.pos() if item is not None else None
+            self._removeGroupItem(groupId)
+            if not model.hasGroup(groupId):
+                continue
+            group = model.group(groupId)
+            if not group.collapsed:
+                continue
+            if pos is not None:
+                group.x, group.y = pos.x(), pos.y()
+            elif group.nodeIds:
+                group.x = min(model.node(n).x for n in group.nodeIds)
+                group.y = min(model.node(n).y for n in group.nodeIds)
+            self._buildGroupItem(group)
+            for edgeId in self._groupEdges(group):
+                self._edgeMoved(edgeId)
+
+    def _groupItemMoved(self, item):
+        model = self.model
+        group = model.group(item.groupId)
+        group.x, group.y = item.x(), item.y()
+        for port in item._inputs + item._outputs:
+            if port.portId is not None:
+                for edgeId in model.port(port.portId).edges:
+                    self._edgeMoved(edgeId)
 
     def getNodeViewer(self):
         if self.views():
             return self.views()[0]
         return None
 
+    def mousePressEvent(self, event):
+        layer = self._pipeLayer
+        if layer is not None and event.button() == QtCore.Qt.LeftButton:
+            pos = event.scenePos()
+            pipe = None
+            if not [item for item in self.items(pos) if item is not layer]:
+                pipe = layer.pipeAt(pos, self.pipePickDistance)
+            if not event.modifiers() & QtCore.Qt.ControlModifier:
+                layer.clearSelection()
+                if pipe is not None:
+                    self.clearSelection()
+            if pipe is not None:
+                pipe.setSelected(True)
+                event.accept()
+                return
+        if event.button() == QtCore.Qt.LeftButton:
+            self._beginGesture(event.scenePos())
+        super(NodeScene, self).mousePressEvent(event)
+
     def mouseMoveEvent(self, event):
         view = self.getNodeViewer()
         if view:
@@ -453,43 +2802,314 @@ class NodeScene(QtGui.QGraphicsScene):
         if view:
             view.sceneMouseReleaseEvent(event)
         super(NodeScene, self).mouseReleaseEvent(event)
+        if event.button() == QtCore.Qt.LeftButton:
+            self._endGesture()
 
-    def setBackgroundColor(self, bgColor='#181818'):
+    def setBackgroundColor(self, bgColor=None):
+        """
+        Args:
+            bgColor (str): scene color, None to use the theme color.
+        """
         self._color = bgColor
-        self.setBackgroundBrush(QtGui.QBrush(QtGui.QColor(self._color)))
+        self.setBackgroundBrush(
+            self.theme.brush('scene.background', self._color))
+
+    def setTheme(self, theme):
+        """
+        Restyle the whole graph, items read their pens and brushes from the
+        scene theme when painting so nothing is updated per item.
+
+        Args:
+            theme (graphStyle.GraphTheme): the new theme.
+        """
+        self.theme = theme
+        self.setBackgroundColor(self._color)
+        self.update()
 
 
 class NodeViewer(QtGui.QGraphicsView):
     def __init__(self, scene, parent=None):
         super(NodeViewer, self).__init__(scene, parent)
-        sceneArea = 3200.0
-        self.setSceneRect(-(sceneArea/2), -(sceneArea/2), sceneArea, sceneArea)
         self.setRenderHint(QtGui.QPainter.Antialiasing)
         self._startPort = None
         self._startedConnection = None
         self._extendConnection = False
         self._preExistingPipes = []
+        # distance in scene units a dragged pipe snaps to a valid port.
+        self.snapDistance = 20.0
+        # search field, the matches and the last one jumped to, see
+        # showSearch().
+        self._searchField = None
+        self._searchResults = []
+        self._searchCursor = -1
+        # number of matches highlighted while typing a search.
+        self.searchLimit = 500
+        # overview in the bottom right corner, see setMinimapVisible().
+        self._minimap = None
+        # performance overlay, see setPerformanceHud().
+        self._hudVisible = False
+        self._hudUpdateMode = None
+        self._lastPaintTime = 0.0
+
+    def frameNodes(self, nodeIds, margin=40.0):
+        """
+        Fit the view to model nodes, materialized or not.
+        """
+        scene = self.scene()
+        rect = scene.nodesRect(nodeIds)
+        if rect is None:
+            return
+        self.fitInView(rect.adjusted(-margin, -margin, margin, margin),
+                       QtCore.Qt.KeepAspectRatio)
+        scene.scheduleMaterialize()
+
+    def jumpToNode(self, nodeId):
+        """
+        Center the view on a model node and select it.
+        """
+        scene = self.scene()
+        rect = scene.nodesRect([nodeId])
+        if rect is None:
+            return
+        self.centerOn(rect.center())
+        scene.clearSelection()
+        if scene._isNodeShown(scene.model.node(nodeId)):
+            scene.nodeItem(nodeId).setSelected(True)
+        scene.scheduleMaterialize()
+
+    def showSearch(self):
+        """
+        Show the search field, the nodes matching its text are highlighted
+        as it is typed.  Return jumps to the next match (Shift+Return to
+        the previous one), Ctrl+Return frames all the matches and Escape
+        closes the search.
+        """
+        field = self._searchField
+        if field is None:
+            field = self._searchField = QtGui.QLineEdit(self)
+            field.setPlaceholderText('Search nodes')
+            field.setFixedWidth(220)
+            field.textChanged.connect(self.search)
+            field.installEventFilter(self)
+        field.move(self.viewport().width() - field.width() - 8, 8)
+        field.show()
+        field.setFocus()
+        field.selectAll()
+
+    def hideSearch(self):
+        if self._searchField is not None:
+            self._searchField.hide()
+        self._searchResults = []
+        self._searchCursor = -1
+        self.scene().setSearchMatches(())
+        self.setFocus()
+
+    def search(self, query):
+        """
+        Highlight the nodes matching a query.
+
+        Returns:
+            list[int]: ids of the best matches, up to searchLimit.
+        """
+        scene = self.scene()
+        self._searchResults = scene.findNodes(query, self.searchLimit)
+        self._searchCursor = -1
+        scene.setSearchMatches(self._searchResults)
+        return self._searchResults
+
+    def jumpToMatch(self, step=1):
+        """
+        Jump to the next search match, or the previous one for a negative
+        step.
+        """
+        results = self._searchResults
+        if not results:
+            return
+        self._searchCursor = (self._searchCursor + step) % len(results)
+        self.jumpToNode(results[self._searchCursor])
+
+    def frameSearchMatches(self):
+        """
+        Fit the view to every node matching the search, not only the
+        highlighted ones.
+        """
+        if self._searchField is None:
+            return
+        query = self._searchField.text()
+        self.frameNodes(self.scene().findNodes(query, None))
+
+    def eventFilter(self, obj, event):
+        if obj is self._searchField and \
+                event.type() == QtCore.QEvent.KeyPress:
+            key = event.key()
+            if key == QtCore.Qt.Key_Escape:
+                self.hideSearch()
+                return True
+            if key in (QtCore.Qt.Key_Return, QtCore.Qt.Key_Enter):
+                modifiers = event.modifiers()
+                if modifiers & QtCore.Qt.ControlModifier:
+                    self.frameSearchMatches()
+                elif modifiers & QtCore.Qt.ShiftModifier:
+                    self.jumpToMatch(-1)
+                else:
+                    self.jumpToMatch(1)
+                return True
+        return super(NodeViewer, self).eventFilter(obj, event)
+
+    def visibleSceneRect(self):
+        return self.mapToScene(self.viewport().rect()).boundingRect()
+
+    def materializeVisible(self):
+        """
+        Create the items of the model nodes inside the visible area.
+        """
+        scene = self.scene()
+        if isinstance(scene, NodeScene):
+            scene.updateMaterialized()
+
+    def paintEvent(self, event):
+        antialias = self.transform().m11() >= LOD_ANTIALIASING
+        if antialias != bool(self.renderHints() & QtGui.QPainter.Antialiasing):
+            self.setRenderHint(QtGui.QPainter.Antialiasing, antialias)
+        if not profiler.enabled:
+            super(NodeViewer, self).paintEvent(event)
+            return
+        start = clock()
+        super(NodeViewer, self).paintEvent(event)
+        self._lastPaintTime = clock() - start
+        profiler.addTime('NodeViewer.paint', self._lastPaintTime)
+        profiler.endFrame()
+
+    def setPerformanceHud(self, visible=True):
+        """
+        Show an overlay with the FPS, the items painted and pipe paths
+        rebuilt in the last frame and the slowest instrumented calls.
+        Showing it enables the graphProfiler collection.
+        """
+        if visible == self._hudVisible:
+            return
+        self._hudVisible = visible
+        if visible:
+            profiler.enable()
+            # the overlay is fixed on the viewport, scrolled pixels would
+            # drag copies of it along.
+            self._hudUpdateMode = self.viewportUpdateMode()
+            self.setViewportUpdateMode(self.FullViewportUpdate)
+        elif self._hudUpdateMode is not None:
+            self.setViewportUpdateMode(self._hudUpdateMode)
+            self._hudUpdateMode = None
+        self.viewport().update()
+
+    def isPerformanceHudVisible(self):
+        return self._hudVisible
+
+    def setMinimapVisible(self, visible=True):
+        """
+        Show a NodeMinimap of the scene in the bottom right corner.
+        """
+        if visible and self._minimap is None:
+            self._minimap = NodeMinimap(self)
+            self._placeMinimap()
+        if self._minimap is not None:
+            self._minimap.setVisible(visible)
+
+    def isMinimapVisible(self):
+        return self._minimap is not None and self._minimap.isVisible()
+
+    def minimap(self):
+        return self._minimap
+
+    def _placeMinimap(self):
+        minimap = self._minimap
+        viewport = self.viewport()
+        minimap.move(viewport.width() - minimap.width() - 8,
+                     viewport.height() - minimap.height() - 8)
+
+    def drawForeground(self, painter, rect):
+        super(NodeViewer, self).drawForeground(painter, rect)
+        if self._hudVisible and profiler.enabled:
+            self._drawHud(painter)
+
+    def _hudLines(self):
+        frame = profiler.lastFrame
+        lines = [
+            'fps {:.1f}   paint {:.2f} ms'.format(
+                profiler.fps(), self._lastPaintTime * 1000),
+            'items painted {}'.format(frame.get('items.painted', 0)),
+            'paths rebuilt {}'.format(frame.get('pipes.rebuilt', 0)),
+        ]
+        for name in profiler.slowest(3):
+            calls, total, maximum = profiler.timer(name)
+            lines.append('{}  max {:.2f} ms  x{}'.format(
+                name, maximum * 1000, calls))
+        return lines
+
+    def _drawHud(self, painter):
+        # drawn in viewport pixels whatever the zoom.
+        lines = self._hudLines()
+        theme = itemTheme(self)
+        painter.save()
+        painter.resetTransform()
+        metrics = painter.fontMetrics()
+        lineHeight = metrics.height()
+        width = max(metrics.width(line) for line in lines) + 16
+        height = lineHeight * len(lines) + 8
+        painter.fillRect(QtCore.QRect(8, 8, width, height),
+                         theme.brush('hud.background'))
+        painter.setPen(theme.pen('hud.text'))
+        for idx, line in enumerate(lines):
+            painter.drawText(16, 12 + metrics.ascent() + idx * lineHeight,
+                             line)
+        painter.restore()
+
+    def showEvent(self, event):
+        super(NodeViewer, self).showEvent(event)
+        self.materializeVisible()
+
+    def closeEvent(self, event):
+        # the minimap hooks the model and owns a render thread.
+        if self._minimap is not None:
+            self._minimap.releaseScene()
+            self._minimap.deleteLater()
+            self._minimap = None
+        super(NodeViewer, self).closeEvent(event)
+
+    def resizeEvent(self, event):
+        super(NodeViewer, self).resizeEvent(event)
+        field = self._searchField
+        if field is not None:
+            field.move(self.viewport().width() - field.width() - 8, 8)
+        if self._minimap is not None:
+            self._placeMinimap()
+        self.materializeVisible()
+
+    def scrollContentsBy(self, dx, dy):
+        super(NodeViewer, self).scrollContentsBy(dx, dy)
+        scene = self.scene()
+        if isinstance(scene, NodeScene):
+            scene.scheduleMaterialize()
 
     def dragEnterEvent(self, event):
-        if event.mimeData().hasFormat('component/name'):
+        if event.mimeData().hasFormat(NAME_MIME):
             event.accept()
 
     def dragMoveEvent(self, event):
-        if event.mimeData().hasFormat('component/name'):
+        if event.mimeData().hasFormat(NAME_MIME):
             event.accept()
 
     def dropEvent(self, event):
-        if event.mimeData().hasFormat('component/name'):
-            name = str(event.mimeData().data('component/name'))
-            dropNode = NodeItem(name)
-            dropNode.setPos(self.mapToScene(event.pos()))
-            self.scene().addItem(dropNode)
+        if event.mimeData().hasFormat(NAME_MIME):
+            typeName = event.mimeData().data(NAME_MIME).data()
+            if isinstance(typeName, bytes):
+                typeName = typeName.decode('utf-8')
+            self.scene().createNode(typeName, self.mapToScene(event.pos()))
 
     def startConnection(self, port):
         if port:
             self._startPort = port
             self._preExistingPipes = self._startPort.getConnectedPipes()
             self._startedConnection = PipeConnection(self._startPort, None, self.scene())
+            self.scene().beginConnectionDrag(port)
 
             # print self._startPort.name, len(self._preExistingPipes)
             # print self._startPort.getConnectedPorts()
@@ -502,25 +3122,34 @@ class NodeViewer(QtGui.QGraphicsView):
     def endConnection(self):
         self._startedConnection = None
         self._preExistingPipes = []
+        self.scene().endConnectionDrag()
 
     def validateToPort(self, port):
-        connectionChecks = [
-            (port and port == self._startPort),
-            (port and port.portType == self._startPort.portType),
-            (port and port.parentItem() == self._startPort.parentItem()),
-            (port == None)]
-        if True in connectionChecks:
-            return False
-        return True
+        return self.scene().canConnect(self._startPort, port)
+
+    def findTargetPort(self, pos):
+        """
+        Returns the closest valid port within the snap distance or the port
+        directly under the position.
+
+        Args:
+            pos (QtCore.QPointF): scene position.
+        """
+        scene = self.scene()
+        port = scene.findPort(pos, self.snapDistance, self.validateToPort)
+        if port is None:
+            port = scene.findPort(pos)
+        return port
 
     def sceneMouseReleaseEvent(self, event):
+        if self._startedConnection:
+            with self.scene().recordEdgeEdits('Connect'):
+                self._finishConnection(event)
+
+    def _finishConnection(self, event):
         if self._startedConnection:
             # find destination port
-            toPort = None
-            for item in self.scene().items(event.scenePos()):
-                if isinstance(item, PortItem):
-                    toPort = item
-                    break
+            toPort = self.findTargetPort(event.scenePos())
 
             if (len(self._preExistingPipes) == 1) and (toPort == None):
                 self._preExistingPipes[0].delete()
@@ -536,8 +3165,12 @@ class NodeViewer(QtGui.QGraphicsView):
                 self._preExistingPipes[0].setDottedLine(False)
 
             if (toPort.connectionLimit != -1):
-                while len(toPort.getConnectedPorts()) >= toPort.connectionLimit:
-                    toPort.getConnectedPipes()[-1].delete()
+                # the most recent connections make room for the new one.
+                pipes = toPort.getConnectedPipes()
+                excess = len(pipes) + 1 - toPort.connectionLimit
+                if excess > 0:
+                    for pipe in pipes[-excess:]:
+                        pipe.delete()
 
             if self._startPort.portType == 'in':
                 if len(self._preExistingPipes) == 1:
@@ -574,24 +3207,466 @@ class NodeViewer(QtGui.QGraphicsView):
     def sceneMouseMoveEvent(self, event):
         if self._startedConnection:
             pos = event.scenePos()
+            snapPort = self.scene().findPort(
+                pos, self.snapDistance, self.validateToPort)
+            if snapPort:
+                pos = snapPort.scenePos()
             self._startedConnection.setEndPos(pos)
 
+    def _selectedNodeIds(self, selection):
+        # selected nodes, collapsed groups stand for their nodes.
+        nodeIds = [item.nodeId for item in selection
+                   if isinstance(item, NodeItem) and item.nodeId is not None]
+        for item in selection:
+            if isinstance(item, GroupNodeItem):
+                nodeIds.extend(self.scene().model.group(item.groupId).nodeIds)
+        return nodeIds
+
     def keyPressEvent(self, event):
         key = event.key()
-        selection = self.scene().selectedItems()
-        if key == QtCore.Qt.Key_Shift:
+        scene = self.scene()
+        selection = scene.selectedItems()
+        if event.matches(QtGui.QKeySequence.Undo):
+            scene.undo()
+        elif event.matches(QtGui.QKeySequence.Redo):
+            scene.redo()
+        elif event.matches(QtGui.QKeySequence.Find):
+            self.showSearch()
+        elif event.matches(QtGui.QKeySequence.Copy):
+            scene.copyNodes(self._selectedNodeIds(selection))
+        elif event.matches(QtGui.QKeySequence.Paste):
+            pos = self.mapFromGlobal(QtGui.QCursor.pos())
+            if not self.viewport().rect().contains(pos):
+                pos = self.viewport().rect().center()
+            scene.pasteNodes(self.mapToScene(pos))
+        elif key == QtCore.Qt.Key_D and \
+                event.modifiers() & QtCore.Qt.ControlModifier:
+            scene.duplicateNodes(self._selectedNodeIds(selection))
+        elif key == QtCore.Qt.Key_Shift:
             self._extendConnection = True
         elif key == QtCore.Qt.Key_Alt:
             self.setDragMode(self.DragMode.ScrollHandDrag)
         elif key == QtCore.Qt.Key_F:
             if len(selection) == 1:
                 self.centerOn(selection[0])
+        elif key == QtCore.Qt.Key_M:
+            self.setMinimapVisible(not self.isMinimapVisible())
+        elif key == QtCore.Qt.Key_L:
+            # lay out the selected nodes, or the whole graph.
+            nodeIds = [item.nodeId for item in selection
+                       if isinstance(item, NodeItem) and item.nodeId is not None]
+            scene.autoLayout(nodeIds if len(nodeIds) > 1 else None)
+        elif key == QtCore.Qt.Key_G:
+            # expand the selected groups or group the selected nodes.
+            groups = [item.groupId for item in selection
+                      if isinstance(item, GroupNodeItem)]
+            nodeIds = [item.nodeId for item in selection
+                       if isinstance(item, NodeItem) and item.nodeId is not None]
+            for groupId in groups:
+                scene.expandGroup(groupId)
+            if nodeIds and not groups:
+                scene.createGroup(nodeIds)
         elif (key == QtCore.Qt.Key_Delete) or (key == QtCore.Qt.Key_Backspace):
+            nodeIds = self._selectedNodeIds(selection)
+            with scene.events.transaction(), scene.undoStack.macro('Delete'):
+                with scene.recordEdgeEdits('Disconnect'):
+                    for pipe in scene.selectedPipes():
+                        pipe.delete()
+                scene.deleteNodes(nodeIds)
             for item in selection:
-                self.scene().removeItem(item)
+                if not isinstance(item, NodeItem) and item.scene() is scene:
+                    scene.removeItem(item)
         super(NodeViewer, self).keyPressEvent(event)
 
     def keyReleaseEvent(self, event):
         self._extendConnection = False
         self.setDragMode(self.DragMode.NoDrag)
-        super(NodeViewer, self).keyReleaseEvent(event)
\ No newline at end of file
+        super(NodeViewer, self).keyReleaseEvent(event)
+
+
+def renderOverviewTile(rect, nodes, lines, size, colors):
+    """
+    Draw a tile of the NodeMinimap, QImage painting is thread safe so this
+    runs on a worker thread.
+
+    Args:
+        rect (tuple): (x, y, side) scene square of the tile.
+        nodes (list[tuple]): (x, y, width, height, color) node records, a
+            None color uses the 'minimap.node' color.
+        lines (list[tuple]): (x1, y1, x2, y2) pipe lines.
+        size (int): side of the image in pixels.
+        colors (dict): 'minimap.node' and 'minimap.pipe' color strings.
+
+    Returns:
+        QImage: the tile, transparent where the scene is empty.
+    """
+    image = QtGui.QImage(size, size, QtGui.QImage.Format_ARGB32_Premultiplied)
+    image.fill(0)
+    x, y, side = rect
+    painter = QtGui.QPainter(image)
+    scale = size / side
+    painter.scale(scale, scale)
+    painter.translate(-x, -y)
+    if lines:
+        pen = QtGui.QPen(QtGui.QColor(colors['minimap.pipe']))
+        pen.setCosmetic(True)
+        painter.setPen(pen)
+        painter.drawLines([QtCore.QLineF(*line) for line in lines])
+    nodeColor = QtGui.QColor(colors['minimap.node'])
+    custom = {}
+    for nx, ny, width, height, value in nodes:
+        if value is None:
+            fill = nodeColor
+        else:
+            fill = custom.get(value)
+            if fill is None:
+                fill = custom[value] = QtGui.QColor(value)
+        # nodes stay at least a pixel wide.
+        painter.fillRect(QtCore.QRectF(nx, ny, max(width, 1.0 / scale),
+                                       max(height, 1.0 / scale)), fill)
+    painter.end()
+    return image
+
+
+class NodeMinimap(QtGui.QWidget):
+    """
+    Overview of the whole scene of a NodeViewer with its visible area,
+    clicking or dragging in it moves the viewer.
+
+    The scene is cut in square tiles rendered once into small QImages from
+    the model and the spatial indexes of the NodeScene, the nodes left out
+    by the virtualization are drawn too.  Painting the minimap only scales
+    the cached tiles.  The tiles touched by NodeScene.changed regions and
+    by the model changes are marked dirty, a timer then snapshots them in
+    the GUI thread and a worker thread renders them, so dragging nodes with
+    thousands of pipes only adds tile keys to a set until the next render.
+
+    Args:
+        viewer (NodeViewer): viewer to navigate.
+        parent (QWidget): parent widget, the viewer when None.
+    """
+
+    _tileRendered = QtCore.Signal(object)
+
+    def __init__(self, viewer, parent=None):
+        super(NodeMinimap, self).__init__(parent or viewer)
+        self.viewer = viewer
+        # tiles across the longest side of the scene rect, pixels of their
+        # images and the smallest scene side of a tile.
+        self.tilesAcross = 8
+        self.tileResolution = 128
+        self.minTileSize = 256.0
+        self.tileSize = self.minTileSize
+        # delay gathering the dirty tiles in ms, and tiles snapshot at once.
+        self.renderDelay = 100
+        self.tilesPerRender = 16
+        self._tiles = {}
+        self._dirty = set()
+        # tile key: render generation, results of older ones are dropped.
+        self._generation = {}
+        self._pending = set()
+        self._movedNodes = set()
+        self._movedEdges = set()
+        self._dragging = False
+        self._executor = futures.ThreadPoolExecutor(1)
+        self._renderTimer = QtCore.QTimer(self)
+        self._renderTimer.setSingleShot(True)
+        self._renderTimer.timeout.connect(self._renderDirty)
+        self._tileRendered.connect(
+            self._storeTile, QtCore.Qt.QueuedConnection)
+        self.setCursor(QtCore.Qt.PointingHandCursor)
+        self.resize(200, 150)
+        scene = viewer.scene()
+        self.scene = scene
+        scene.changed.connect(self._sceneChanged)
+        scene.sceneRectChanged.connect(self._sceneRectChanged)
+        # before the scene, the old bounds are still in its indexes.
+        scene.model.changeCallbacks.insert(0, self._modelChanged)
+        viewer.horizontalScrollBar().valueChanged.connect(self.update)
+        viewer.verticalScrollBar().valueChanged.connect(self.update)
+
+    def releaseScene(self):
+        """
+        Stop following the scene and its model and shut the render thread
+        down, called by the viewer when it closes.  Calling it again does
+        nothing.
+        """
+        if self._executor is None:
+            return
+        model = self.scene.model
+        if self._modelChanged in model.changeCallbacks:
+            model.changeCallbacks.remove(self._modelChanged)
+        self.scene.changed.disconnect(self._sceneChanged)
+        self.scene.sceneRectChanged.disconnect(self._sceneRectChanged)
+        self._renderTimer.stop()
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    def _fitTiles(self):
+        # a power of two tile side giving about tilesAcross tiles, the
+        # cache starts over when the scene rect grows past it.
+        rect = self.scene.sceneRect()
+        side = max(rect.width(), rect.height()) / self.tilesAcross
+        size = self.minTileSize
+        while size < side:
+            size *= 2
+        if size != self.tileSize:
+            self.tileSize = size
+            self._tiles.clear()
+            self._generation.clear()
+            self.invalidateAll()
+
+    def _tileKeys(self, x, y, width, height):
+        size = self.tileSize
+        cx1, cy1 = int(math.floor(x / size)), int(math.floor(y / size))
+        cx2 = int(math.floor((x + width) / size))
+        cy2 = int(math.floor((y + height) / size))
+        return [(cx, cy) for cx in range(cx1, cx2 + 1)
+                for cy in range(cy1, cy2 + 1)]
+
+    def invalidate(self, x, y, width, height):
+        """
+        Mark the tiles over a scene rect dirty, they keep their old image
+        until rendered again.
+        """
+        self._dirty.update(self._tileKeys(x, y, width, height))
+        if not self._renderTimer.isActive():
+            self._renderTimer.start(self.renderDelay)
+
+    def invalidateAll(self):
+        rect = self.scene.sceneRect()
+        self.invalidate(rect.x(), rect.y(), rect.width(), rect.height())
+
+    def _invalidateBounds(self, bounds):
+        if bounds is not None:
+            x1, y1, x2, y2 = bounds
+            self.invalidate(x1, y1, x2 - x1, y2 - y1)
+
+    def _sceneRectChanged(self, rect):
+        self.update()
+        if not self._renderTimer.isActive():
+            self._renderTimer.start(self.renderDelay)
+
+    def _sceneChanged(self, regions):
+        for rect in regions:
+            self.invalidate(rect.x(), rect.y(), rect.width(), rect.height())
+
+    def _modelChanged(self, kind, record):
+        # the scene indexes still hold the bounds before the change, the
+        # new ones are read when rendering.
+        scene = self.scene
+        if kind == 'removeNode':
+            # the record is already out of the model, its edges were sent
+            # as 'disconnect' before.
+            self._invalidateBounds(scene._nodeIndex.bounds(record.id))
+            self._movedNodes.discard(record.id)
+        elif kind in ('geometry', 'addNode', 'group'):
+            self._invalidateBounds(scene._nodeIndex.bounds(record.id))
+            self._movedNodes.add(record.id)
+            for edgeId in scene.model.nodeEdges(record.id):
+                self._invalidateBounds(scene._edgeIndex.bounds(edgeId))
+                self._movedEdges.add(edgeId)
+        elif kind in ('connect', 'disconnect'):
+            self._invalidateBounds(scene._edgeIndex.bounds(record.id))
+            self._movedEdges.add(record.id)
+        elif kind in ('groupState', 'removeGroup', 'clear'):
+            self._movedNodes.clear()
+            self._movedEdges.clear()
+            self.invalidateAll()
+
+    def _snapshotTile(self, key):
+        scene = self.scene
+        model = scene.model
+        size = self.tileSize
+        x, y = key[0] * size, key[1] * size
+        nodes = []
+        for nodeId in scene._nodeIndex.queryRect(x, y, size, size):
+            node = model.node(nodeId)
+            nodes.append((node.x, node.y, node.width, node.height,
+                          node.color))
+        for item in scene._groupItems.values():
+            rect = item.sceneBoundingRect()
+            if rect.intersects(QtCore.QRectF(x, y, size, size)):
+                nodes.append((rect.x(), rect.y(), rect.width(),
+                              rect.height(), None))
+        lines = []
+        for edgeId in scene._edgeIndex.queryRect(x, y, size, size):
+            edge = model.edge(edgeId)
+            pos1 = scene._portScenePos(edge.outPortId)
+            pos2 = scene._portScenePos(edge.inPortId)
+            lines.append((pos1.x(), pos1.y(), pos2.x(), pos2.y()))
+        return (x, y, size), nodes, lines
+
+    def _renderDirty(self):
+        if self._executor is None:
+            return
+        scene = self.scene
+        for nodeId in self._movedNodes:
+            self._invalidateBounds(scene._nodeIndex.bounds(nodeId))
+        for edgeId in self._movedEdges:
+            self._invalidateBounds(scene._edgeIndex.bounds(edgeId))
+        self._movedNodes.clear()
+        self._movedEdges.clear()
+        self._renderTimer.stop()
+        self._fitTiles()
+        sceneRect = scene.sceneRect()
+        visible = set(self._tileKeys(sceneRect.x(), sceneRect.y(),
+                                     sceneRect.width(), sceneRect.height()))
+        dirty = sorted(self._dirty & visible)
+        # the rest waits for the next round so the GUI stays responsive.
+        self._dirty = set(dirty[self.tilesPerRender:])
+        dirty = dirty[:self.tilesPerRender]
+        if self._dirty:
+            self._renderTimer.start(0)
+        theme = scene.theme
+        colors = dict((role, theme.colorValue(role))
+                      for role in ('minimap.node', 'minimap.pipe'))
+        start = clock() if profiler.enabled else None
+        for key in dirty:
+            generation = self._generation.get(key, 0) + 1
+            self._generation[key] = generation
+            rect, nodes, lines = self._snapshotTile(key)
+            if not nodes and not lines:
+                self._tiles.pop(key, None)
+                continue
+            future = self._executor.submit(
+                renderOverviewTile, rect, nodes, lines,
+                self.tileResolution, colors)
+            future.tileKey = key
+            future.generation = generation
+            future.add_done_callback(self._tileRendered.emit)
+        if start is not None:
+            profiler.addTime('NodeMinimap.snapshot', clock() - start)
+        self.update()
+
+    def _storeTile(self, future):
+        if future.cancelled() or \
+                self._generation.get(future.tileKey) != future.generation:
+            return
+        self._tiles[future.tileKey] = future.result()
+        self.update()
+
+    def _sceneTransform(self):
+        # scene rect fitted in the widget keeping its aspect.
+        rect = self.scene.sceneRect()
+        scale = min(self.width() / rect.width(),
+                    self.height() / rect.height())
+        dx = (self.width() - rect.width() * scale) / 2.0
+        dy = (self.height() - rect.height() * scale) / 2.0
+        transform = QtGui.QTransform()
+        transform.translate(dx, dy)
+        transform.scale(scale, scale)
+        transform.translate(-rect.x(), -rect.y())
+        return transform
+
+    def paintEvent(self, event):
+        theme = self.scene.theme
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), theme.brush('minimap.background'))
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+        painter.setTransform(self._sceneTransform())
+        size = self.tileSize
+        for (cx, cy), image in self._tiles.items():
+            painter.drawImage(
+                QtCore.QRectF(cx * size, cy * size, size, size), image)
+        pen = QtGui.QPen(theme.pen('minimap.view'))
+        pen.setCosmetic(True)
+        painter.setPen(pen)
+        painter.setBrush(QtCore.Qt.NoBrush)
+        painter.drawRect(self.viewer.visibleSceneRect())
+        painter.end()
+
+    def showEvent(self, event):
+        super(NodeMinimap, self).showEvent(event)
+        self.invalidateAll()
+
+    def _centerViewer(self, pos):
+        inverted, _ = self._sceneTransform().inverted()
+        self.viewer.centerOn(inverted.map(QtCore.QPointF(pos)))
+
+    def mousePressEvent(self, event):
+        if event.button() == QtCore.Qt.LeftButton:
+            self._dragging = True
+            self._centerViewer(event.pos())
+
+    def mouseMoveEvent(self, event):
+        if self._dragging:
+            self._centerViewer(event.pos())
+
+    def mouseReleaseEvent(self, event):
+        self._dragging = False
+
+
+class _PaletteList(QtGui.QListWidget):
+    # list dragging the type name of its items.
+
+    def __init__(self, parent=None):
+        super(_PaletteList, self).__init__(parent)
+        self.setDragEnabled(True)
+        self.setSelectionMode(self.SingleSelection)
+
+    def mimeTypes(self):
+        return [NAME_MIME]
+
+    def mimeData(self, items):
+        mime = QtCore.QMimeData()
+        if items:
+            typeName = items[0].data(QtCore.Qt.UserRole)
+            mime.setData(NAME_MIME,
+                         QtCore.QByteArray(typeName.encode('utf-8')))
+        return mime
+
+
+class NodePalette(QtGui.QWidget):
+    """
+    Searchable list of the types of a NodeTypeRegistry, a type dragged onto
+    a NodeViewer adds a node.  The list and the search only use the schemas
+    of the registry, a node module is imported when its first node is
+    dropped.
+
+    Args:
+        registry (NodeTypeRegistry): the node types, see graphRegistry.
+    """
+
+    def __init__(self, registry, parent=None):
+        super(NodePalette, self).__init__(parent)
+        self.registry = registry
+        self._field = QtGui.QLineEdit(self)
+        self._field.setPlaceholderText('Search node types')
+        self._field.textChanged.connect(self.refresh)
+        self._list = _PaletteList(self)
+        layout = QtGui.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self._field)
+        layout.addWidget(self._list)
+        self.refresh()
+
+    def refresh(self, query=None):
+        """
+        List the types matching a query, the search field text when None.
+        """
+        start = clock() if profiler.enabled else None
+        if query is None:
+            query = self._field.text()
+        if query.strip():
+            infos = self.registry.search(query)
+        else:
+            infos = self.registry.types()
+        self._list.clear()
+        for info in infos:
+            label = info.label
+            if info.category:
+                label = '{} ({})'.format(label, info.category)
+            entry = QtGui.QListWidgetItem(label, self._list)
+            entry.setData(QtCore.Qt.UserRole, info.typeName)
+            entry.setToolTip(self._toolTip(info))
+        if start is not None:
+            profiler.addTime('NodePalette.refresh', clock() - start)
+
+    def _toolTip(self, info):
+        if not info.hasSchema():
+            return info.typeName
+        return '{}\nin: {}\nout: {}'.format(
+            info.typeName,
+            ', '.join(port[0] for port in info.inputs) or '-',
+            ', '.join(port[0] for port in info.outputs) or '-')
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+"""
+Uniform grid spatial index.
+
+Keys are bucketed by the grid cells their bounding box covers so point and
+rect lookups only visit the few cells around the query instead of every
+item in the scene.
+"""
+import math
+
+
+class SpatialGrid(object):
+    """
+    Uniform grid of hashable keys with axis aligned bounding boxes.
+
+    Args:
+        cellSize (float): width and height of a grid cell.
+    """
+
+    def __init__(self, cellSize=64.0):
+        self.cellSize = float(cellSize)
+        self._cells = {}
+        self._bounds = {}
+
+    def __len__(self):
+        return len(self._bounds)
+
+    def __contains__(self, key):
+        return key in self._bounds
+
+    def _cellRange(self, x1, y1, x2, y2):
+        size = self.cellSize
+        return (int(math.floor(x1 / size)), int(math.floor(y1 / size)),
+                int(math.floor(x2 / size)), int(math.floor(y2 / size)))
+
+    def _iterCells(self, cellRange):
+        cx1, cy1, cx2, cy2 = cellRange
+        count = (cx2 - cx1 + 1) * (cy2 - cy1 + 1)
+        if count > len(self._cells):
+            # the query covers more cells than are occupied.
+            for (cx, cy), keys in self._cells.items():
+                if cx1 <= cx <= cx2 and cy1 <= cy <= cy2:
+                    yield keys
+            return
+        cells = self._cells
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                keys = cells.get((cx, cy))
+                if keys:
+                    yield keys
+
+    def insert(self, key, x, y, width=0.0, height=0.0):
+        """
+        Insert or move a key.
+
+        Args:
+            key: hashable key, usually an item or an id.
+            x (float): left of the bounding box.
+            y (float): top of the bounding box.
+            width (float): width of the bounding box, 0 for points.
+            height (float): height of the bounding box, 0 for points.
+        """
+        bounds = (x, y, x + width, y + height)
+        newRange = self._cellRange(*bounds)
+        oldBounds = self._bounds.get(key)
+        if oldBounds is not None:
+            if self._cellRange(*oldBounds) == newRange:
+                self._bounds[key] = bounds
+                return
+            self.remove(key)
+        self._bounds[key] = bounds
+        cells = self._cells
+        cx1, cy1, cx2, cy2 = newRange
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                cell = cells.get((cx, cy))
+                if cell is None:
+                    cell = cells[(cx, cy)] = set()
+                cell.add(key)
+
+    move = insert
+
+    def remove(self, key):
+        bounds = self._bounds.pop(key, None)
+        if bounds is None:
+            return
+        cells = self._cells
+        cx1, cy1, cx2, cy2 = self._cellRange(*bounds)
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                cell = cells.get((cx, cy))
+                if cell is not None:
+                    cell.discard(key)
+                    if not cell:
+                        del cells[(cx, cy)]
+
+    def bounds(self, key):
+        return self._bounds.get(key)
+
+    def keys(self):
+        return self._bounds.keys()
+
+    def clear(self):
+        self._cells.clear()
+        self._bounds.clear()
+
+    def queryRect(self, x, y, width, height):
+        """
+        Returns the set of keys with a bounding box intersecting the rect.
+        """
+        right, bottom = x + width, y + height
+        allBounds = self._bounds
+        result = set()
+        for keys in self._iterCells(self._cellRange(x, y, right, bottom)):
+            for key in keys:
+                if key in result:
+                    continue
+                x1, y1, x2, y2 = allBounds[key]
+                if x1 <= right and x2 >= x and y1 <= bottom and y2 >= y:
+                    result.add(key)
+        return result
+
+    def nearest(self, x, y, radius, accept=None):
+        """
+        Find the key closest to a point.
+
+        Args:
+            x (float): x position.
+            y (float): y position.
+            radius (float): max distance from the point.
+            accept (callable): optional filter, called with a key and
+                returning True when the key is a valid candidate.
+
+        Returns:
+            the closest key or None.
+        """
+        best = None
+        bestDist = radius * radius
+        allBounds = self._bounds
+        cellRange = self._cellRange(x - radius, y - radius,
+                                    x + radius, y + radius)
+        for keys in self._iterCells(cellRange):
+            for key in keys:
+                x1, y1, x2, y2 = allBounds[key]
+                dx = max(x1 - x, 0.0, x - x2)
+                dy = max(y1 - y, 0.0, y - y2)
+                dist = dx * dx + dy * dy
+                if dist > bestDist or (dist == bestDist and best is not None):
+                    continue
+                if accept is None or accept(key):
+                    best, bestDist = key, dist
+        return best
@@ -3,21 +3,23 @@ import sys
 
 from PySide import QtGui
 
+from graphRegistry import NodeTypeRegistry
 from pySideNodeGraph import NodeItem
-from pySideNodeGraph import NodeScene, NodeViewer
+from pySideNodeGraph import NodePalette, NodeScene, NodeViewer
 
 
 class TestNode(NodeItem):
 
     def __init__(self, name='Foo Bar', parent=None):
         super(TestNode, self).__init__(name, parent)
-        self.addInputPort(label='one only', connectionLimit=1)
-        self.addInputPort(label='limit 2', connectionLimit=2)
-        self.addInputPort(label='test')
+        with self.deferLayout():
+            self.addInputPort(label='one only', connectionLimit=1)
+            self.addInputPort(label='limit 2', connectionLimit=2)
+            self.addInputPort(label='test')
 
-        self.addOutputPort(label='hello')
-        self.addOutputPort(label='world')
-        self.addOutputPort(label='test')
+            self.addOutputPort(label='hello')
+            self.addOutputPort(label='world')
+            self.addOutputPort(label='test')
 
 
 class NodeGraph(QtGui.QWidget):
@@ -25,10 +27,16 @@ class NodeGraph(QtGui.QWidget):
     def __init__(self, parent=None):
         super(NodeGraph, self).__init__(parent)
         self.setWindowTitle('Noodle Graph')
+        self.registry = NodeTypeRegistry()
+        self.registry.registerClass(TestNode)
         self.nodeScene = NodeScene(self)
+        self.nodeScene.nodeRegistry = self.registry
         self.nodeViewer = NodeViewer(self.nodeScene, self)
+        self.nodePalette = NodePalette(self.registry, self)
+        self.nodePalette.setFixedWidth(160)
 
-        layout = QtGui.QVBoxLayout(self)
+        layout = QtGui.QHBoxLayout(self)
+        layout.addWidget(self.nodePalette)
         layout.addWidget(self.nodeViewer)
 
         self.addNode(TestNode(), -50, 0)
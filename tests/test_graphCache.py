@@ -0,0 +1,177 @@
+import multiprocessing
+import os
+import pickle
+
+from graphCache import ResultCache, resultKey
+from graphEvaluator import GraphEvaluator
+from graphModel import GraphModel
+
+
+def setUsed(cache, key, when):
+    os.utime(cache._entryPath(key), (when, when))
+
+
+def putFromProcess(args):
+    root, key, value = args
+    cache = ResultCache(root)
+    stored = cache.put(key, {'out': value})
+    result = cache.get(key)
+    return stored, result
+
+
+def testResultKey():
+    key = resultKey('Add', {'step': 1}, [('x', [])])
+    assert key == resultKey('Add', {'step': 1}, [('x', [])])
+    assert len(key) == 40
+    assert key != resultKey('Add', {'step': 2}, [('x', [])])
+    assert key != resultKey('Sub', {'step': 1}, [('x', [])])
+    assert key != resultKey('Add', {'step': 1}, [('x', [(key, 'out')])])
+    assert key != resultKey('Add', {'step': 1}, [('x', [])], salt='v2')
+    assert key != resultKey('Add', {'step': 1}, [('x', [])],
+                            outputs=['out'])
+    # the order of the attributes does not matter.
+    assert resultKey('Add', {'a': 1, 'b': 2}, []) == \
+        resultKey('Add', {'b': 2, 'a': 1}, [])
+
+
+def testPutGet(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = resultKey('Add', None, [])
+    assert cache.get(key) is None
+    assert key not in cache
+    assert cache.put(key, {'out': [1, 2, 3], 'name': 'a'})
+    assert key in cache
+    assert cache.get(key) == {'out': [1, 2, 3], 'name': 'a'}
+    # stored once, a second put only marks it used.
+    assert cache.put(key, {'out': 'other'})
+    assert cache.get(key) == {'out': [1, 2, 3], 'name': 'a'}
+    assert cache.stats()['stores'] == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # an entry survives the cache object.
+    assert ResultCache(str(tmp_path)).get(key) == {
+        'out': [1, 2, 3], 'name': 'a'}
+    cache.discard(key)
+    assert cache.get(key) is None
+
+
+def testUnpicklableResult(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = resultKey('Add', None, [])
+    assert not cache.put(key, {'out': lambda: None})
+    assert key not in cache
+    assert os.listdir(os.path.join(str(tmp_path), 'tmp')) == []
+
+
+def testCorruptEntry(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = resultKey('Add', None, [])
+    cache.put(key, {'out': 1})
+    with open(os.path.join(cache._entryPath(key), 'result.pkl'), 'wb') as f:
+        f.write(pickle.dumps({'out': 1})[:5])
+    assert cache.get(key) is None
+
+
+def testEvictLeastRecentlyUsed(tmp_path):
+    payload = 'x' * 1000
+    keys = [resultKey('Add', {'idx': idx}, []) for idx in range(4)]
+    cache = ResultCache(str(tmp_path), maxBytes=3500)
+    for idx, key in enumerate(keys[:3]):
+        cache.put(key, {'out': payload})
+        setUsed(cache, key, 1000 + idx)
+    # reading the oldest makes it the most recently used.
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[3], {'out': payload})
+    assert keys[1] not in cache
+    assert all(key in cache for key in (keys[0], keys[2], keys[3]))
+    assert cache.evictions == 1
+    assert cache.totalBytes() <= 3500 * 0.9
+
+    cache.clear()
+    assert not any(key in cache for key in keys)
+    assert cache.totalBytes() == 0
+
+
+def testSharedBetweenProcesses(tmp_path):
+    root = str(tmp_path)
+    key = resultKey('Add', None, [])
+    others = [resultKey('Add', {'idx': idx}, []) for idx in range(4)]
+    jobs = [(root, key, 42)] * 4 + [
+        (root, other, idx) for idx, other in enumerate(others)]
+    pool = multiprocessing.Pool(4)
+    try:
+        results = pool.map(putFromProcess, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    assert results[:4] == [(True, {'out': 42})] * 4
+    assert [result for _, result in results[4:]] == [
+        {'out': idx} for idx in range(4)]
+    cache = ResultCache(root)
+    assert cache.get(key) == {'out': 42}
+    assert len(os.listdir(cache._entryPath(key))) == 1
+    assert os.listdir(os.path.join(root, 'tmp')) == []
+
+
+class Counter(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, node, inputs):
+        self.calls.append(node.name)
+        return (inputs.get('x') or 0) + (node.attrs or {}).get('step', 1)
+
+
+def buildChain(model):
+    nodes = []
+    for idx in range(3):
+        node = model.addNode('n{}'.format(idx), 'Add')
+        model.addPort(node.id, 'x', 'in', 1)
+        model.addPort(node.id, 'out', 'out')
+        if nodes:
+            model.connect(nodes[-1].outputs[0], node.inputs[0])
+        nodes.append(node)
+    return nodes
+
+
+def session(root, **kwargs):
+    evaluator = GraphEvaluator(GraphModel())
+    counter = Counter()
+    evaluator.registerType('Add', counter)
+    evaluator.setResultCache(ResultCache(root), **kwargs)
+    return evaluator, counter, buildChain(evaluator.model)
+
+
+def testEvaluatorCacheAcrossSessions(tmp_path):
+    root = str(tmp_path)
+    evaluator, counter, nodes = session(root)
+    assert evaluator.evaluate(nodes[-1].id, 'out') == 3
+    assert counter.calls == ['n0', 'n1', 'n2']
+
+    # a new session of the same graph reads every result back.
+    evaluator, counter, nodes = session(root)
+    assert evaluator.evaluate(nodes[-1].id, 'out') == 3
+    assert counter.calls == []
+    assert evaluator.cacheStats[nodes[-1].id] == [1, 0]
+
+    # an edit misses for the node and downstream only.
+    evaluator.setParam(nodes[1].id, 'step', 10)
+    assert evaluator.evaluate(nodes[-1].id, 'out') == 12
+    assert counter.calls == ['n1', 'n2']
+    evaluator.setParam(nodes[1].id, 'step', 20)
+    assert evaluator.evaluate(nodes[-1].id, 'out') == 22
+    # going back to an earlier value finds its results again.
+    evaluator.setParam(nodes[1].id, 'step', 10)
+    assert evaluator.evaluate(nodes[-1].id, 'out') == 12
+    assert counter.calls == ['n1', 'n2', 'n1', 'n2']
+
+
+def testUncachedTypes(tmp_path):
+    root = str(tmp_path)
+    evaluator, counter, nodes = session(root, uncachedTypes=['Add'])
+    evaluator.evaluate(nodes[-1].id)
+    evaluator, counter, nodes = session(root, uncachedTypes=['Add'])
+    evaluator.evaluate(nodes[-1].id)
+    assert counter.calls == ['n0', 'n1', 'n2']
+    assert evaluator.cacheStats == {}
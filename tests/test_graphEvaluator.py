@@ -0,0 +1,100 @@
+import pytest
+
+from graphEvaluator import (GraphEvaluator, GraphCycleError, findCycle,
+                            topologicalSort)
+from graphModel import GraphModel
+
+
+def addNode(model, name, nodeType='Add', inputs=('x',), outputs=('out',)):
+    node = model.addNode(name, nodeType)
+    for portName in inputs:
+        model.addPort(node.id, portName, 'in', 1)
+    for portName in outputs:
+        model.addPort(node.id, portName, 'out')
+    return node
+
+
+def chain(model, count):
+    nodes = [addNode(model, 'n{}'.format(idx)) for idx in range(count)]
+    for upstream, downstream in zip(nodes, nodes[1:]):
+        model.connect(upstream.outputs[0], downstream.inputs[0])
+    return nodes
+
+
+def addOne(node, inputs):
+    return (inputs.get('x') or 0) + node.attrs.get('step', 1) \
+        if node.attrs else (inputs.get('x') or 0) + 1
+
+
+@pytest.fixture
+def evaluator():
+    model = GraphModel()
+    evaluator = GraphEvaluator(model)
+    evaluator.registerType('Add', addOne)
+    return evaluator
+
+
+def testEvaluateOnlyComputesDirtyNodes(evaluator):
+    a, b, c = chain(evaluator.model, 3)
+    assert evaluator.evaluate(c.id, 'out') == 3
+    assert evaluator.lastComputed == [a.id, b.id, c.id]
+    assert evaluator.evaluate(c.id, 'out') == 3
+    assert evaluator.lastComputed == []
+    evaluator.setParam(b.id, 'step', 10)
+    assert evaluator.isDirty(b.id) and evaluator.isDirty(c.id)
+    assert not evaluator.isDirty(a.id)
+    assert evaluator.evaluate(c.id, 'out') == 12
+    assert evaluator.lastComputed == [b.id, c.id]
+
+
+def testDisconnectMarksDownstreamDirty(evaluator):
+    model = evaluator.model
+    a, b, c = chain(model, 3)
+    evaluator.evaluateAll()
+    edgeId = next(iter(model.port(b.inputs[0]).edges))
+    model.disconnect(edgeId)
+    assert not evaluator.isDirty(a.id)
+    assert evaluator.isDirty(b.id) and evaluator.isDirty(c.id)
+    assert evaluator.evaluate(c.id, 'out') == 2
+
+
+def testRenamedInputPortRecomputes(evaluator):
+    model = evaluator.model
+    a, b = chain(model, 2)
+    assert evaluator.evaluate(b.id, 'out') == 2
+    model.setPortName(b.inputs[0], 'y')
+    assert evaluator.isDirty(b.id)
+    assert not evaluator.isDirty(a.id)
+    # the input is no longer named "x", addOne does not see it.
+    assert evaluator.evaluate(b.id, 'out') == 1
+
+
+def testRenamedOutputPortDirtiesDownstream(evaluator):
+    model = evaluator.model
+    a, b, c = chain(model, 3)
+    evaluator.evaluate(c.id)
+    keys = [evaluator.resultKey(n.id) for n in (a, b, c)]
+    model.setPortName(a.outputs[0], 'value')
+    assert all(evaluator.isDirty(n.id) for n in (a, b, c))
+    assert evaluator.evaluate(a.id) == {'value': 1}
+    newKeys = [evaluator.resultKey(n.id) for n in (a, b, c)]
+    assert all(old != new for old, new in zip(keys, newKeys))
+    assert evaluator.evaluate(c.id, 'out') == 3
+
+
+def testAddedPortMarksNodeDirty(evaluator):
+    model = evaluator.model
+    a, b = chain(model, 2)
+    evaluator.evaluate(b.id)
+    model.addPort(a.id, 'extra', 'out')
+    assert evaluator.isDirty(a.id) and evaluator.isDirty(b.id)
+
+
+def testCycleIsReported():
+    model = GraphModel()
+    a, b, c = chain(model, 3)
+    model.connect(c.outputs[0], a.inputs[0])
+    with pytest.raises(GraphCycleError) as error:
+        topologicalSort(model)
+    assert set(error.value.nodeIds) == set([a.id, b.id, c.id])
+    assert set(findCycle(model)) == set([a.id, b.id, c.id])
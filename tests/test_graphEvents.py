@@ -0,0 +1,173 @@
+import pytest
+
+from graphEvents import (GraphEventBus, NODE_ADDED, NODE_REMOVED, NODE_MOVED,
+                         NODE_RESIZED, NODE_RENAMED, NODE_CHANGED, CONNECTED,
+                         DISCONNECTED, GROUP_CHANGED, CLEARED)
+from graphModel import GraphModel
+
+
+def addNode(model, name):
+    node = model.addNode(name)
+    model.addPort(node.id, 'in', 'in')
+    model.addPort(node.id, 'out', 'out')
+    return node
+
+
+@pytest.fixture
+def model():
+    return GraphModel()
+
+
+@pytest.fixture
+def batches(model):
+    # the events of each published batch as (type, ids) tuples.
+    result = []
+    bus = GraphEventBus(model)
+    bus.subscribe(lambda events: result.append(
+        [(event.type, event.ids) for event in events]))
+    return bus, result
+
+
+def testImmediateOutsideTransaction(model, batches):
+    bus, published = batches
+    node = addNode(model, 'a')
+    model.setNodeName(node.id, 'b')
+    # no transaction, every change including the addPorts is its own batch.
+    assert published == [
+        [(NODE_ADDED, [node.id])],
+        [(NODE_CHANGED, [node.id])],
+        [(NODE_CHANGED, [node.id])],
+        [(NODE_RENAMED, [node.id])],
+    ]
+
+
+def testTransactionBatches(model, batches):
+    bus, published = batches
+    a = addNode(model, 'a')
+    b = addNode(model, 'b')
+    del published[:]
+    with bus.transaction():
+        c = addNode(model, 'c')
+        edge = model.connect(a.outputs[0], b.inputs[0])
+        model.setNodePos(a.id, 10, 0)
+        model.setNodePos(a.id, 20, 0)
+        model.setNodePos(c.id, 5, 5)
+        model.setAttr(b.id, 'gain', 2)
+        model.removeNode(b.id)
+        assert published == []
+    # b was removed, its new edge and its attr change go with it.
+    assert published == [[
+        (NODE_REMOVED, [b.id]),
+        (NODE_ADDED, [c.id]),
+        (NODE_MOVED, [a.id]),
+    ]]
+    assert not model.hasEdge(edge.id)
+
+
+def testAddRemoveCancels(model, batches):
+    bus, published = batches
+    a = addNode(model, 'a')
+    b = addNode(model, 'b')
+    del published[:]
+    with bus.transaction():
+        c = addNode(model, 'c')
+        model.setNodePos(c.id, 1, 1)
+        model.removeNode(c.id)
+        edge = model.connect(a.outputs[0], b.inputs[0])
+        model.disconnect(edge.id)
+    assert published == []
+
+    edge = model.connect(a.outputs[0], b.inputs[0])
+    del published[:]
+    with bus.transaction():
+        model.disconnect(edge.id)
+        edge = model.connect(a.outputs[0], b.inputs[0])
+    assert published == [[(DISCONNECTED, [edge.id - 1]),
+                           (CONNECTED, [edge.id])]]
+
+
+def testMoveAndResize(model, batches):
+    bus, published = batches
+    node = addNode(model, 'a')
+    del published[:]
+    model.setNodeSize(node.id, 80, 40)
+    model.setNodePos(node.id, 5, 0)
+    with bus.transaction():
+        model.setNodePos(node.id, 6, 0)
+        model.setNodeSize(node.id, 90, 40)
+    assert published == [
+        [(NODE_RESIZED, [node.id])],
+        [(NODE_MOVED, [node.id])],
+        [(NODE_MOVED, [node.id]), (NODE_RESIZED, [node.id])],
+    ]
+
+
+def testNestedTransactions(model, batches):
+    bus, published = batches
+    with bus.transaction():
+        a = model.addNode('a')
+        with bus.transaction():
+            b = model.addNode('b')
+            assert bus.inTransaction()
+        assert published == []
+    assert not bus.inTransaction()
+    assert published == [[(NODE_ADDED, [a.id, b.id])]]
+
+    # the transaction ends even when the block raises.
+    del published[:]
+    with pytest.raises(RuntimeError):
+        with bus.transaction():
+            model.setNodeName(a.id, 'renamed')
+            raise RuntimeError('failed')
+    assert not bus.inTransaction()
+    assert published == [[(NODE_RENAMED, [a.id])]]
+
+
+def testSubscribedTypes(model):
+    bus = GraphEventBus(model)
+    received = []
+    bus.subscribe(received.append, (NODE_REMOVED, GROUP_CHANGED))
+    with bus.transaction():
+        a = model.addNode('a')
+        b = model.addNode('b')
+    assert received == []
+    with bus.transaction():
+        group = model.addGroup('g', [a.id])
+        model.removeNode(b.id)
+    assert [(event.type, event.ids) for event in received[0]] == [
+        (NODE_REMOVED, [b.id]), (GROUP_CHANGED, [group.id])]
+
+    bus.unsubscribe(received.append)
+    model.removeNode(a.id)
+    assert len(received) == 1
+
+
+def testClear(model, batches):
+    bus, published = batches
+    addNode(model, 'a')
+    del published[:]
+    with bus.transaction():
+        addNode(model, 'b')
+        model.clear()
+    assert published == [[(CLEARED, [])]]
+
+
+def testSubscriberChangesModel(model):
+    bus = GraphEventBus(model)
+    received = []
+
+    def rename(events):
+        received.append([(event.type, event.ids) for event in events])
+        for event in events:
+            if event.type == NODE_ADDED:
+                for nodeId in event.ids:
+                    model.setNodeName(nodeId, 'renamed')
+
+    bus.subscribe(rename)
+    node = model.addNode('a')
+    assert received == [[(NODE_ADDED, [node.id])],
+                        [(NODE_RENAMED, [node.id])]]
+
+    bus.close()
+    model.addNode('b')
+    assert len(received) == 2
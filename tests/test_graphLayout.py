@@ -0,0 +1,185 @@
+import random
+
+import pytest
+
+from graphLayout import (_acyclicEdges, computeLayout, layoutModel,
+                         snapshotLayout)
+from graphModel import GraphModel
+
+
+def addNode(model, name, inputs=1, outputs=1, width=60.0, height=40.0):
+    node = model.addNode(name, width=width, height=height)
+    for idx in range(inputs):
+        model.addPort(node.id, 'in{}'.format(idx), 'in')
+    for idx in range(outputs):
+        model.addPort(node.id, 'out{}'.format(idx), 'out')
+    return node
+
+
+def connect(model, outNode, inNode, outIdx=0, inIdx=0):
+    return model.connect(outNode.outputs[outIdx], inNode.inputs[inIdx])
+
+
+def apply(model, positions):
+    for nodeId, (x, y) in positions.items():
+        model.setNodePos(nodeId, x, y)
+
+
+def assertNoOverlap(model, nodeIds=None):
+    nodes = [model.node(n) for n in nodeIds] if nodeIds is not None \
+        else list(model.nodes())
+    for idx, a in enumerate(nodes):
+        for b in nodes[idx + 1:]:
+            assert (a.x + a.width <= b.x or b.x + b.width <= a.x or
+                    a.y + a.height <= b.y or b.y + b.height <= a.y), (a, b)
+
+
+def feedbackEdges(model, nodeIds=None):
+    # the (outNodeId, inNodeId) edges the layout reverses to break cycles.
+    nodes, edges = snapshotLayout(model, nodeIds)
+    index = dict((record[0], idx) for idx, record in enumerate(nodes))
+    vertexEdges = [(index[u], index[v], fu, fv) for u, fu, v, fv in edges]
+    feedback = set()
+    for (u, v, _, _), (a, b, _, _) in zip(
+            vertexEdges, _acyclicEdges(len(nodes), vertexEdges)):
+        if (u, v) != (a, b):
+            feedback.add((nodes[u][0], nodes[v][0]))
+    return feedback
+
+
+def edgeNodes(model):
+    for edge in model.edges():
+        yield (model.port(edge.outPortId).nodeId,
+               model.port(edge.inPortId).nodeId)
+
+
+def randomGraph(seed, count=30, edgeCount=45):
+    rng = random.Random(seed)
+    model = GraphModel()
+    nodes = [addNode(model, 'n{}'.format(idx), inputs=2, outputs=2,
+                     width=rng.choice((40.0, 80.0, 120.0)),
+                     height=rng.choice((30.0, 50.0, 90.0)))
+             for idx in range(count)]
+    for _ in range(edgeCount):
+        a, b = rng.sample(nodes, 2)
+        outIdx, inIdx = rng.randrange(2), rng.randrange(2)
+        if model.findEdge(a.outputs[outIdx], b.inputs[inIdx]) is None:
+            connect(model, a, b, outIdx, inIdx)
+    return model
+
+
+def testChain():
+    model = GraphModel()
+    nodes = [addNode(model, 'n{}'.format(idx)) for idx in range(4)]
+    for a, b in zip(nodes, nodes[1:]):
+        connect(model, a, b)
+    apply(model, layoutModel(model, layerSpacing=20.0))
+    assert [node.x for node in nodes] == [0.0, 80.0, 160.0, 240.0]
+    # a straight chain lines its ports up.
+    assert len(set(node.y for node in nodes)) == 1
+
+
+@pytest.mark.parametrize('seed', range(6))
+def testRandomGraphs(seed):
+    model = randomGraph(seed)
+    apply(model, layoutModel(model))
+    assertNoOverlap(model)
+    feedback = feedbackEdges(model)
+    for outNodeId, inNodeId in edgeNodes(model):
+        outX, inX = model.node(outNodeId).x, model.node(inNodeId).x
+        if (outNodeId, inNodeId) in feedback:
+            assert outX > inX
+        else:
+            assert outX < inX
+
+
+def testCycleBreaking():
+    model = GraphModel()
+    a, b, c = [addNode(model, name) for name in 'abc']
+    connect(model, a, b)
+    connect(model, b, c)
+    connect(model, c, a)
+    assert len(feedbackEdges(model)) == 1
+    apply(model, layoutModel(model))
+    assert len(set(node.x for node in (a, b, c))) == 3
+    assertNoOverlap(model)
+
+
+def testDummyVertices():
+    # a long edge from a to d crosses the columns of b and c, it gets a
+    # dummy vertex in each and the nodes of those columns make room.
+    model = GraphModel()
+    a = addNode(model, 'a', outputs=2)
+    b, c = addNode(model, 'b'), addNode(model, 'c')
+    d = addNode(model, 'd', inputs=2)
+    connect(model, a, b)
+    connect(model, b, c)
+    connect(model, c, d)
+    connect(model, a, d, 1, 1)
+    others = [addNode(model, 'x{}'.format(idx)) for idx in range(3)]
+    for node in others:
+        connect(model, a, node)
+        connect(model, node, c)
+    apply(model, layoutModel(model, layerSpacing=20.0))
+    assert (a.x, b.x, c.x, d.x) == (0.0, 80.0, 160.0, 240.0)
+    assert all(node.x == b.x for node in others)
+    assertNoOverlap(model)
+
+
+def testNodeSizes():
+    # columns are as wide as their widest node.
+    model = GraphModel()
+    a = addNode(model, 'a', width=200.0)
+    b = addNode(model, 'b', width=50.0)
+    c = addNode(model, 'c')
+    connect(model, a, c)
+    connect(model, b, c)
+    apply(model, layoutModel(model, layerSpacing=10.0, nodeSpacing=25.0))
+    assert a.x == b.x == 0.0
+    assert c.x == 210.0
+    top, bottom = sorted((a, b), key=lambda node: node.y)
+    assert bottom.y - (top.y + top.height) >= 25.0 - 1e-6
+
+
+def testSubsetLayout():
+    model = randomGraph(3, count=20, edgeCount=30)
+    for idx, node in enumerate(model.nodes()):
+        model.setNodePos(node.id, idx * 7.0, idx * -3.0)
+    subset = [node.id for node in model.nodes()][5:15]
+    before = dict((node.id, (node.x, node.y)) for node in model.nodes())
+
+    positions = layoutModel(model, subset)
+    assert sorted(positions) == sorted(subset)
+    # the model is not changed and the subset keeps its top left corner.
+    assert dict((node.id, (node.x, node.y))
+                for node in model.nodes()) == before
+    assert min(x for x, _ in positions.values()) == \
+        min(before[n][0] for n in subset)
+    assert min(y for _, y in positions.values()) == \
+        min(before[n][1] for n in subset)
+
+    apply(model, positions)
+    for node in model.nodes():
+        if node.id not in positions:
+            assert (node.x, node.y) == before[node.id]
+    assertNoOverlap(model, subset)
+    feedback = feedbackEdges(model, subset)
+    subsetIds = set(subset)
+    for outNodeId, inNodeId in edgeNodes(model):
+        if outNodeId in subsetIds and inNodeId in subsetIds and \
+                (outNodeId, inNodeId) not in feedback:
+            assert model.node(outNodeId).x < model.node(inNodeId).x
+
+
+def testSnapshot():
+    model = GraphModel()
+    a = addNode(model, 'a', outputs=3)
+    b = addNode(model, 'b')
+    c = addNode(model, 'c')
+    connect(model, a, b, 1, 0)
+    connect(model, a, c, 2, 0)
+    nodes, edges = snapshotLayout(model, [a.id, b.id])
+    assert [record[0] for record in nodes] == [a.id, b.id]
+    assert edges == [(a.id, 0.5, b.id, 0.5)]
+    assert computeLayout([], []) == {}
+    assert computeLayout(nodes, [], origin=(5.0, 6.0))[a.id] == (5.0, 6.0)
@@ -0,0 +1,191 @@
+import pytest
+
+from graphModel import GraphModel
+
+
+def addNode(model, name, inputs=('in',), outputs=('out',), **kwargs):
+    node = model.addNode(name, **kwargs)
+    for portName in inputs:
+        model.addPort(node.id, portName, 'in')
+    for portName in outputs:
+        model.addPort(node.id, portName, 'out')
+    return node
+
+
+def testIds():
+    model = GraphModel()
+    a = addNode(model, 'a')
+    b = addNode(model, 'b')
+    assert (a.id, b.id) == (1, 2)
+    assert a.inputs == [1] and a.outputs == [2]
+    assert model.port(2).index == 0
+
+    # explicit ids move the counter past them, reused ids are refused.
+    c = model.addNode('c', nodeId=10)
+    assert c.id == 10
+    assert model.addNode('d').id == 11
+    with pytest.raises(ValueError):
+        model.addNode('e', nodeId=10)
+    with pytest.raises(ValueError):
+        model.addPort(a.id, 'x', 'in', portId=1)
+    with pytest.raises(ValueError):
+        model.addPort(a.id, 'x', 'side')
+    edge = model.connect(a.outputs[0], b.inputs[0], edgeId=5)
+    assert edge.id == 5
+    port = model.addPort(c.id, 'in', 'in')
+    with pytest.raises(ValueError):
+        model.connect(b.outputs[0], port.id, edgeId=5)
+
+    # ids are not reused after a removal.
+    model.removeNode(c.id)
+    assert model.addNode('f').id == 12
+    assert len(model) == 4
+
+
+def testConnect():
+    model = GraphModel()
+    a = addNode(model, 'a')
+    b = addNode(model, 'b')
+    # stored from the output to the input whatever the argument order.
+    edge = model.connect(b.inputs[0], a.outputs[0])
+    assert (edge.outPortId, edge.inPortId) == (a.outputs[0], b.inputs[0])
+    assert model.findEdge(a.outputs[0], b.inputs[0]) is edge
+    assert model.connectedPorts(b.inputs[0]) == [a.outputs[0]]
+    assert model.connectedPorts(a.outputs[0]) == [b.inputs[0]]
+    assert model.upstreamNodes(b.id) == {a.id}
+    assert model.downstreamNodes(a.id) == {b.id}
+    assert model.nodeEdges(a.id) == {edge.id}
+
+    with pytest.raises(ValueError):
+        model.connect(a.outputs[0], b.outputs[0])
+    with pytest.raises(ValueError):
+        model.connect(a.outputs[0], a.inputs[0])
+
+    assert model.disconnect(edge.id) is edge
+    assert model.disconnect(edge.id) is None
+    assert model.findEdge(a.outputs[0], b.inputs[0]) is None
+    assert not model.port(b.inputs[0]).edges
+    assert model.upstreamNodes(b.id) == set()
+
+
+def testRemoveNode():
+    model = GraphModel()
+    a = addNode(model, 'a')
+    b = addNode(model, 'b')
+    c = addNode(model, 'c')
+    model.connect(a.outputs[0], b.inputs[0])
+    kept = model.connect(a.outputs[0], c.inputs[0])
+    model.connect(b.outputs[0], c.inputs[0])
+    group = model.addGroup('g', [b.id])
+
+    removed = model.removeNode(b.id)
+    assert len(removed) == 2
+    assert not model.hasNode(b.id)
+    assert not any(model.hasPort(p) for p in b.inputs + b.outputs)
+    assert [edge.id for edge in model.edges()] == [kept.id]
+    assert model.port(a.outputs[0]).edges == {kept.id}
+    assert model.port(c.inputs[0]).edges == {kept.id}
+    assert group.nodeIds == set()
+    assert b.groupId == group.id
+
+
+def testGroups():
+    model = GraphModel()
+    a = addNode(model, 'a')
+    b = addNode(model, 'b')
+    group = model.addGroup('g', [a.id, b.id])
+    assert group.nodeIds == {a.id, b.id}
+    assert a.groupId == group.id
+    other = model.addGroup('h')
+    model.setNodeGroup(a.id, other.id)
+    assert group.nodeIds == {b.id} and other.nodeIds == {a.id}
+    model.removeGroup(group.id)
+    assert b.groupId is None
+    assert not model.hasGroup(group.id)
+
+
+def testGeometryAndAttrs():
+    model = GraphModel()
+    assert model.bounds() is None
+    a = addNode(model, 'a', x=0, y=0, width=10, height=10)
+    b = addNode(model, 'b', x=100, y=50, width=20, height=10)
+    assert model.bounds() == (0, 0, 120, 60)
+    assert model.nodesInRect(5, 5, 10, 10) == [a]
+    model.setNodePos(b.id, -20, 0)
+    assert model.bounds() == (-20, 0, 30, 10)
+
+    assert model.attr(a.id, 'gain', 1) == 1
+    model.setAttr(a.id, 'gain', 2)
+    assert model.attr(a.id, 'gain') == 2
+    assert b.attrs is None
+
+
+def testRemoveCallbacks():
+    model = GraphModel()
+    changes = []
+    model.changeCallbacks.append(
+        lambda kind, record: changes.append((kind, record)))
+    a = addNode(model, 'a')
+    b = addNode(model, 'b')
+    edge = model.connect(a.outputs[0], b.inputs[0])
+    assert changes[-1] == ('connect', edge)
+    del changes[:]
+
+    model.removeNode(a.id)
+    assert [kind for kind, _ in changes] == ['disconnect', 'removeNode']
+    assert changes[0][1] is edge
+    model.clear()
+    assert changes[-1] == ('clear', None)
+    assert len(model) == 0
+
+
+def testRemoveNodeNotifiedAfterItsEdges():
+    # listeners such as the NodeMinimap run first and cannot look the
+    # removed node up, its edges were each reported as 'disconnect'.
+    model = GraphModel()
+    a = addNode(model, 'a')
+    b = addNode(model, 'b')
+    c = addNode(model, 'c')
+    edges = set([model.connect(a.outputs[0], b.inputs[0]).id,
+                 model.connect(b.outputs[0], c.inputs[0]).id])
+    seen = []
+
+    def first(kind, record):
+        if kind == 'disconnect':
+            seen.append(('disconnect', record.id, model.hasNode(b.id)))
+        elif kind == 'removeNode':
+            assert not model.hasNode(record.id)
+            assert not any(model.hasEdge(edgeId) for edgeId in edges)
+            with pytest.raises(KeyError):
+                model.nodeEdges(record.id)
+            seen.append(('removeNode', record.id, False))
+
+    later = []
+    model.changeCallbacks.insert(0, first)
+    model.changeCallbacks.append(lambda kind, record: later.append(kind))
+    model.removeNode(b.id)
+    assert seen[:2] == [('disconnect', edgeId, True)
+                        for edgeId in sorted(edges)]
+    assert seen[2] == ('removeNode', b.id, False)
+    assert later == ['disconnect', 'disconnect', 'removeNode']
+
+
+def testCallbackKinds():
+    model = GraphModel()
+    kinds = []
+    model.changeCallbacks.append(lambda kind, record: kinds.append(kind))
+    a = addNode(model, 'a')
+    b = addNode(model, 'b')
+    model.connect(a.outputs[0], b.inputs[0])
+    model.setNodeName(a.id, 'renamed')
+    model.setPortName(a.outputs[0], 'result')
+    model.setNodeSize(a.id, 80, 40)
+    model.setAttr(b.id, 'gain', 2)
+    group = model.addGroup('g', [a.id])
+    model.setGroupCollapsed(group.id)
+    model.setGroupCollapsed(group.id)
+    model.removeGroup(group.id)
+    assert kinds == [
+        'addNode', 'addPort', 'addPort', 'addNode', 'addPort', 'addPort',
+        'connect', 'name', 'portName', 'geometry', 'attr', 'addGroup',
+        'group', 'groupState', 'group', 'removeGroup']
@@ -0,0 +1,250 @@
+import os
+import sys
+import textwrap
+
+import pytest
+
+from graphRegistry import NodeTypeError, NodeTypeRegistry, scanSource
+
+# a module of node types, NodeItem stands for the Qt class so it imports
+# without Qt.
+NODES = textwrap.dedent('''
+    class NodeItem(object):
+
+        def __init__(self, name='node'):
+            self.name = name
+            self._inputs = []
+            self._outputs = []
+
+        def addInputPort(self, label='input', connectionLimit=-1,
+                         dataType=None):
+            self._inputs.append((label, connectionLimit, dataType))
+
+        def addOutputPort(self, label='output', connectionLimit=-1,
+                          dataType=None):
+            self._outputs.append((label, connectionLimit, dataType))
+
+        def portSchema(self):
+            return self._inputs, self._outputs
+
+
+    class Blur(NodeItem):
+        category = 'filter'
+        label = 'Blur Image'
+
+        def __init__(self, name='Blur'):
+            super(Blur, self).__init__(name)
+            self.addInputPort('image', 1, 'image')
+            self.addInputPort(label='size', dataType='float')
+            self.addOutputPort('out')
+
+
+    class SoftBlur(Blur):
+        nodeType = 'Soft'
+
+
+    class Sharpen(Blur):
+
+        def __init__(self, name='Sharpen'):
+            super(Sharpen, self).__init__(name)
+            self.addInputPort('amount')
+
+
+    class Switch(NodeItem):
+        category = 'utility'
+
+        def __init__(self, name='Switch', count=3):
+            super(Switch, self).__init__(name)
+            for idx in range(count):
+                self.addInputPort('in{}'.format(idx))
+            self.addOutputPort('out')
+''')
+
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    # a directory on sys.path with the node module, unloaded afterwards.
+    moduleName = 'registryNodes'
+    path = tmp_path / 'modules'
+    path.mkdir()
+    (path / (moduleName + '.py')).write_text(NODES)
+    monkeypatch.syspath_prepend(str(path))
+    yield str(path), moduleName
+    sys.modules.pop(moduleName, None)
+
+
+def byName(infos):
+    return dict((info.typeName, info) for info in infos)
+
+
+def testScanSource():
+    infos = byName(scanSource(NODES, 'mod'))
+    assert sorted(infos) == ['Blur', 'Sharpen', 'Soft', 'Switch']
+    blur = infos['Blur']
+    assert blur.target == 'mod:Blur'
+    assert (blur.label, blur.category) == ('Blur Image', 'filter')
+    assert blur.inputs == [['image', 1, 'image'], ['size', -1, 'float']]
+    assert blur.outputs == [['out', -1, None]]
+
+    # inherited ports, class attributes but not the type name.
+    soft = infos['Soft']
+    assert soft.target == 'mod:SoftBlur'
+    assert (soft.inputs, soft.outputs) == (blur.inputs, blur.outputs)
+    assert soft.category == 'filter'
+    assert infos['Sharpen'].inputs == blur.inputs + [['amount', -1, None]]
+    assert infos['Sharpen'].outputs == blur.outputs
+
+    # ports added in a loop are only known once an instance exists.
+    switch = infos['Switch']
+    assert switch.inputs is None and switch.outputs is None
+    assert not switch.hasSchema()
+
+
+def testScanSourceDynamicPorts():
+    source = textwrap.dedent('''
+        class A(NodeItem):
+            def __init__(self, name='A'):
+                super(A, self).__init__(name)
+                self.addInputPort(self.defaultLabel)
+
+
+        class B(NodeItem):
+            def __init__(self, name='B'):
+                super(B, self).__init__(name)
+                self.addPorts()
+
+            def addPorts(self):
+                self.addInputPort('x')
+
+
+        class C(A):
+            pass
+
+
+        class Other(object):
+            pass
+    ''')
+    infos = byName(scanSource(source, 'mod'))
+    assert sorted(infos) == ['A', 'B', 'C']
+    assert all(info.inputs is None for info in infos.values())
+
+
+def testScanFileCache(package, tmp_path):
+    folder, moduleName = package
+    path = os.path.join(folder, moduleName + '.py')
+    cachePath = str(tmp_path / 'types.json')
+    registry = NodeTypeRegistry(cachePath)
+    found = registry.discoverModules(folder)
+    assert sorted(found) == ['Blur', 'Sharpen', 'Soft', 'Switch']
+    assert (registry.parsedFiles, registry.cachedFiles) == (1, 0)
+    assert registry.info('Blur').source == path
+    registry.save()
+
+    # a new session reads the schemas from the cache.
+    registry = NodeTypeRegistry(cachePath)
+    registry.discoverModules(folder)
+    assert (registry.parsedFiles, registry.cachedFiles) == (0, 1)
+    assert registry.info('Blur').inputs[0] == ['image', 1, 'image']
+    assert registry.info('Blur').source == path
+
+    # parsed again when the modification time, size or module name change.
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    registry.discoverModules(folder)
+    assert registry.parsedFiles == 1
+    with open(path, 'a') as f:
+        f.write('\n\nclass Extra(Blur):\n    pass\n')
+    assert 'Extra' in registry.discoverModules(folder)
+    assert registry.parsedFiles == 2
+    registry.discoverModules(path, 'pkg')
+    assert registry.parsedFiles == 3
+    assert registry.info('Extra').target == 'pkg.{}:Extra'.format(moduleName)
+    registry.discoverModules(path, 'pkg')
+    assert (registry.parsedFiles, registry.cachedFiles) == (3, 2)
+
+
+def testLoadAndCreate(package, tmp_path):
+    folder, moduleName = package
+    cachePath = str(tmp_path / 'types.json')
+    registry = NodeTypeRegistry(cachePath)
+    registry.discoverModules(folder)
+    registry.save()
+    assert moduleName not in sys.modules
+    assert not registry.isLoaded('Soft')
+
+    item = registry.create('Soft', 'mySoft')
+    assert moduleName in sys.modules
+    assert registry.isLoaded('Soft')
+    assert type(item).__name__ == 'SoftBlur'
+    assert (item.name, item.nodeType) == ('mySoft', 'Soft')
+    assert registry.load('Soft') is type(item)
+
+    with pytest.raises(NodeTypeError):
+        registry.create('Missing')
+    registry.register('Broken', '{}:Missing'.format(moduleName))
+    with pytest.raises(NodeTypeError):
+        registry.load('Broken')
+    registry.register('NoModule', 'noSuchNodeModule:Node')
+    with pytest.raises(NodeTypeError):
+        registry.load('NoModule')
+
+
+def testLearnSchema(package, tmp_path):
+    folder, moduleName = package
+    cachePath = str(tmp_path / 'types.json')
+    registry = NodeTypeRegistry(cachePath)
+    registry.discoverModules(folder)
+    registry.save()
+    assert registry.info('Switch').inputs is None
+
+    # the first instance gives the ports the source could not.
+    registry.create('Switch')
+    switch = registry.info('Switch')
+    assert switch.inputs == [['in0', -1, None], ['in1', -1, None],
+                             ['in2', -1, None]]
+    assert switch.outputs == [['out', -1, None]]
+    assert registry.search('in2') == [switch]
+    registry.save()
+
+    registry = NodeTypeRegistry(cachePath)
+    registry.discoverModules(folder)
+    assert registry.parsedFiles == 0
+    assert registry.info('Switch').inputs == switch.inputs
+    assert registry.search('in1')[0].typeName == 'Switch'
+
+    # nothing new, the cache file is not written again.
+    mtime = os.path.getmtime(cachePath)
+    os.utime(cachePath, (mtime - 100, mtime - 100))
+    registry.save()
+    assert os.path.getmtime(cachePath) == mtime - 100
+
+
+def testSearch():
+    registry = NodeTypeRegistry()
+    registry.register('Blur', 'm:Blur', 'Blur', 'filter',
+                      [['image', 1, None]], [['out', -1, None]])
+    registry.register('ZBlur', 'm:ZBlur', 'ZDepth Blur', 'filter',
+                      [['depth', 1, None]], [['out', -1, None]])
+    registry.register('Deblur', 'm:Deblur', 'Deblur', 'restore')
+    registry.register('Grade', 'm:Grade', 'Grade', 'color',
+                      [['mask', 1, None]], [['out', -1, None]])
+
+    # labels starting with the query first, then by label.
+    assert [info.typeName for info in registry.search('blur')] == [
+        'Blur', 'Deblur', 'ZBlur']
+    assert [info.typeName for info in registry.search('BLUR', limit=1)] \
+        == ['Blur']
+    # every word must match the name, label, category or a port.
+    assert [info.typeName for info in registry.search('filter depth')] == [
+        'ZBlur']
+    assert [info.typeName for info in registry.search('mask')] == ['Grade']
+    assert [info.typeName for info in registry.search('out')] == [
+        'Blur', 'Grade', 'ZBlur']
+    assert registry.search('sharpen') == []
+
+    registry.register('Blur2', 'm:Blur2', 'Blur Fast', 'filter')
+    assert [info.typeName for info in registry.search('blur')][:2] == [
+        'Blur', 'Blur2']
+    assert registry.categories() == ['color', 'filter', 'restore']
+    assert [info.typeName for info in registry.types('filter')] == [
+        'Blur', 'Blur2', 'ZBlur']
@@ -0,0 +1,122 @@
+import random
+
+import pytest
+
+from graphModel import GraphModel
+from graphRules import ConnectionRules, TopologicalIndex
+
+
+def addNodes(model, count):
+    nodes = []
+    for idx in range(count):
+        node = model.addNode('n{}'.format(idx))
+        model.addPort(node.id, 'in', 'in')
+        model.addPort(node.id, 'out', 'out')
+        nodes.append(node)
+    return nodes
+
+
+def reachable(model, start):
+    # brute force: every node reached from start through the edges.
+    found = set([start])
+    stack = [start]
+    while stack:
+        for nodeId in model.downstreamNodes(stack.pop()):
+            if nodeId not in found:
+                found.add(nodeId)
+                stack.append(nodeId)
+    return found
+
+
+def connect(model, outNode, inNode):
+    return model.connect(outNode.outputs[0], inNode.inputs[0])
+
+
+def assertOrdered(model, index):
+    orders = [index.order(node.id) for node in model.nodes()]
+    assert len(set(orders)) == len(orders)
+    for edge in model.edges():
+        outNodeId = model.port(edge.outPortId).nodeId
+        inNodeId = model.port(edge.inPortId).nodeId
+        assert index.order(outNodeId) < index.order(inNodeId)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def testRandomEdges(seed):
+    rng = random.Random(seed)
+    model = GraphModel()
+    nodes = addNodes(model, 40)
+    index = TopologicalIndex(model)
+    for _ in range(400):
+        outNode, inNode = rng.sample(nodes, 2)
+        expected = outNode.id in reachable(model, inNode.id)
+        assert index.wouldCreateCycle(outNode.id, inNode.id) == expected
+        if not expected and model.findEdge(
+                outNode.outputs[0], inNode.inputs[0]) is None:
+            connect(model, outNode, inNode)
+        if model.edges() and rng.random() < 0.2:
+            model.disconnect(rng.choice(list(model.edges())).id)
+        assert index.isValid()
+        assertOrdered(model, index)
+
+    for node in nodes:
+        assert index.descendants(node.id) == reachable(model, node.id)
+        assert index.ancestors(node.id) == set(
+            other.id for other in nodes
+            if node.id in reachable(model, other.id))
+
+
+def testAddedAndRemovedNodes():
+    model = GraphModel()
+    a, b = addNodes(model, 2)
+    index = TopologicalIndex(model)
+    connect(model, b, a)
+    c, = addNodes(model, 1)
+    connect(model, c, b)
+    assertOrdered(model, index)
+    assert index.wouldCreateCycle(a.id, c.id)
+    model.removeNode(b.id)
+    assert index.order(b.id) is None
+    assert not index.wouldCreateCycle(a.id, c.id)
+    assert index.wouldCreateCycle(a.id, a.id)
+
+
+def testCycleInvalidates():
+    model = GraphModel()
+    a, b, c = addNodes(model, 3)
+    index = TopologicalIndex(model)
+    connect(model, a, b)
+    connect(model, b, c)
+    # the model does not check the rules itself.
+    edge = connect(model, c, a)
+    assert not index.isValid()
+    assert index.wouldCreateCycle(b.id, a.id)
+    assert not index.rebuild()
+
+    model.disconnect(edge.id)
+    assert index.isValid()
+    assertOrdered(model, index)
+    assert index.wouldCreateCycle(c.id, a.id)
+    assert not index.wouldCreateCycle(a.id, c.id)
+
+    index.close()
+    connect(model, c, a)
+    assert index.isValid()
+
+
+def testConversions():
+    rules = ConnectionRules()
+    rules.addConversion('int', 'float')
+    rules.addConversion('float', 'string')
+    assert rules.isCompatible('int', 'string')
+    assert rules.isCompatible('int', 'int')
+    assert not rules.isCompatible('string', 'int')
+    # untyped ports connect to anything.
+    assert rules.isCompatible(None, 'int')
+    assert rules.isCompatible('matrix', None)
+    assert rules.compatibleTypes('int') == {'int', 'float', 'string'}
+    assert rules.compatibleTypes('matrix') == {'matrix'}
+
+    rules.removeConversion('float', 'string')
+    assert not rules.isCompatible('int', 'string')
+    assert rules.isCompatible('int', 'float')
@@ -0,0 +1,209 @@
+import threading
+
+import pytest
+
+from graphEvaluator import GraphEvaluator
+from graphModel import GraphModel
+from graphScheduler import GraphScheduler
+
+TIMEOUT = 10
+
+
+def addNode(model, name, nodeType='Add', connectionLimit=1):
+    node = model.addNode(name, nodeType)
+    model.addPort(node.id, 'x', 'in', connectionLimit)
+    model.addPort(node.id, 'out', 'out')
+    return node
+
+
+def addOne(node, inputs):
+    value = inputs.get('x')
+    if isinstance(value, list):
+        value = sum(value)
+    return (value or 0) + 1
+
+
+def fanOut(model, count=3):
+    # a feeding "count" branches all feeding a single sum node.
+    a = addNode(model, 'a')
+    branches = [addNode(model, 'b{}'.format(idx)) for idx in range(count)]
+    end = addNode(model, 'end', 'Sum', -1)
+    for node in branches:
+        model.connect(a.outputs[0], node.inputs[0])
+        model.connect(node.outputs[0], end.inputs[0])
+    return a, branches, end
+
+
+@pytest.fixture
+def scheduler():
+    evaluator = GraphEvaluator(GraphModel())
+    evaluator.registerType('Add', addOne)
+    evaluator.registerType('Sum', addOne)
+    scheduler = GraphScheduler(evaluator, maxThreads=4)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def record(scheduler):
+    events = []
+    lock = threading.Lock()
+
+    def add(*args):
+        with lock:
+            events.append(args)
+
+    scheduler.startedCallbacks.append(lambda n: add('start', n))
+    scheduler.finishedCallbacks.append(lambda n: add('finish', n))
+    scheduler.failedCallbacks.append(lambda n, e: add('fail', n, e))
+    scheduler.doneCallbacks.append(lambda: add('done',))
+    scheduler.cancelledCallbacks.append(lambda: add('cancel',))
+    return events
+
+
+def testFanOut(scheduler):
+    model = scheduler.model
+    a, branches, end = fanOut(model)
+    # the branches only pass the barrier when they all run at once.
+    barrier = threading.Barrier(len(branches), timeout=TIMEOUT)
+
+    def branch(node, inputs):
+        barrier.wait()
+        return addOne(node, inputs)
+
+    for node in branches:
+        scheduler.evaluator.setCompute(node.id, branch)
+    events = record(scheduler)
+    progress = []
+    scheduler.progressCallbacks.append(
+        lambda done, total: progress.append((done, total)))
+
+    assert scheduler.run(timeout=TIMEOUT)
+    assert not scheduler.isRunning()
+    assert scheduler.evaluator.cachedResult(end.id) == {'out': 7}
+    starts = [event[1] for event in events if event[0] == 'start']
+    finishes = [event[1] for event in events if event[0] == 'finish']
+    assert starts[0] == a.id and finishes[0] == a.id
+    assert starts[-1] == end.id and finishes[-1] == end.id
+    assert set(starts[1:-1]) == set(node.id for node in branches)
+    assert events[-1] == ('done',)
+    assert progress == [(idx, 5) for idx in range(1, 6)]
+
+    # nothing dirty, nothing to run.
+    events[:] = []
+    assert scheduler.start() == 0
+    assert events == [('done',)]
+
+
+def testOnlyDirtyUpstream(scheduler):
+    model = scheduler.model
+    a, branches, end = fanOut(model)
+    scheduler.evaluator.evaluateAll()
+    scheduler.evaluator.setParam(branches[0].id, 'step', 2)
+    other = addNode(model, 'other')
+    events = record(scheduler)
+    assert scheduler.start([end.id]) == 2
+    assert scheduler.wait(TIMEOUT)
+    assert [event[1] for event in events if event[0] == 'start'] == [
+        branches[0].id, end.id]
+    assert scheduler.evaluator.isDirty(other.id)
+
+
+def testCancelOnModelEdit(scheduler):
+    model = scheduler.model
+    a = addNode(model, 'a')
+    b = addNode(model, 'b')
+    model.connect(a.outputs[0], b.inputs[0])
+    running = threading.Event()
+    release = threading.Event()
+
+    def slow(node, inputs):
+        running.set()
+        release.wait(TIMEOUT)
+        return 1
+
+    scheduler.evaluator.setCompute(a.id, slow)
+    events = record(scheduler)
+    assert scheduler.start() == 2
+    assert running.wait(TIMEOUT)
+    model.setAttr(b.id, 'gain', 2)
+    assert not scheduler.isRunning()
+    assert events[-1] == ('cancel',)
+    release.set()
+    assert not scheduler.wait(TIMEOUT)
+    # the result of the cancelled run is dropped.
+    assert scheduler.evaluator.isDirty(a.id)
+    assert not any(event[0] == 'finish' for event in events)
+    assert scheduler._modelChanged not in model.changeCallbacks
+
+    # edits outside of a run do nothing, the next run completes.
+    assert scheduler.run(timeout=TIMEOUT)
+    assert scheduler.evaluator.cachedResult(b.id) == {'out': 2}
+
+
+def testFailure(scheduler):
+    model = scheduler.model
+    a, branches, end = fanOut(model)
+    error = ValueError('bad input')
+
+    def fail(node, inputs):
+        raise error
+
+    scheduler.evaluator.setCompute(branches[1].id, fail)
+    events = record(scheduler)
+    assert not scheduler.run(timeout=TIMEOUT)
+    assert ('fail', branches[1].id, error) in events
+    assert events[-1] == ('cancel',)
+    assert scheduler.evaluator.isDirty(end.id)
+    assert not scheduler.isRunning()
+
+
+@pytest.mark.parametrize('affinity', ['main', 'thread'])
+def testAffinity(scheduler, affinity):
+    model = scheduler.model
+    a, branches, end = fanOut(model, 2)
+    threads = {}
+
+    def where(node, inputs):
+        threads[node.id] = threading.current_thread()
+        return addOne(node, inputs)
+
+    for node in (a, end):
+        scheduler.evaluator.setCompute(node.id, where)
+    scheduler.setNodeAffinity(a.id, affinity)
+    scheduler.setTypeAffinity('Sum', 'main')
+    assert scheduler.affinity(a.id) == affinity
+    assert scheduler.affinity(branches[0].id) == 'thread'
+    assert scheduler.run(timeout=TIMEOUT)
+    main = threading.current_thread()
+    assert threads[end.id] is main
+    assert (threads[a.id] is main) == (affinity == 'main')
+    # the hint is not an edit, the node stays clean.
+    assert not scheduler.evaluator.isDirty(a.id)
+    with pytest.raises(ValueError):
+        scheduler.setNodeAffinity(a.id, 'gpu')
+    with pytest.raises(ValueError):
+        scheduler.setTypeAffinity('Add', 'gpu')
+
+
+def testMainFailure(scheduler):
+    model = scheduler.model
+    a = addNode(model, 'a')
+    scheduler.setNodeAffinity(a.id, 'main')
+    error = RuntimeError('main failed')
+
+    def fail(node, inputs):
+        raise error
+
+    scheduler.evaluator.setCompute(a.id, fail)
+    events = record(scheduler)
+    assert not scheduler.run(timeout=TIMEOUT)
+    assert events == [('start', a.id), ('fail', a.id, error), ('cancel',)]
+
+
+def testProcessAffinity(scheduler):
+    model = scheduler.model
+    a, branches, end = fanOut(model, 2)
+    scheduler.maxProcesses = 2
+    scheduler.setTypeAffinity('Add', 'process')
+    assert scheduler.run(timeout=TIMEOUT)
+    assert scheduler.evaluator.cachedResult(end.id) == {'out': 5}
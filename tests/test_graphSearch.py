@@ -0,0 +1,87 @@
+from graphModel import GraphModel
+from graphSearch import SearchIndex
+
+
+def addNode(model, name, labels=()):
+    node = model.addNode(name, 'TestNode')
+    for label in labels:
+        model.addPort(node.id, label, 'in')
+    return node
+
+
+def testShortQueryReturnsEachNodeOnce():
+    model = GraphModel()
+    node = addNode(model, 'ab abc', ['abd'])
+    index = SearchIndex(model)
+    assert index.search('ab') == [node.id]
+    assert index.search('ab', None) == [node.id]
+
+
+def testExactAndPrefixNamesComeFirstPastTheBudget():
+    model = GraphModel()
+    for idx in range(2000):
+        addNode(model, 'my_blur_{}'.format(idx))
+    for idx in range(2000):
+        addNode(model, 'blur_{}'.format(idx))
+    exact = addNode(model, 'blur')
+    index = SearchIndex(model)
+    found = index.search('blur', 10)
+    assert found[0] == exact.id
+    names = [model.node(n).name for n in found[1:]]
+    assert names == sorted(names)
+    assert all(name.startswith('blur_') for name in names)
+
+
+def testRanking():
+    model = GraphModel()
+    label = addNode(model, 'merge', ['blur'])
+    inside = addNode(model, 'my_blur')
+    prefix = addNode(model, 'blur_2')
+    exact = addNode(model, 'blur')
+    index = SearchIndex(model)
+    assert index.search('blur') == [exact.id, prefix.id, inside.id, label.id]
+
+
+def testIncrementalUpdates():
+    model = GraphModel()
+    node = addNode(model, 'grade', ['in'])
+    other = addNode(model, 'merge')
+    index = SearchIndex(model)
+    model.setNodeName(node.id, 'transform')
+    assert index.search('grade') == []
+    assert index.search('transform') == [node.id]
+    port = model.addPort(other.id, 'matte', 'in')
+    assert index.search('matte') == [other.id]
+    model.setPortName(port.id, 'mask')
+    assert index.search('matte') == []
+    assert index.search('mask') == [other.id]
+    model.removeNode(node.id)
+    assert index.search('transform') == []
+    assert index.search('tr') == []
+
+
+def testIncrementalIndexMatchesRebuild():
+    model = GraphModel()
+    index = SearchIndex(model)
+    nodes = [addNode(model, 'node_{}_{}'.format(idx % 7, idx), ['in_a'])
+             for idx in range(50)]
+    for node in nodes[::3]:
+        model.removeNode(node.id)
+    for node in nodes[1::3]:
+        model.setNodeName(node.id, 'renamed_{}'.format(node.id))
+    rebuilt = SearchIndex(model)
+    assert index._sortedTerms == rebuilt._sortedTerms
+    assert index._names == rebuilt._names
+    assert dict(index._grams) == dict(rebuilt._grams)
+
+
+def testFuzzyAndMultiWordQueries():
+    model = GraphModel()
+    node = addNode(model, 'transform_2d', ['matrix'])
+    addNode(model, 'translate')
+    index = SearchIndex(model)
+    assert index.search('trnsform') == [node.id]
+    assert index.search('transform matrix') == [node.id]
+    assert index.search('transform missing') == []
+    assert index.bounds([node.id]) == (node.x, node.y, node.width,
+                                       node.height)
@@ -0,0 +1,151 @@
+import json
+import struct
+
+import pytest
+
+import graphSerializer
+from graphEvaluator import GraphEvaluator
+from graphModel import GraphModel
+from graphSerializer import GraphFormatError
+
+
+def buildModel():
+    model = GraphModel()
+    previous = None
+    for idx in range(5):
+        node = model.addNode('node_{}'.format(idx), 'Scale', idx * 100.0,
+                             idx * 10.0, 120.0, 80.0)
+        node.color = '#102030'
+        node.attrs = {'factor': idx + 0.5, 'mode': 'fast', 'tags': [1, 2]}
+        inPort = model.addPort(node.id, 'in', 'in', 1, dataType='float')
+        outPort = model.addPort(node.id, 'out', 'out')
+        if previous is not None:
+            model.connect(previous.id, inPort.id)
+        previous = outPort
+    return model
+
+
+def snapshot(model):
+    nodes = []
+    for node in model.nodes():
+        ports = [(p.id, p.name, p.portType, p.connectionLimit, p.dataType)
+                 for p in (model.port(i) for i in node.ports())]
+        nodes.append((node.id, node.name, node.nodeType, node.x, node.y,
+                      node.width, node.height, node.color, node.textColor,
+                      node.attrs, ports))
+    edges = [(e.id, e.outPortId, e.inPortId) for e in model.edges()]
+    return sorted(nodes), sorted(edges)
+
+
+@pytest.mark.parametrize('fileName', ['graph.json', 'graph.bin'])
+@pytest.mark.parametrize('useMmap', [False, True])
+def testRoundTrip(tmpdir, fileName, useMmap):
+    model = buildModel()
+    path = str(tmpdir.join(fileName))
+    graphSerializer.save(model, path)
+    assert snapshot(graphSerializer.load(path, useMmap=useMmap)) == \
+        snapshot(model)
+    streamed = GraphModel()
+    chunks = list(graphSerializer.iterLoad(path, streamed, 2, useMmap))
+    assert len(chunks) > 1
+    assert snapshot(streamed) == snapshot(model)
+
+
+@pytest.mark.parametrize('fileName', ['graph.json', 'graph.bin'])
+def testUnserializableAttrsAreDropped(tmpdir, fileName):
+    model = GraphModel()
+    node = model.addNode('a', 'T')
+    node.attrs = {'callback': object()}
+    path = str(tmpdir.join(fileName))
+    graphSerializer.save(model, path)
+    assert graphSerializer.load(path).node(node.id).attrs is None
+
+
+@pytest.mark.parametrize('fileName', ['graph.json', 'graph.bin'])
+def testReloadedGraphKeepsResultKeys(tmpdir, fileName):
+    def scale(node, inputs):
+        return (inputs['in'] or 1.0) * node.attrs['factor']
+
+    model = buildModel()
+    evaluator = GraphEvaluator(model)
+    evaluator.registerType('Scale', scale)
+    path = str(tmpdir.join(fileName))
+    graphSerializer.save(model, path)
+    loaded = GraphEvaluator(graphSerializer.load(path))
+    loaded.registerType('Scale', scale)
+    for node in model.nodes():
+        assert loaded.resultKey(node.id) == evaluator.resultKey(node.id)
+    lastId = max(node.id for node in model.nodes())
+    assert loaded.evaluate(lastId, 'out') == evaluator.evaluate(lastId, 'out')
+
+
+def testReadsVersion2Json(tmpdir):
+    path = str(tmpdir.join('v2.json'))
+    lines = [
+        {'format': 'pySideNodeGraph', 'version': 2, 'nodes': 2, 'edges': 1},
+        {'node': 1, 'name': 'a', 'type': 'T', 'pos': [0, 0],
+         'size': [50, 50], 'color': None, 'textColor': None,
+         'inputs': [], 'outputs': [[1, 'out', -1, 'float']]},
+        {'node': 2, 'name': 'b', 'type': 'T', 'pos': [10, 0],
+         'size': [50, 50], 'color': None, 'textColor': None,
+         'inputs': [[2, 'in', 1, None]], 'outputs': []},
+        {'edge': [1, 1, 2]}]
+    with open(path, 'w') as f:
+        f.write('\n'.join(json.dumps(line) for line in lines))
+    model = graphSerializer.load(path)
+    assert model.node(1).attrs is None
+    assert model.port(1).dataType == 'float'
+    assert model.edge(1).inPortId == 2
+
+
+def testReadsVersion2Binary(tmpdir):
+    path = str(tmpdir.join('v2.bin'))
+    strings = [b'a', b'T', b'out']
+    data = [struct.pack('<4sHIII', b'PSNG', 2, len(strings), 1, 0)]
+    for text in strings:
+        data.append(struct.pack('<H', len(text)) + text)
+    data.append(struct.pack('<IddddiiiiHH', 7, 1.0, 2.0, 50.0, 60.0, 0, 1,
+                            -1, -1, 0, 1))
+    data.append(struct.pack('<Iiii', 3, 2, -1, -1))
+    with open(path, 'wb') as f:
+        f.write(b''.join(data))
+    model = graphSerializer.load(path)
+    node = model.node(7)
+    assert (node.name, node.nodeType, node.x, node.height) == \
+        ('a', 'T', 1.0, 60.0)
+    assert node.attrs is None
+    assert model.port(3).name == 'out'
+
+
+def testRejectsOtherFiles(tmpdir):
+    path = str(tmpdir.join('other.bin'))
+    with open(path, 'wb') as f:
+        f.write(b'not a graph at all, not a graph at all')
+    with pytest.raises(GraphFormatError):
+        graphSerializer.load(path)
+
+
+def testDumpAndLoadNodes():
+    model = buildModel()
+    nodeIds = [node.id for node in model.nodes()][1:3]
+    data = graphSerializer.dumpNodes(model, nodeIds)
+    target = GraphModel()
+    copies = graphSerializer.loadNodes(data, target, 500.0, 600.0)
+    assert [node.name for node in copies] == ['node_1', 'node_2']
+    assert min(node.x for node in copies) == 500.0
+    assert min(node.y for node in copies) == 600.0
+    assert copies[0].attrs == model.node(nodeIds[0]).attrs
+    # only the edge between the two copied nodes.
+    assert len(target.edges()) == 1
+    with pytest.raises(GraphFormatError):
+        graphSerializer.loadNodes(b'garbage', target)
+
+
+@pytest.mark.parametrize('fileName', ['graph.json', 'graph.bin'])
+def testLongStrings(tmpdir, fileName):
+    model = GraphModel()
+    node = model.addNode('n' * 70000, 'T')
+    node.attrs = {'text': u'é' * 40000}
+    path = str(tmpdir.join(fileName))
+    graphSerializer.save(model, path)
+    assert snapshot(graphSerializer.load(path)) == snapshot(model)
@@ -0,0 +1,175 @@
+import pytest
+
+from graphUndo import UndoCommand, UndoStack
+
+
+class SetValue(UndoCommand):
+    """
+    Sets a key of a dict, merges with the next SetValue of the same key.
+    """
+
+    def __init__(self, state, key, value, size=1):
+        super(SetValue, self).__init__('Set {}'.format(key))
+        self.state = state
+        self.key = key
+        self.old = state.get(key)
+        self.new = value
+        self.size = size
+
+    def redo(self):
+        self.state[self.key] = self.new
+
+    def undo(self):
+        self.state[self.key] = self.old
+
+    def id(self):
+        return 1
+
+    def mergeWith(self, other):
+        if other.key != self.key:
+            return False
+        self.new = other.new
+        self.size += other.size
+        return True
+
+    def cost(self):
+        return self.size
+
+
+class Append(UndoCommand):
+
+    def __init__(self, items, value, size=1):
+        super(Append, self).__init__('Append {}'.format(value))
+        self.items = items
+        self.value = value
+        self.size = size
+
+    def redo(self):
+        self.items.append(self.value)
+
+    def undo(self):
+        self.items.remove(self.value)
+
+    def cost(self):
+        return self.size
+
+
+def testPushUndoRedo():
+    items = []
+    stack = UndoStack()
+    stack.push(Append(items, 1))
+    stack.push(Append(items, 2))
+    assert items == [1, 2]
+    assert (stack.count(), stack.index()) == (2, 2)
+    stack.undo()
+    assert items == [1]
+    assert stack.redoText() == 'Append 2'
+    stack.redo()
+    assert items == [1, 2]
+    stack.undo()
+    stack.push(Append(items, 3))
+    assert items == [1, 3]
+    assert not stack.canRedo()
+    assert stack.count() == 2
+
+
+def testMergeSameId():
+    state = {}
+    stack = UndoStack()
+    stack.push(SetValue(state, 'x', 1))
+    stack.push(SetValue(state, 'x', 2))
+    stack.push(SetValue(state, 'x', 3))
+    assert state == {'x': 3}
+    assert stack.count() == 1
+    assert stack.totalCost() == 3
+    stack.undo()
+    assert state == {'x': None}
+    assert not stack.canUndo()
+
+    # another key does not merge and the clean state is never merged into.
+    stack.redo()
+    stack.push(SetValue(state, 'y', 1))
+    assert stack.count() == 2
+    stack.setClean()
+    stack.push(SetValue(state, 'y', 2))
+    assert stack.count() == 3
+    stack.undo()
+    assert stack.isClean()
+    assert state['y'] == 1
+
+
+def testUndoLimit():
+    items = []
+    stack = UndoStack(undoLimit=3, costLimit=0)
+    for value in range(5):
+        stack.push(Append(items, value))
+    assert stack.count() == 3
+    while stack.canUndo():
+        stack.undo()
+    assert items == [0, 1]
+
+
+def testCostLimit():
+    items = []
+    stack = UndoStack(undoLimit=0, costLimit=10)
+    for value in range(4):
+        stack.push(Append(items, value, size=4))
+    assert stack.count() == 2
+    assert stack.totalCost() == 8
+
+    # the last step is kept even over the limit.
+    stack.push(Append(items, 'big', size=50))
+    assert stack.count() == 1
+    assert stack.totalCost() == 50
+
+    stack.setUndoLimit(0, costLimit=0)
+    for value in range(3):
+        stack.push(Append(items, value + 10, size=50))
+    assert stack.count() == 4
+
+
+def testMergeRespectsCostLimit():
+    state = {}
+    stack = UndoStack(undoLimit=0, costLimit=5)
+    stack.push(Append([], 'a', size=3))
+    stack.push(SetValue(state, 'x', 1))
+    assert stack.count() == 2
+    stack.push(SetValue(state, 'x', 2))
+    stack.push(SetValue(state, 'x', 3))
+    assert stack.count() == 1
+    assert stack.totalCost() == 3
+
+
+def testMacro():
+    items = []
+    stack = UndoStack()
+    with stack.macro('Both'):
+        stack.push(Append(items, 1))
+        stack.push(Append(items, 2))
+        assert not stack.canUndo()
+    assert stack.count() == 1
+    assert stack.undoText() == 'Both'
+    stack.undo()
+    assert items == []
+    stack.redo()
+    assert items == [1, 2]
+
+
+def testMacroClosedOnError():
+    items = []
+    stack = UndoStack()
+    with pytest.raises(RuntimeError):
+        with stack.macro('Broken'):
+            stack.push(Append(items, 1))
+            raise RuntimeError('failed')
+    assert stack.canUndo()
+    assert stack.count() == 1
+    stack.undo()
+    assert items == []
+
+    # an empty macro adds no step.
+    with pytest.raises(RuntimeError):
+        with stack.macro('Empty'):
+            raise RuntimeError('failed')
+    assert stack.count() == 1
+    assert stack.canRedo()
@@ -0,0 +1,137 @@
+import random
+
+import pytest
+
+import pipeGeometry
+from pipeGeometry import PipeGeometry
+
+needsNumpy = pytest.mark.skipif(pipeGeometry.numpy is None,
+                                reason='numpy is not installed')
+MODES = [False, pytest.param(True, marks=needsNumpy)]
+
+
+def pipeCurve(x1, y1, x2, y2, portType, maxTangent):
+    # the control points pySideNodeGraph.pipePath() gives a pipe.
+    cp1, cp2 = x1, x2
+    tangent = min(abs(cp1 - cp2), maxTangent)
+    if portType == 'in':
+        cp1 -= tangent
+        cp2 += tangent
+    elif portType == 'out':
+        cp1 += tangent
+        cp2 -= tangent
+    return (x1, y1, cp1, cp2, x2, y2)
+
+
+def hull(curve):
+    x1, y1, cp1, cp2, x2, y2 = curve
+    xs = (x1, x2, cp1, cp2)
+    return min(xs), min(y1, y2), max(xs), max(y1, y2)
+
+
+def randomPipes(geometry, seed, count=200):
+    # {slot: expected curve}, some slots released and reused.
+    rng = random.Random(seed)
+    expected = {}
+    for _ in range(count):
+        if expected and rng.random() < 0.2:
+            slot = rng.choice(sorted(expected))
+            geometry.release(slot)
+            del expected[slot]
+            continue
+        slot = geometry.allocate()
+        x1, y1, x2, y2 = [rng.uniform(-500, 500) for _ in range(4)]
+        portType = rng.choice(('in', 'out'))
+        maxTangent = rng.choice((0.0, 25.0, 80.0, 400.0))
+        geometry.setEnds(slot, x1, y1, x2, y2,
+                         1.0 if portType == 'out' else -1.0, maxTangent)
+        expected[slot] = pipeCurve(x1, y1, x2, y2, portType, maxTangent)
+    return expected
+
+
+def assertCurve(actual, expected):
+    assert actual == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('useNumpy', MODES)
+@pytest.mark.parametrize('seed', range(3))
+def testCurvesMatchPipePath(useNumpy, seed):
+    geometry = PipeGeometry(capacity=4, useNumpy=useNumpy)
+    assert geometry.useNumpy == useNumpy
+    expected = randomPipes(geometry, seed)
+    updated = geometry.update()
+    assert set(expected) <= set(updated)
+    assert geometry.update() == []
+    assert len(geometry) == len(expected)
+    for slot, curve in expected.items():
+        assertCurve(geometry.curve(slot), curve)
+    curves = geometry.curves(0, geometry.size())
+    assert [row[0] for row in curves] == sorted(expected)
+    for row in curves:
+        assertCurve(row[1:], expected[row[0]])
+
+
+@pytest.mark.parametrize('useNumpy', MODES)
+def testMovedSlotsOnly(useNumpy):
+    geometry = PipeGeometry(useNumpy=useNumpy)
+    a, b = geometry.allocate(), geometry.allocate()
+    geometry.setEnds(a, 0, 0, 100, 50, 1.0, 30.0)
+    geometry.setEnds(b, 0, 0, 10, 0, -1.0, 30.0)
+    assert geometry.update() == [a, b]
+    geometry.setEnds(b, 200, 0, 0, 0, 1.0, 30.0)
+    assert geometry.update() == [b]
+    assertCurve(geometry.curve(a), pipeCurve(0, 0, 100, 50, 'out', 30.0))
+    assertCurve(geometry.curve(b), pipeCurve(200, 0, 0, 0, 'out', 30.0))
+
+    # a released slot is reused and never updated while free.
+    geometry.setEnds(a, 1, 1, 2, 2, 1.0, 1.0)
+    geometry.release(a)
+    assert geometry.update() == []
+    assert geometry.allocate() == a
+    assert geometry.curves(0, 10)[0][0] == a
+
+
+@pytest.mark.parametrize('useNumpy', MODES)
+def testBoundsAndCandidates(useNumpy):
+    geometry = PipeGeometry(useNumpy=useNumpy)
+    expected = randomPipes(geometry, 7, count=120)
+    geometry.update()
+    size = geometry.size()
+    hulls = dict((slot, hull(curve)) for slot, curve in expected.items())
+    for start, stop in ((0, size), (10, 40), (size - 5, size + 20)):
+        inside = [hulls[slot] for slot in hulls if start <= slot < stop]
+        bounds = geometry.bounds(start, stop)
+        if not inside:
+            assert bounds is None
+            continue
+        assert bounds == pytest.approx((min(h[0] for h in inside),
+                                        min(h[1] for h in inside),
+                                        max(h[2] for h in inside),
+                                        max(h[3] for h in inside)))
+    rng = random.Random(1)
+    for _ in range(50):
+        x, y = rng.uniform(-500, 500), rng.uniform(-500, 500)
+        found = geometry.candidates(0, size, x, y, 5.0)
+        assert found == sorted(
+            slot for slot, (x1, y1, x2, y2) in hulls.items()
+            if x1 - 5.0 <= x <= x2 + 5.0 and y1 - 5.0 <= y <= y2 + 5.0)
+    assert geometry.bounds(size, size + 10) is None
+    assert geometry.candidates(size, size + 10, 0, 0, 5.0) == []
+
+
+@needsNumpy
+def testNumpyMatchesPython():
+    results = []
+    for useNumpy in (False, True):
+        geometry = PipeGeometry(capacity=8, useNumpy=useNumpy)
+        randomPipes(geometry, 11, count=300)
+        geometry.update()
+        size = geometry.size()
+        results.append((geometry.curves(0, size), geometry.bounds(0, size),
+                        geometry.candidates(0, size, 0.0, 0.0, 20.0)))
+    python, vectorized = results
+    assert [row[0] for row in python[0]] == [row[0] for row in vectorized[0]]
+    for rowA, rowB in zip(python[0], vectorized[0]):
+        assert rowA == pytest.approx(rowB)
+    assert python[1] == pytest.approx(vectorized[1])
+    assert python[2] == vectorized[2]